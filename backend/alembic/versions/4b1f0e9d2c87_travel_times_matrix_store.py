@@ -0,0 +1,40 @@
+"""travel_times matrix store
+
+Revision ID: 4b1f0e9d2c87
+Revises: c755abe2a557
+Create Date: 2026-10-17 12:05:18.274610
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b1f0e9d2c87'
+down_revision: Union[str, None] = 'c755abe2a557'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # старая таблица (без слотов времени) полностью пересчитывается geo_update — удаляем
+    if sa.inspect(op.get_bind()).has_table('travel_times'):
+        op.drop_table('travel_times')
+    op.create_table('travel_times',
+    sa.Column('from_id', sa.Integer(), nullable=False),
+    sa.Column('to_id', sa.Integer(), nullable=False),
+    sa.Column('time_bucket', sa.SmallInteger(), nullable=False),
+    sa.Column('travel_sec', sa.Integer(), nullable=False),
+    sa.Column('fetched_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['from_id'], ['nodes.node_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['to_id'], ['nodes.node_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('from_id', 'to_id', 'time_bucket')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('travel_times')
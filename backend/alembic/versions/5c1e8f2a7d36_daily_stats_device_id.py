@@ -0,0 +1,31 @@
+"""daily stats device_id
+
+Revision ID: 5c1e8f2a7d36
+Revises: 9e3d7a51f0b4
+Create Date: 2026-10-17 15:02:11.482907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e8f2a7d36'
+down_revision: Union[str, None] = '9e3d7a51f0b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # статистика по устройствам; у старых записей (одна машина) остаётся NULL
+    op.add_column('daily_zone_statistics', sa.Column('device_id', sa.BigInteger(), nullable=True))
+    op.create_index('ix_daily_zone_statistics_day_device', 'daily_zone_statistics', ['stats_datetime', 'device_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_daily_zone_statistics_day_device', table_name='daily_zone_statistics')
+    op.drop_column('daily_zone_statistics', 'device_id')
@@ -0,0 +1,35 @@
+"""task tombstones
+
+Revision ID: 7a4c2e9b1d05
+Revises: e2b7c94d1a58
+Create Date: 2026-10-17 18:12:44.530117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a4c2e9b1d05'
+down_revision: Union[str, None] = 'e2b7c94d1a58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # удалённые задачи для дельта-синхронизации GET /tasks/changes
+    op.create_table('task_tombstones',
+    sa.Column('task_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('task_id')
+    )
+    op.create_index(op.f('ix_task_tombstones_deleted_at'), 'task_tombstones', ['deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_task_tombstones_deleted_at'), table_name='task_tombstones')
+    op.drop_table('task_tombstones')
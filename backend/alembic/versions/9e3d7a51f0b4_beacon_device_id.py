@@ -0,0 +1,35 @@
+"""beacon device_id
+
+Revision ID: 9e3d7a51f0b4
+Revises: 4b1f0e9d2c87
+Create Date: 2026-10-17 13:21:44.918305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e3d7a51f0b4'
+down_revision: Union[str, None] = '4b1f0e9d2c87'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # устройство StarLine; у старых записей (одна машина) остаётся NULL
+    op.add_column('beacon_coordinates', sa.Column('device_id', sa.BigInteger(), nullable=True))
+    op.create_index('ix_beacon_coordinates_device_recorded', 'beacon_coordinates', ['device_id', 'recorded_at'], unique=False)
+    op.add_column('geozone_session', sa.Column('device_id', sa.BigInteger(), nullable=True))
+    op.create_index('ix_geozone_session_device_zone_status', 'geozone_session', ['device_id', 'zone_id', 'status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_geozone_session_device_zone_status', table_name='geozone_session')
+    op.drop_column('geozone_session', 'device_id')
+    op.drop_index('ix_beacon_coordinates_device_recorded', table_name='beacon_coordinates')
+    op.drop_column('beacon_coordinates', 'device_id')
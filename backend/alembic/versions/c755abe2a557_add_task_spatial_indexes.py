@@ -0,0 +1,32 @@
+"""add task spatial indexes
+
+Revision ID: c755abe2a557
+Revises: a3575e259c21
+Create Date: 2026-10-17 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c755abe2a557'
+down_revision: Union[str, None] = 'a3575e259c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # bbox-префильтр задач по координатам
+    op.create_index('ix_tasks_lat_lng', 'tasks', ['lat', 'lng'], unique=False)
+    # инкрементальное обновление индекса задач по updated_at
+    op.create_index(op.f('ix_tasks_updated_at'), 'tasks', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_tasks_updated_at'), table_name='tasks')
+    op.drop_index('ix_tasks_lat_lng', table_name='tasks')
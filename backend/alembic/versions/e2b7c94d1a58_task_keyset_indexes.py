@@ -0,0 +1,33 @@
+"""task keyset indexes
+
+Revision ID: e2b7c94d1a58
+Revises: 5c1e8f2a7d36
+Create Date: 2026-10-17 16:40:27.105264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7c94d1a58'
+down_revision: Union[str, None] = '5c1e8f2a7d36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # keyset-пагинация GET /tasks по (planned_start, task_id) и фильтры
+    op.create_index('ix_tasks_planned_start_id', 'tasks', ['planned_start', 'task_id'], unique=False)
+    op.create_index('ix_tasks_status_planned_start_id', 'tasks', ['status', 'planned_start', 'task_id'], unique=False)
+    op.create_index('ix_task_executors_exec_task', 'task_executors', ['exec_id', 'task_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_task_executors_exec_task', table_name='task_executors')
+    op.drop_index('ix_tasks_status_planned_start_id', table_name='tasks')
+    op.drop_index('ix_tasks_planned_start_id', table_name='tasks')
@@ -0,0 +1,126 @@
+# analytics.daily_stats_runner
+"""
+Пересчёт daily_zone_statistics за диапазон дат, по устройствам, параллельно.
+
+Каждая пара (день, устройство) — отдельное задание пула процессов;
+у процесса-воркера своя сессия БД на всё время работы. Строки дня
+пишутся одним INSERT, предыдущие строки этого дня и устройства
+удаляются в той же транзакции — повторный запуск идемпотентен.
+
+Запуск (из каталога backend):
+    python -m analytics.daily_stats_runner --from 2025-05-01 --to 2025-07-31 [--device 123] [--workers 4]
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal, engine
+from app.models import BeaconCoordinate
+
+from analytics.analytics_simple import day_bounds, run_day
+
+log = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("DAILY_STATS_WORKERS", str(os.cpu_count() or 2)))
+
+# сессия БД процесса-воркера (создаётся в _init_worker)
+_worker_db: Optional[Session] = None
+
+
+def _init_worker() -> None:
+    global _worker_db
+    logging.basicConfig(format='%(message)s', level=logging.WARNING)
+    # соединения пула, унаследованные от родителя, не переиспользуем
+    engine.dispose(close=False)
+    _worker_db = SessionLocal()
+
+
+def _run_job(target_date: date, device_id: Optional[int]) -> tuple[date, Optional[int], int, float]:
+    started = time.monotonic()
+    try:
+        written = run_day(_worker_db, target_date, device_id)
+    except Exception:
+        _worker_db.rollback()
+        raise
+    return target_date, device_id, written, time.monotonic() - started
+
+
+def days_between(first: date, last: date) -> list[date]:
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def devices_in_range(db: Session, first: date, last: date) -> list[Optional[int]]:
+    """Устройства с точками в окнах анализа дней [first, last]."""
+    start, _ = day_bounds(first)
+    _, end = day_bounds(last)
+    rows = (
+        db.query(BeaconCoordinate.device_id)
+          .filter(BeaconCoordinate.recorded_at >= start,
+                  BeaconCoordinate.recorded_at < end)
+          .distinct()
+    )
+    return [device_id for (device_id,) in rows]
+
+
+def run_range(first: date, last: date, device_ids: Optional[Iterable[Optional[int]]] = None,
+              workers: int = WORKERS) -> dict[tuple[date, Optional[int]], int]:
+    """
+    Пересчитывает все дни [first, last] для устройств device_ids (по умолчанию —
+    все, у кого есть точки; None в списке — точки без устройства). Возвращает {(день, устройство): число строк};
+    упавшие задания логируются и в результат не попадают.
+    """
+    if device_ids is None:
+        db: Session = SessionLocal()
+        try:
+            device_ids = devices_in_range(db, first, last)
+        finally:
+            db.close()
+    jobs = [(day, device_id) for day in days_between(first, last) for device_id in device_ids]
+    log.info(f"Пересчёт статистики: {len(jobs)} заданий, {workers} процессов")
+
+    results: dict[tuple[date, Optional[int]], int] = {}
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_worker) as pool:
+        futures = {pool.submit(_run_job, day, device_id): (day, device_id) for day, device_id in jobs}
+        for future in as_completed(futures):
+            day, device_id = futures[future]
+            try:
+                _, _, written, seconds = future.result()
+            except Exception as err:
+                log.error(f"❌ {day} устройство {device_id}: {err}")
+                continue
+            results[(day, device_id)] = written
+            log.info(f"✅ {day} устройство {device_id}: {written} строк за {seconds:.1f} с")
+
+    log.info(f"Готово: {len(results)}/{len(jobs)} заданий за {time.monotonic() - started:.1f} с")
+    return results
+
+
+def get_args(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Пересчёт daily_zone_statistics за диапазон дат")
+    parser.add_argument("--from", dest="first", type=date.fromisoformat, required=True,
+                        help="первый день, YYYY-MM-DD")
+    parser.add_argument("--to", dest="last", type=date.fromisoformat, required=True,
+                        help="последний день включительно, YYYY-MM-DD")
+    parser.add_argument("--device", type=int, action="append",
+                        help="device_id (можно несколько); по умолчанию — все устройства периода")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="число процессов")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+    args = get_args(argv)
+    if args.last < args.first:
+        raise SystemExit("--to раньше --from")
+    run_range(args.first, args.last, args.device, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
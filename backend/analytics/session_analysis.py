@@ -4,7 +4,8 @@ from datetime import timedelta
 import logging
 
 from sqlalchemy.orm import Session
-from analytics.task_filter import haversine
+from app.geodesy import distance_matrix, points_to_arrays
+from app.stop_detector import collect_stops, ANCHOR_LAST
 from app.models import BeaconCoordinate, Task, GeofenceRule
 
 log = logging.getLogger(__name__)
@@ -21,66 +22,15 @@ def detect_stops_inline(
     Возвращает список словарей {start, end, duration, center}.
     Параметры cluster_radius и min_points можно настраивать.
     """
-    stops = []
-    current = {'coords': [], 'start': None}
-
-    # Проходим по координатам
-    for coord in coords_segment:
-        t = coord.recorded_at
-        if not current['coords']:
-            current = {'coords': [coord], 'start': t}
-        else:
-            # Логирование времени между точками
-           # log.debug(f"Checking coords {current['coords'][-1].recorded_at} → {t}")
-
-            # Если координаты такие же, что и в предыдущий раз
-            if current['coords'][-1].latitude == coord.latitude and current['coords'][-1].longitude == coord.longitude:
-                # Проверяем, попадают ли записи в окно времени
-                if (t - current['coords'][-1].recorded_at) <= time_window:
-                    current['coords'].append(coord)
-                else:
-                    # Останавливаем кластер, если интервалы слишком большие
-                    if len(current['coords']) >= min_points:
-                        end = current['coords'][-1].recorded_at
-                        duration = (end - current['start']).total_seconds() / 60
-                        lat_c = sum(c.latitude for c in current['coords']) / len(current['coords'])
-                        lon_c = sum(c.longitude for c in current['coords']) / len(current['coords'])
-                        stops.append({
-                            'start': current['start'],
-                            'end': end,
-                            'duration': duration,
-                            'center': (lat_c, lon_c)
-                        })
-                    current = {'coords': [coord], 'start': t}
-            else:
-                # Когда координаты меняются, проверяем предыдущий кластер
-                if len(current['coords']) >= min_points:
-                    end = current['coords'][-1].recorded_at
-                    duration = (end - current['start']).total_seconds() / 60
-                    lat_c = sum(c.latitude for c in current['coords']) / len(current['coords'])
-                    lon_c = sum(c.longitude for c in current['coords']) / len(current['coords'])
-                    stops.append({
-                        'start': current['start'],
-                        'end': end,
-                        'duration': duration,
-                        'center': (lat_c, lon_c)
-                    })
-                current = {'coords': [coord], 'start': t}
-
-    # Завершаем последний кластер
-    if current['coords'] and len(current['coords']) >= min_points:
-        end = current['coords'][-1].recorded_at
-        duration = (end - current['start']).total_seconds() / 60
-        lat_c = sum(c.latitude for c in current['coords']) / len(current['coords'])
-        lon_c = sum(c.longitude for c in current['coords']) / len(current['coords'])
-        stops.append({
-            'start': current['start'],
-            'end': end,
-            'duration': duration,
-            'center': (lat_c, lon_c)
-        })
-
-    return stops
+    # Цепочка одинаковых координат (радиус 0 от предыдущей точки),
+    # разрыв по времени больше time_window закрывает кластер
+    return collect_stops(
+        coords_segment,
+        radius_m=0.0,
+        min_points=min_points,
+        anchor=ANCHOR_LAST,
+        max_gap=time_window,
+    )
 
 
 
@@ -113,17 +63,24 @@ def compute_task_and_idle_times_with_rules(
     total_task = 0   # минуты «работы»
     total_idle = 0   # минуты «простоя»
 
+    # Матрица расстояний «центр остановки × задача» одним проходом
+    stop_to_task = distance_matrix(
+        [s['center'][0] for s in stops],
+        [s['center'][1] for s in stops],
+        *points_to_arrays(tasks, "lat", "lng"),
+    )
+
     # 3. Для каждой остановки ищем лучшую пару (task, rule)
-    for s in stops:
+    for i, s in enumerate(stops):
         center_lat, center_lng = s['center']
         duration_min = s['duration']
 
         best_score = 0.0     # максимальный raw-score
         best_percent = 0.0   # нормированный % (0–100)
 
-        for task in tasks:
+        for j, task in enumerate(tasks):
+            dist_m = stop_to_task[i, j]
             for rule in rules:
-                dist_m = haversine(center_lat, center_lng, task.lat, task.lng)
                 if dist_m > rule.radius_m:
                     continue
 
@@ -1,6 +1,8 @@
+import argparse
 import logging
 from datetime import date, timedelta
 from decimal import Decimal
+from typing import Iterable, Optional
 
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_
@@ -22,16 +24,26 @@ def minutes_to_hours(value) -> float:
         return 0.0
     return round(float(value) / 60.0, 1)
 
-def main() -> None:
+def get_args(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Сводка daily_zone_statistics по дням")
+    parser.add_argument("--from", dest="first", type=date.fromisoformat, default=DATE_FROM,
+                        help="первый день, YYYY-MM-DD")
+    parser.add_argument("--to", dest="last", type=date.fromisoformat, default=DATE_TO,
+                        help="последний день включительно, YYYY-MM-DD")
+    parser.add_argument("--device", type=int, help="только это устройство")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    args = get_args(argv)
     db: Session = SessionLocal()
     try:
-        cur = DATE_FROM
+        cur = args.first
         one_day = timedelta(days=1)
 
-        while cur <= DATE_TO:
+        while cur <= args.last:
             next_day = cur + one_day
 
-            day_start, day_end, work_m, stop_m, travel_m = (
+            q = (
                 db.query(
                     func.min(DailyZoneStatistics.start_time),
                     func.max(DailyZoneStatistics.end_time),
@@ -45,8 +57,10 @@ def main() -> None:
                         DailyZoneStatistics.stats_datetime <  next_day,
                     )
                 )
-                .one()
             )
+            if args.device is not None:
+                q = q.filter(DailyZoneStatistics.device_id == args.device)
+            day_start, day_end, work_m, stop_m, travel_m = q.one()
 
             if day_start is None:
                 log.info(f"{cur} — данных нет")
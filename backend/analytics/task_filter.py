@@ -3,24 +3,12 @@ from datetime import date
 from typing import List, Optional
 
 from app.models import Task, GeoZone
-import math
+from app.geodesy import distances_to_point, points_to_arrays
 
 # Constants for zone and task proximity (метры)
 # Можем вынести в константы, если потребуется
 
 
-def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """
-    Вычисляет расстояние между двумя точками по Haversine (в метрах).
-    """
-    R = 6371000.0
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-
 def filter_tasks_for_zone(
     tasks: List[Task],
     zone: GeoZone,
@@ -39,7 +27,13 @@ def filter_tasks_for_zone(
     """
     filtered: List[Task] = []
 
-    for t in tasks:
+    # 3) расстояния до центра зоны — одним векторным проходом
+    distances = distances_to_point(
+        *points_to_arrays(tasks, "lat", "lng"),
+        zone.center_lat, zone.center_lon
+    )
+
+    for t, distance in zip(tasks, distances):
         # 1) создана до или в день target_date
         if t.created_at.date() > target_date:
             continue
@@ -49,10 +43,6 @@ def filter_tasks_for_zone(
             continue
 
         # 3) попадает в зону по географии
-        distance = haversine(
-            t.lat, t.lng,
-            zone.center_lat, zone.center_lon
-        )
         if distance <= zone.radius_m:
             filtered.append(t)
 
@@ -1,5 +1,4 @@
 # app/analytics.py
-import math
 import logging
 import json
 from datetime import date, datetime, timedelta, timezone
@@ -12,7 +11,8 @@ import app.crud as crud
 import app.schemas as schemas
 from app.visit_analysis import analyze_session
 from app.detect_stops import detect_stops
-from app.telegram_bot import send_to_telegram
+from app.telegram_outbox import notify
+from app.spatial_index import ZoneIndex
 
 # ——————————————————————————————————————————————————————————————
 # Логирование
@@ -34,20 +34,8 @@ def format_dt_to_irkutsk(dt: datetime) -> str:
     return dt.astimezone(IRKUTSK).strftime('%Y-%m-%d %H:%M:%S')
 
 # ——————————————————————————————————————————————————————————————
-def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    R = 6371000.0
-    φ1, φ2 = math.radians(lat1), math.radians(lat2)
-    dφ = math.radians(lat2 - lat1)
-    dλ = math.radians(lon2 - lon1)
-    a = math.sin(dφ/2)**2 + math.cos(φ1) * math.cos(φ2) * math.sin(dλ/2)**2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-# ——————————————————————————————————————————————————————————————
-def find_zone(pt, zone_defs):
-    for zid, zname, cz_lat, cz_lon, cz_r, ztype in zone_defs:
-        if haversine(pt.latitude, pt.longitude, cz_lat, cz_lon) <= cz_r:
-            return zid, zname, cz_lat, cz_lon, cz_r, ztype
-    return None
+def find_zone(pt, zone_index: ZoneIndex):
+    return zone_index.find_point(pt)
 
 # ——————————————————————————————————————————————————————————————
 def main():
@@ -73,13 +61,13 @@ def main():
             return
 
         zones = db.query(GeoZone).all()
-        zone_defs = [(z.zone_id, z.name, z.center_lat, z.center_lon, z.radius_m, z.type) for z in zones]
-        logger.info(f"Loaded {len(zone_defs)} geozones")
+        zone_index = ZoneIndex.from_zones(zones)
+        logger.info(f"Loaded {len(zone_index)} geozones")
 
         # Начальное состояние
         first_pt = coords[0]
         first_time = first_pt.recorded_at
-        current_zone = find_zone(first_pt, zone_defs)
+        current_zone = find_zone(first_pt, zone_index)
         state = 'zone' if current_zone else 'travel'
         travel_start_idx = travel_start_time = None
         zone_session_id = None
@@ -107,18 +95,18 @@ def main():
                 except Exception as err:
                     db.rollback()
                     logger.error("Ошибка при открытии первой сессии %s: %s", zid, err, exc_info=True)
-            send_to_telegram(f"🚗 Въезд в зону «{zname}» в {format_dt_to_irkutsk(first_time)}")
+            notify(f"🚗 Въезд в зону «{zname}» в {format_dt_to_irkutsk(first_time)}")
         else:
             travel_start_idx = 0
             travel_start_time = first_time
-            send_to_telegram(f"🚗 Начало движения в {format_dt_to_irkutsk(first_time)}")
+            notify(f"🚗 Начало движения в {format_dt_to_irkutsk(first_time)}")
 
         # Основной цикл
         n = len(coords)
         for i in range(1, n):
             pt = coords[i]
             t_utc = pt.recorded_at
-            current = find_zone(pt, zone_defs)
+            current = find_zone(pt, zone_index)
 
             if state == 'zone' and current is None:
                 exit_time = t_utc
@@ -137,7 +125,7 @@ def main():
                 state = 'travel'
                 travel_start_idx = i
                 travel_start_time = exit_time
-                send_to_telegram(f"🚗 Автомобиль выехал из зоны в {format_dt_to_irkutsk(exit_time)}")
+                notify(f"🚗 Автомобиль выехал из зоны в {format_dt_to_irkutsk(exit_time)}")
 
             elif state == 'travel' and current:
                 segment = coords[travel_start_idx:i+1]
@@ -164,7 +152,7 @@ def main():
                     except Exception as err:
                         db.rollback()
                         logger.error("Ошибка при открытии сессии в зоне %s: %s", zname, err, exc_info=True)
-                send_to_telegram(f"🚗 Въезд в зону «{zname}» в {format_dt_to_irkutsk(t_utc)}")
+                notify(f"🚗 Въезд в зону «{zname}» в {format_dt_to_irkutsk(t_utc)}")
                 state = 'zone'
 
         # Закрытие последней сессии
@@ -179,7 +167,7 @@ def main():
                     exit_lon=last_pt.longitude
                 )
                 analyze_session(db, zone_session_id)
-                send_to_telegram(f"🚗 Выезд из зоны в {format_dt_to_irkutsk(last_time)}")
+                notify(f"🚗 Выезд из зоны в {format_dt_to_irkutsk(last_time)}")
             except Exception as err:
                 db.rollback()
                 logger.error("Ошибка при финальном закрытии сессии %s: %s", zone_session_id, err, exc_info=True)
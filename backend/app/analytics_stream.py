@@ -1,7 +1,10 @@
 # app/analytics_stream.py
 
+import json
 import logging
-from datetime import timezone
+import os
+import threading
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 from sqlalchemy.orm import Session
 
@@ -10,9 +13,10 @@ from app.models import BeaconCoordinate, GeoZone, GeozoneSession
 import app.crud as crud
 import app.schemas as schemas
 from app.visit_analysis import analyze_session
-from app.detect_stops import detect_stops
-from app.telegram_bot import send_to_telegram
-from app.analytics import haversine, format_dt_to_irkutsk
+from app.detect_stops import new_stop_detector, report_closed_stops
+from app.telegram_outbox import notify
+from app.analytics import format_dt_to_irkutsk
+from app.spatial_index import ZoneIndex
 
 # ——————————————————————————————————————————————————————————————
 logging.basicConfig(
@@ -22,20 +26,53 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Снимок состояния RealTimeProcessor — переживает перезапуск сервиса
+RT_STATE_PATH = os.getenv(
+    "RT_STATE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rt_state.json"),
+)
+RT_STATE_VERSION = 1
+# Снимок старше последней точки устройства в БД больше чем на столько
+# считается устаревшим (простой сервиса): состояние берётся из БД
+RT_STATE_MAX_GAP = timedelta(minutes=int(os.getenv("RT_STATE_MAX_GAP_MIN", "30")))
+
+def state_path_for(device_id: int | None) -> str:
+    """Свой файл снимка на каждое устройство: rt_state.json → rt_state.<device_id>.json"""
+    if device_id is None:
+        return RT_STATE_PATH
+    root, ext = os.path.splitext(RT_STATE_PATH)
+    return f"{root}.{device_id}{ext}"
+
+
 class RealTimeProcessor:
-    """Класс для обработки координат маяка в режиме реального времени"""
-    def __init__(self):
+    """Класс для обработки координат маяка (одного устройства) в режиме реального времени"""
+    def __init__(self, device_id: int | None = None, name: str | None = None):
+        self.device_id = device_id
+        self.name = name
         # Инициализируем БД и загружаем все зоны
         self.db: Session = SessionLocal()
         zones = self.db.query(GeoZone).all()
-        self.zone_defs = [
-            (z.zone_id, z.name, z.center_lat, z.center_lon, z.radius_m, z.type)
-            for z in zones
-        ]
+        self.zone_index = ZoneIndex.from_zones(zones)
+        self.zone_defs = self.zone_index.zone_defs
+
+        # Восстанавливаем состояние (без уведомлений!): сначала из снимка,
+        # и только если его нет — по последней точке в БД
+        self.state_path = state_path_for(device_id)
+        self.zone_type = None
+        source = "снимок"
+        if not self._load_state():
+            source = "БД"
+            self._restore_from_db()
 
-        # Восстанавливаем состояние (без уведомлений!)
+        logger.info(f"[RT {device_id}] состояние восстановлено ({source}): {self.state}")
+
+    # ——— Снимок состояния ——————————————————————————————————————————————
+
+    def _restore_from_db(self):
+        """Прежний способ: зона последней точки + открытая сессия этой зоны."""
         last = (
             self.db.query(BeaconCoordinate)
+                   .filter(BeaconCoordinate.device_id == self.device_id)
                    .order_by(BeaconCoordinate.recorded_at.desc())
                    .first()
         )
@@ -47,136 +84,212 @@ class RealTimeProcessor:
                 self.zone_id, _, _, _, _, self.zone_type = found
                 sess = (
                     self.db.query(GeozoneSession)
-                           .filter_by(zone_id=self.zone_id, status='open')
+                           .filter_by(zone_id=self.zone_id, device_id=self.device_id, status='open')
                            .order_by(GeozoneSession.entry_time.desc())
                            .first()
                 )
                 self.zone_session_id = sess.session_id if sess else None
-                self.buffer = []
+                self.stops = new_stop_detector()
             else:
                 # в движении
                 self.state = 'travel'
                 self.zone_id = None
                 self.zone_session_id = None
-                self.buffer = [last]
+                self.stops = new_stop_detector()
+                self.stops.push(last)
         else:
             # нет данных, считаем в движении
             self.state = 'travel'
             self.zone_id = None
             self.zone_session_id = None
-            self.buffer = []
+            self.stops = new_stop_detector()
+
+    def _load_state(self) -> bool:
+        """
+        Читает снимок состояния. False — если снимка нет, он битый,
+        ссылается на зону, которой больше нет, на сессию, которой нет или
+        которая уже закрыта (например, её пересчитал replay), или отстаёт
+        от последней точки устройства в БД больше чем на RT_STATE_MAX_GAP.
+        """
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                snap = json.load(f)
+            if snap.get("version") != RT_STATE_VERSION:
+                return False
+            state = snap["state"]
+            zone_id = snap.get("zone_id")
+            if state == 'zone' and not any(z[0] == zone_id for z in self.zone_defs):
+                return False
+            stops = new_stop_detector()
+            stops.load_state(snap.get("stops") or {})
+            snap_at = datetime.fromisoformat(snap["recorded_at"])
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            logger.warning("[RT] снимок состояния %s не прочитан: %s", self.state_path, err)
+            return False
+
+        latest = crud.get_latest_beacon_coordinate(self.db, self.device_id)
+        if latest is not None and latest.recorded_at - snap_at > RT_STATE_MAX_GAP:
+            logger.info("[RT %s] снимок от %s устарел (последняя точка %s)",
+                        self.device_id, snap_at, latest.recorded_at)
+            return False
 
-        logger.info(f"[RT] состояние восстановлено: {self.state}")
+        session_id = snap.get("zone_session_id")
+        if session_id is not None:
+            sess = self.db.get(GeozoneSession, session_id)
+            if sess is None or sess.status != 'open' or sess.device_id != self.device_id:
+                logger.info("[RT %s] сессия %s из снимка не открыта в БД", self.device_id, session_id)
+                return False
+
+        self.state = state
+        self.zone_id = zone_id
+        self.zone_type = snap.get("zone_type")
+        self.zone_session_id = session_id
+        self.stops = stops
+        return True
+
+    def _save_state(self, pt: BeaconCoordinate) -> None:
+        """
+        Атомарно записывает снимок после обработанной точки
+        (временный файл + os.replace — при сбое остаётся прежний снимок).
+        """
+        snap = {
+            "version": RT_STATE_VERSION,
+            "state": self.state,
+            "zone_id": self.zone_id,
+            "zone_type": self.zone_type,
+            "zone_session_id": self.zone_session_id,
+            "stops": self.stops.dump_state(),
+            "recorded_at": pt.recorded_at.isoformat(),
+        }
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snap, f, ensure_ascii=False)
+            os.replace(tmp_path, self.state_path)
+        except OSError as err:
+            logger.warning("[RT] не удалось сохранить снимок состояния: %s", err)
+
+    # ——— Обработка точек ———————————————————————————————————————————————
+
+    def _notify(self, message: str) -> None:
+        """Уведомление с именем машины, если устройств несколько."""
+        notify(f"[{self.name}] {message}" if self.name else message)
 
     def _find_zone(self, pt: BeaconCoordinate):
-        for zid, zname, cz_lat, cz_lon, cz_r, ztype in self.zone_defs:
-            if haversine(pt.latitude, pt.longitude, cz_lat, cz_lon) <= cz_r:
-                return zid, zname, cz_lat, cz_lon, cz_r, ztype
-        return None
+        return self.zone_index.find_point(pt)
 
-    def process(self, pt: BeaconCoordinate):
-        """Основной метод обработки точек координат"""
+    def _transition(self, pt: BeaconCoordinate):
+        """Переходы состояний по очередной точке (без обработки ошибок)."""
         t = pt.recorded_at
         current = self._find_zone(pt)
 
-        try:
-            # 1) zone → другая zone (сразу перескок между геозонами)
-            if self.state == 'zone' and current and current[0] != self.zone_id:
-                new_zid, new_zname, *_ , new_ztype = current
-
-                # Закрываем предыдущую сессию
-                if self.zone_type == 'territory':
-                    crud.close_geozone_session(
-                        self.db,
-                        session_id=self.zone_session_id,
-                        exit_time=t,
-                        exit_lat=pt.latitude,
-                        exit_lon=pt.longitude
-                    )
-                    analyze_session(self.db, self.zone_session_id)
-                send_to_telegram(
-                    f"🚗 Автомобиль выехал из зоны «{self.zone_id}» в {format_dt_to_irkutsk(t)}"
+        # 1) zone → другая zone (сразу перескок между геозонами)
+        if self.state == 'zone' and current and current[0] != self.zone_id:
+            new_zid, new_zname, *_ , new_ztype = current
+
+            # Закрываем предыдущую сессию
+            if self.zone_type == 'territory':
+                crud.close_geozone_session(
+                    self.db,
+                    session_id=self.zone_session_id,
+                    exit_time=t,
+                    exit_lat=pt.latitude,
+                    exit_lon=pt.longitude
                 )
+                analyze_session(self.db, self.zone_session_id)
+            self._notify(
+                f"🚗 Автомобиль выехал из зоны «{self.zone_id}» в {format_dt_to_irkutsk(t)}"
+            )
 
-                # Открываем новую сессию
-                self.zone_type = new_ztype
-                self.zone_id   = new_zid
-                if new_ztype == 'territory':
-                    sess = crud.create_geozone_session(
-                        self.db,
-                        schemas.GeozoneSessionCreate(
-                            zone_id=new_zid,
-                            entry_time=t,
-                            exit_time=None,
-                            entry_lat=pt.latitude,
-                            entry_lon=pt.longitude,
-                            exit_lat=None,
-                            exit_lon=None,
-                            status="open"
-                        )
+            # Открываем новую сессию
+            self.zone_type = new_ztype
+            self.zone_id   = new_zid
+            if new_ztype == 'territory':
+                sess = crud.create_geozone_session(
+                    self.db,
+                    schemas.GeozoneSessionCreate(
+                        zone_id=new_zid,
+                        device_id=self.device_id,
+                        entry_time=t,
+                        exit_time=None,
+                        entry_lat=pt.latitude,
+                        entry_lon=pt.longitude,
+                        exit_lat=None,
+                        exit_lon=None,
+                        status="open"
                     )
-                    self.zone_session_id = sess.session_id
-                send_to_telegram(
-                    f"🚗 Въезд в зону «{new_zname}» в {format_dt_to_irkutsk(t)}"
                 )
+                self.zone_session_id = sess.session_id
+            self._notify(
+                f"🚗 Въезд в зону «{new_zname}» в {format_dt_to_irkutsk(t)}"
+            )
 
-                # Сохраняем состояние
-                self.state  = 'zone'
-                self.buffer = []
-                return
-
-            # 2) zone → travel (выезд из зоны в движение)
-            if self.state == 'zone' and current is None:
-                if self.zone_type == 'territory':
-                    crud.close_geozone_session(
-                        self.db,
-                        session_id=self.zone_session_id,
-                        exit_time=t,
-                        exit_lat=pt.latitude,
-                        exit_lon=pt.longitude
-                    )
-                    analyze_session(self.db, self.zone_session_id)
-                send_to_telegram(f"🚗 Автомобиль выехал из зоны в {format_dt_to_irkutsk(t)}")
-                self.state = 'travel'
-                self.zone_id = None
-                self.buffer = [pt]
-                return
-
-            # 3) travel → zone (въезд в зону из движения)
-            if self.state == 'travel' and current:
-                if self.buffer:
-                    detect_stops(self.buffer + [pt])
-                zid, zname, *_ , ztype = current
-                self.zone_type = ztype
-                self.zone_id   = zid
-                if ztype == 'territory':
-                    sess = crud.create_geozone_session(
-                        self.db,
-                        schemas.GeozoneSessionCreate(
-                            zone_id=zid,
-                            entry_time=t,
-                            exit_time=None,
-                            entry_lat=pt.latitude,
-                            entry_lon=pt.longitude,
-                            exit_lat=None,
-                            exit_lon=None,
-                            status="open"
-                        )
+            # Сохраняем состояние
+            self.state  = 'zone'
+            return
+
+        # 2) zone → travel (выезд из зоны в движение)
+        if self.state == 'zone' and current is None:
+            if self.zone_type == 'territory':
+                crud.close_geozone_session(
+                    self.db,
+                    session_id=self.zone_session_id,
+                    exit_time=t,
+                    exit_lat=pt.latitude,
+                    exit_lon=pt.longitude
+                )
+                analyze_session(self.db, self.zone_session_id)
+            self._notify(f"🚗 Автомобиль выехал из зоны в {format_dt_to_irkutsk(t)}")
+            self.state = 'travel'
+            self.zone_id = None
+            # путь начинается с точки выезда
+            self.stops = new_stop_detector()
+            self.stops.push(pt)
+            return
+
+        # 3) travel → zone (въезд в зону из движения)
+        if self.state == 'travel' and current:
+            # закрываем последний кластер пути (точка въезда — его граница)
+            report_closed_stops(self.stops.push(pt) + self.stops.flush(), car=self.name)
+            zid, zname, *_ , ztype = current
+            self.zone_type = ztype
+            self.zone_id   = zid
+            if ztype == 'territory':
+                sess = crud.create_geozone_session(
+                    self.db,
+                    schemas.GeozoneSessionCreate(
+                        zone_id=zid,
+                        device_id=self.device_id,
+                        entry_time=t,
+                        exit_time=None,
+                        entry_lat=pt.latitude,
+                        entry_lon=pt.longitude,
+                        exit_lat=None,
+                        exit_lon=None,
+                        status="open"
                     )
-                    self.zone_session_id = sess.session_id
-                send_to_telegram(f"🚗 Въезд в зону «{zname}» в {format_dt_to_irkutsk(t)}")
-                self.state = 'zone'
-                self.buffer = []
-                return
+                )
+                self.zone_session_id = sess.session_id
+            self._notify(f"🚗 Въезд в зону «{zname}» в {format_dt_to_irkutsk(t)}")
+            self.state = 'zone'
+            return
 
-            # 4) travel → travel (продолжаем движение)
-            if self.state == 'travel' and current is None:
-                self.buffer.append(pt)
-                return
+        # 4) travel → travel (продолжаем движение)
+        # стоянки отправляются сразу, как только кластер закрылся;
+        # в памяти держится только текущий кластер
+        if self.state == 'travel' and current is None:
+            report_closed_stops(self.stops.push(pt), car=self.name)
+            return
 
-            # 5) zone → zone (остаемся в той же зоне) — ничего не делаем
-            # если self.state=='zone' and current and current[0]==self.zone_id
+        # 5) zone → zone (остаемся в той же зоне) — ничего не делаем
+        # если self.state=='zone' and current and current[0]==self.zone_id
 
+    def process(self, pt: BeaconCoordinate):
+        """Основной метод обработки точек координат"""
+        try:
+            self._transition(pt)
         except Exception as err:
             # Откатываем «битую» сессию и пересоздаем соединение
             try:
@@ -186,6 +299,23 @@ class RealTimeProcessor:
                 pass
             self.db = SessionLocal()
             logger.error("❌ [RT] Ошибка обработки, сессия пересоздана: %s", err, exc_info=True)
+            return
+
+        # Снимок пишем только после успешной обработки точки
+        self._save_state(pt)
+
+
+# процессоры по устройствам — создаются лениво, при первом обращении:
+# импорт модуля не ходит в БД
+_rt_processors: dict[int | None, RealTimeProcessor] = {}
+_rt_lock = threading.Lock()
+
 
-# единый процессор
-rt_processor = RealTimeProcessor()
+def get_rt_processor(device_id: int | None = None, name: str | None = None) -> RealTimeProcessor:
+    processor = _rt_processors.get(device_id)
+    if processor is None:
+        with _rt_lock:
+            processor = _rt_processors.get(device_id)
+            if processor is None:
+                processor = _rt_processors[device_id] = RealTimeProcessor(device_id, name)
+    return processor
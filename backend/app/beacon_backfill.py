@@ -0,0 +1,227 @@
+# app/beacon_backfill.py — дозагрузка истории трека StarLine за период
+"""
+Дозагрузка пропущенных точек маяка из истории StarLine.
+
+Поллер пишет точки только в рабочие часы и пока жив: всё, что пришлось
+на простой, теряется, и дневная статистика / визиты считаются по дыре.
+backfill() запрашивает трек устройства за период (окнами по
+CHUNK_HOURS) и пишет многострочными INSERT только точки, попавшие в
+дыры: дальше GAP от ближайшей уже сохранённой точки устройства. Трек
+/ways (filtering) прорежен иначе, чем позиции поллера, — там, где поллер
+работал, он не подмешивается ко второму треку.
+
+С replay=True сессии и визиты устройства за затронутые сутки
+пересчитываются app.replay.replay_device по полному, уже без дыр,
+набору точек — без уведомлений, а затем daily_zone_statistics этих
+дней (analytics.daily_stats_runner). Снимок real-time процессора
+не трогается.
+
+Запуск (из каталога backend):
+    python -m app.beacon_backfill --from 2026-10-01 --to 2026-10-03 [--device 123] [--replay]
+"""
+import argparse
+import logging
+import os
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, Optional
+
+import requests
+from sqlalchemy.orm import Session
+
+import app.crud as crud
+from app.beacon_updater import IRKUTSK, authorise_cached, fetch_positions
+from app.db import SessionLocal, init_db
+from app.replay import replay_device, utc_naive
+from app.schemas import BeaconCoordinateCreate
+from analytics.daily_stats_runner import run_range
+
+logger = logging.getLogger(__name__)
+
+TRACK_URL = "https://developer.starline.ru/json/v1/device/{device_id}/ways"
+# Окно одного запроса истории
+CHUNK_HOURS = int(os.getenv("BACKFILL_CHUNK_HOURS", "24"))
+# Строк на один INSERT
+INSERT_BATCH = 1000
+# Точка истории — дыра, если до ближайшей сохранённой точки дальше GAP
+# (по умолчанию — интервал опроса поллера)
+GAP = timedelta(seconds=float(os.getenv(
+    "BACKFILL_GAP_SEC", os.getenv("BEACON_POLL_INTERVAL_SEC", "60")
+)))
+
+http = requests.Session()
+
+
+@dataclass
+class BackfillResult:
+    device_id: int
+    fetched: int = 0
+    inserted: int = 0
+    covered: int = 0            # точки рядом с уже сохранёнными — не в дыре
+    replayed_sessions: int = 0
+    stats_days: int = 0
+
+
+# ——— Запрос истории ———————————————————————————————————————————————
+
+def parse_track(payload: dict) -> list[dict]:
+    """
+    Разбор ответа ways: [{lat, lon, ts}, …] по возрастанию ts.
+    TRACK — точки пути; STOP — одна точка стоянки, берём её начало и конец.
+    Оси как в parse_positions: x — широта, y — долгота.
+    """
+    points = []
+    for item in payload.get("way") or []:
+        kind = item.get("type")
+        if kind == "TRACK":
+            for node in item.get("nodes") or []:
+                points.append({"lat": node.get("x"), "lon": node.get("y"), "ts": node.get("t")})
+        elif kind == "STOP":
+            for ts in (item.get("begin"), item.get("end")):
+                points.append({"lat": item.get("x"), "lon": item.get("y"), "ts": ts})
+    points = [p for p in points if None not in (p["lat"], p["lon"], p["ts"])]
+    points.sort(key=lambda p: p["ts"])
+    return points
+
+
+def fetch_track(device_id: int, begin: datetime, end: datetime) -> list[dict]:
+    """Трек устройства за [begin, end) (aware datetime)."""
+    slnet_token, _ = authorise_cached()
+    resp = http.post(
+        TRACK_URL.format(device_id=device_id),
+        json={
+            "begin": int(begin.timestamp()),
+            "end": int(end.timestamp()),
+            "filtering": True,
+        },
+        cookies={"slnet": slnet_token},
+        timeout=(10, 60),
+    )
+    resp.raise_for_status()
+    return [p for p in parse_track(resp.json()) if begin.timestamp() <= p["ts"] < end.timestamp()]
+
+
+# ——— Дозагрузка ————————————————————————————————————————————————————
+
+def day_bounds(first: date, last: date) -> tuple[datetime, datetime]:
+    """Границы местных суток [first, last] как aware datetime."""
+    start = datetime.combine(first, time(0), tzinfo=IRKUTSK)
+    end = datetime.combine(last + timedelta(days=1), time(0), tzinfo=IRKUTSK)
+    return start, end
+
+
+def in_gap(stored: list[datetime], recorded_at: datetime, gap: timedelta = GAP) -> bool:
+    """True, если до ближайшей точки из stored (по возрастанию) дальше gap."""
+    i = bisect_left(stored, recorded_at)
+    if i < len(stored) and stored[i] - recorded_at <= gap:
+        return False
+    if i > 0 and recorded_at - stored[i - 1] <= gap:
+        return False
+    return True
+
+
+def fill_window(db: Session, device_id: int, begin: datetime, end: datetime,
+                result: BackfillResult) -> list[datetime]:
+    """Дозагружает дыры одного окна; возвращает моменты записанных точек."""
+    track = fetch_track(device_id, begin, end)
+    result.fetched += len(track)
+
+    # соседи за краями окна тоже закрывают его края
+    stored = sorted(crud.get_beacon_timestamps(
+        db, device_id, utc_naive(begin) - GAP, utc_naive(end) + GAP
+    ))
+    fresh: list[BeaconCoordinateCreate] = []
+    for p in track:
+        recorded_at = datetime.fromtimestamp(p["ts"], tz=timezone.utc).replace(tzinfo=None)
+        if not in_gap(stored, recorded_at) or (fresh and fresh[-1].recorded_at == recorded_at):
+            result.covered += 1
+            continue
+        fresh.append(BeaconCoordinateCreate(
+            latitude=p["lat"], longitude=p["lon"], recorded_at=recorded_at, device_id=device_id
+        ))
+
+    for start in range(0, len(fresh), INSERT_BATCH):
+        crud.bulk_create_beacon_coordinates(db, fresh[start:start + INSERT_BATCH])
+    result.inserted += len(fresh)
+    return [c.recorded_at for c in fresh]
+
+
+def replay(db: Session, device_id: int, start: datetime, end: datetime) -> int:
+    """
+    Пересчитывает сессии и визиты устройства за [start, end) (aware datetime)
+    без уведомлений. Возвращает число записанных сессий.
+    """
+    written = replay_device(db, device_id, start, end)
+    logger.info("🔁 Устройство %s: пересчитано сессий %s", device_id, written)
+    return written
+
+
+def backfill(device_id: int, first: date, last: date, do_replay: bool = False) -> BackfillResult:
+    """Дозагрузка трека устройства за местные сутки [first, last]."""
+    result = BackfillResult(device_id)
+    start, end = day_bounds(first, last)
+    step = timedelta(hours=CHUNK_HOURS)
+
+    db: Session = SessionLocal()
+    try:
+        filled: list[datetime] = []
+        begin = start
+        while begin < end:
+            window_end = min(begin + step, end)
+            filled += fill_window(db, device_id, begin, window_end, result)
+            begin = window_end
+
+        logger.info("📥 Устройство %s: получено %s, записано %s, уже покрыто %s",
+                    device_id, result.fetched, result.inserted, result.covered)
+
+        if do_replay and filled:
+            # пересчитываем только сутки, в которые что-то дописали
+            days = sorted({
+                dt.replace(tzinfo=timezone.utc).astimezone(IRKUTSK).date() for dt in filled
+            })
+            result.replayed_sessions = replay(db, device_id, *day_bounds(days[0], days[-1]))
+    finally:
+        db.close()
+
+    if do_replay and filled:
+        # дни daily_zone_statistics — по UTC (analytics_simple.day_bounds)
+        stats_days = sorted({dt.date() for dt in filled})
+        done = run_range(stats_days[0], stats_days[-1], [device_id],
+                         workers=min(len(stats_days), os.cpu_count() or 1))
+        result.stats_days = len(done)
+        logger.info("📊 Устройство %s: пересчитана статистика дней %s", device_id, result.stats_days)
+    return result
+
+
+# ——— CLI ————————————————————————————————————————————————————————————
+
+def get_args(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Дозагрузка истории трека StarLine")
+    parser.add_argument("--from", dest="first", type=date.fromisoformat, required=True,
+                        help="первый день (местное время), YYYY-MM-DD")
+    parser.add_argument("--to", dest="last", type=date.fromisoformat, required=True,
+                        help="последний день включительно, YYYY-MM-DD")
+    parser.add_argument("--device", type=int, action="append",
+                        help="device_id (можно несколько); по умолчанию — все устройства")
+    parser.add_argument("--replay", action="store_true",
+                        help="пересчитать сессии геозон и дневную статистику за дозаполненные сутки")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    logging.basicConfig(format='[%(asctime)s] %(levelname)s: %(message)s', level=logging.INFO)
+    args = get_args(argv)
+    if args.last < args.first:
+        raise SystemExit("--to раньше --from")
+    init_db()
+    devices = args.device or [p["device_id"] for p in fetch_positions()]
+    for device_id in devices:
+        try:
+            backfill(device_id, args.first, args.last, do_replay=args.replay)
+        except Exception as err:
+            logger.error("❌ Ошибка дозагрузки устройства %s: %s", device_id, err, exc_info=True)
+
+
+if __name__ == "__main__":
+    main()
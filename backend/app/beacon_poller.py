@@ -0,0 +1,178 @@
+# app/beacon_poller.py — асинхронный опрос StarLine вместо BlockingScheduler
+"""
+Асинхронный опрос маяков.
+
+Цикл тиков (POLL_INTERVAL_SEC, можно меньше минуты) только запрашивает
+позиции всех устройств через общий httpx.AsyncClient и раскладывает их
+по очередям устройств. Запись в БД, real-time аналитика и уведомления
+идут в отдельных потребителях — по одному на устройство (порядок точек
+сохраняется, устройства обрабатываются параллельно в пуле потоков).
+Медленная обработка больше не сдвигает следующий тик.
+
+Точки пишутся через BeaconWriteBuffer (app.beacon_writer): один
+многострочный INSERT на пачку, real-time аналитика — после сброса.
+
+Метрики (PollerStats): задержка тика относительно расписания,
+пропущенные тики, длительность запроса, глубина очередей.
+
+Запуск: python -m app.beacon_poller (из каталога backend).
+"""
+import asyncio
+import logging
+import os
+import time as monotonic_time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import httpx
+
+from app import beacon_updater
+from app.beacon_updater import IRKUTSK, authorise_cached, parse_positions, process_flushed, record_position
+from app.beacon_writer import BeaconWriteBuffer
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SEC = float(os.getenv("BEACON_POLL_INTERVAL_SEC", "60"))
+# Рабочие часы опроса (как у прежнего CronTrigger hour="8-21")
+WORK_HOURS = range(8, 22)
+HTTP_TIMEOUT = httpx.Timeout(10.0)
+# Предупреждать, если у устройства накопилось столько необработанных точек
+QUEUE_WARN = 10
+# Раз в сколько тиков писать сводку метрик
+STATS_EVERY = 10
+
+
+@dataclass
+class PollerStats:
+    ticks: int = 0
+    missed_ticks: int = 0
+    fetch_errors: int = 0
+    duplicates: int = 0
+    last_lag_sec: float = 0.0
+    max_lag_sec: float = 0.0
+    last_fetch_sec: float = 0.0
+    queue_depth: dict[int, int] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        return (
+            f"тиков {self.ticks}, пропущено {self.missed_ticks}, ошибок опроса {self.fetch_errors}, "
+            f"дублей {self.duplicates}, лаг {self.last_lag_sec:.2f}с (макс {self.max_lag_sec:.2f}с), "
+            f"запрос {self.last_fetch_sec:.2f}с, очереди {self.queue_depth}"
+        )
+
+
+class BeaconPoller:
+    def __init__(self, interval: float = POLL_INTERVAL_SEC):
+        self.interval = interval
+        self.stats = PollerStats()
+        self.buffer = BeaconWriteBuffer(on_flushed=process_flushed)
+        self._queues: dict[int, asyncio.Queue] = {}
+        self._consumers: dict[int, asyncio.Task] = {}
+        # последний ts по устройству: при частом опросе StarLine отдаёт ту же точку
+        self._last_ts: dict[int, int] = {}
+
+    # ——— Опрос ————————————————————————————————————————————————————————
+
+    async def fetch(self, client: httpx.AsyncClient) -> list[dict]:
+        # авторизация синхронная и редкая (токен кэшируется на сутки)
+        slnet_token, user_id = await asyncio.to_thread(authorise_cached)
+        url = f"https://developer.starline.ru/json/v2/user/{user_id}/user_info"
+        resp = await client.get(url, cookies={"slnet": slnet_token})
+        resp.raise_for_status()
+        return parse_positions(resp.json())
+
+    async def tick(self, client: httpx.AsyncClient) -> None:
+        started = monotonic_time.monotonic()
+        try:
+            positions = await self.fetch(client)
+        except Exception as err:
+            self.stats.fetch_errors += 1
+            logger.error("❌ Ошибка опроса StarLine: %s", err, exc_info=True)
+            return
+        finally:
+            self.stats.last_fetch_sec = monotonic_time.monotonic() - started
+
+        now_local = datetime.now(IRKUTSK)
+        for position in positions:
+            device_id = position["device_id"]
+            if self._last_ts.get(device_id) == position["ts"]:
+                self.stats.duplicates += 1
+                continue
+            self._last_ts[device_id] = position["ts"]
+            queue = self._queue(device_id)
+            queue.put_nowait((position, now_local))
+            if queue.qsize() >= QUEUE_WARN:
+                logger.warning("⚠️ Устройство %s: %s необработанных точек", device_id, queue.qsize())
+
+    # ——— Обработка ————————————————————————————————————————————————————
+
+    def _queue(self, device_id: int) -> asyncio.Queue:
+        queue = self._queues.get(device_id)
+        if queue is None:
+            queue = self._queues[device_id] = asyncio.Queue()
+            self._consumers[device_id] = asyncio.create_task(self._consume(device_id, queue))
+        return queue
+
+    async def _consume(self, device_id: int, queue: asyncio.Queue) -> None:
+        while True:
+            position, now_local = await queue.get()
+            try:
+                # буфер, аналитика и outbox синхронные — выполняем в пуле потоков
+                await asyncio.to_thread(record_position, position, now_local, self.buffer)
+            except Exception as err:
+                logger.error("❌ Ошибка записи устройства %s: %s", device_id, err, exc_info=True)
+            finally:
+                queue.task_done()
+
+    # ——— Расписание ———————————————————————————————————————————————————
+
+    async def run(self) -> None:
+        limits = httpx.Limits(max_connections=10, max_keepalive_connections=5)
+        async with httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=limits) as client:
+            next_tick = monotonic_time.monotonic()
+            while True:
+                now = monotonic_time.monotonic()
+                if now < next_tick:
+                    await asyncio.sleep(next_tick - now)
+                    now = monotonic_time.monotonic()
+
+                # тик опоздал больше чем на интервал — пропускаем просроченные слоты
+                behind = int((now - next_tick) // self.interval)
+                if behind:
+                    self.stats.missed_ticks += behind
+                    next_tick += behind * self.interval
+                    logger.warning("⚠️ Пропущено тиков опроса: %s", behind)
+                lag = now - next_tick
+                next_tick += self.interval
+
+                if datetime.now(IRKUTSK).hour not in WORK_HOURS:
+                    continue
+
+                self.stats.ticks += 1
+                self.stats.last_lag_sec = lag
+                self.stats.max_lag_sec = max(self.stats.max_lag_sec, lag)
+                await self.tick(client)
+
+                self.stats.queue_depth = {d: q.qsize() for d, q in self._queues.items()}
+                if self.stats.ticks % STATS_EVERY == 0:
+                    logger.info("📈 Опрос: %s", self.stats.summary())
+
+
+def main() -> None:
+    beacon_updater.startup()
+    logger.info(
+        "🕑 Сервис запущен: асинхронный опрос каждые %.0f с (%02d–%02d Irkutsk)",
+        POLL_INTERVAL_SEC, WORK_HOURS.start, WORK_HOURS.stop,
+    )
+    poller = BeaconPoller()
+    try:
+        asyncio.run(poller.run())
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("Останавливаем сервис…")
+    finally:
+        # дописываем точки, оставшиеся в буфере
+        poller.buffer.close()
+
+
+if __name__ == "__main__":
+    main()
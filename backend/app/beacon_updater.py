@@ -2,15 +2,15 @@
 
 import os
 import logging
+import threading
 from pathlib import Path
-from datetime import datetime, timedelta, timezone, time
+from datetime import date, datetime, timedelta, timezone, time
+from typing import Optional
 import zoneinfo
 
 import requests
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
-from apscheduler.schedulers.blocking import BlockingScheduler
-from apscheduler.triggers.cron import CronTrigger
 
 from get_app_code import get_app_code
 from get_app_token import get_app_token
@@ -18,11 +18,12 @@ from get_slid_user_token import get_slid_user_token
 from get_slnet_token import get_slnet_token
 from get_user_id import get_user_id
 
-from app.db import SessionLocal
+from app.db import SessionLocal, init_db
 from app.crud import create_beacon_coordinate
 from app.schemas import BeaconCoordinateCreate
-from app.analytics_stream import rt_processor
-from app.telegram_bot import send_to_telegram
+from app.beacon_writer import BeaconWriteBuffer
+from app.analytics_stream import get_rt_processor
+from app.telegram_outbox import notify, outbox
 # Новая импорт для отправки отчёта по задачам
 from app.tasks import main as send_task_report
 
@@ -55,9 +56,11 @@ _token_cache = {
     "expires_at":  datetime.now(IRKUTSK)
 }
 
-# Для отслеживания начала/конца дня и времени последнего запуска
-_last_work_date = None
-_last_run_time  = None
+# Для отслеживания начала/конца дня и времени последнего запуска — по устройствам
+_last_work_date: dict[int, date] = {}
+_last_run_time:  dict[int, datetime] = {}
+# устройства обрабатываются параллельно (beacon_poller) — отчёт за день шлём один раз
+_day_lock = threading.Lock()
 
 
 def authorise_full() -> tuple[str, str]:
@@ -83,101 +86,158 @@ def authorise_cached() -> tuple[str, str]:
     return slnet_token, user_id
 
 
-def fetch_coordinates() -> tuple[float, float, int]:
+def fetch_positions() -> list[dict]:
+    """
+    Последние позиции всех устройств пользователя:
+    [{device_id, name, lat, lon, ts}, …]. Устройства без позиции пропускаются.
+    """
     slnet_token, user_id = authorise_cached()
     url = f"https://developer.starline.ru/json/v2/user/{user_id}/user_info"
     resp = requests.get(url, headers={"Cookie": f"slnet={slnet_token}"}, timeout=10)
     resp.raise_for_status()
-    payload = resp.json()
+    return parse_positions(resp.json())
+
+
+def parse_positions(payload: dict) -> list[dict]:
+    """Разбор ответа user_info (общий для синхронного и асинхронного опроса)."""
     devices = payload.get("devices") or []
     if not devices:
         raise RuntimeError("У пользователя нет устройств.")
-    pos = devices[0].get("position", {})
-    lon, lat, ts = pos.get("y"), pos.get("x"), pos.get("ts")
-    if None in (lat, lon, ts):
-        raise RuntimeError(f"Некорректные данные позиции: {pos}")
-    return lat, lon, ts
-
-
-def record_beacon_coordinate() -> None:
-    global _last_work_date, _last_run_time
-
-    now_local = datetime.now(IRKUTSK)
-
-    try:
-        # 1) Получаем свежие координаты
-        lat, lon, ts_dev = fetch_coordinates()
-        dt_utc   = datetime.fromtimestamp(ts_dev, tz=timezone.utc)
-        dt_local = dt_utc.astimezone(IRKUTSK)
-
-        today = dt_local.date()
-        # Границы рабочего дня
-        start_thresh = datetime.combine(today, time(8, 0), tzinfo=IRKUTSK)
-        end_thresh   = datetime.combine(today, time(21, 59), tzinfo=IRKUTSK)
-
-        # 2) Старт дня: пересечение порога 08:00
-        if (_last_run_time is None or _last_run_time < start_thresh) \
-           and dt_local >= start_thresh \
-           and _last_work_date != today:
-
-            _last_work_date = today
-            found = rt_processor._find_zone(BeaconCoordinateCreate(
-                latitude=lat, longitude=lon, recorded_at=dt_utc
-            ))
-            if found:
-                send_to_telegram(f"🔔 Начало работы: автомобиль в зоне «{found[1]}»")
-            else:
-                send_to_telegram("🔔 Начало работы: автомобиль в пути")
-
-            # После уведомления о старте рабочего дня отправляем отчёт по задачам
+    positions = []
+    for dev in devices:
+        pos = dev.get("position") or {}
+        lon, lat, ts = pos.get("y"), pos.get("x"), pos.get("ts")
+        if None in (lat, lon, ts) or dev.get("device_id") is None:
+            logger.warning("Некорректные данные позиции устройства %s: %s", dev.get("device_id"), pos)
+            continue
+        device_id = int(dev["device_id"])
+        positions.append({
+            "device_id": device_id,
+            "name":      dev.get("alias") or str(device_id),
+            "lat":       lat,
+            "lon":       lon,
+            "ts":        ts,
+        })
+    return positions
+
+
+def record_position(position: dict, now_local: datetime,
+                    buffer: Optional[BeaconWriteBuffer] = None) -> None:
+    """
+    Запись и real-time обработка позиции одного устройства.
+    С buffer точка ставится в буфер записи, а real-time обработка
+    выполняется после сброса буфера (process_flushed).
+    """
+    device_id, name = position["device_id"], position["name"]
+    lat, lon = position["lat"], position["lon"]
+    dt_utc   = datetime.fromtimestamp(position["ts"], tz=timezone.utc)
+    dt_local = dt_utc.astimezone(IRKUTSK)
+    processor = get_rt_processor(device_id, name)
+    last_run = _last_run_time.get(device_id)
+
+    today = dt_local.date()
+    # Границы рабочего дня
+    start_thresh = datetime.combine(today, time(8, 0), tzinfo=IRKUTSK)
+    end_thresh   = datetime.combine(today, time(21, 59), tzinfo=IRKUTSK)
+
+    # 2) Старт дня: пересечение порога 08:00
+    if (last_run is None or last_run < start_thresh) \
+       and dt_local >= start_thresh \
+       and _last_work_date.get(device_id) != today:
+
+        with _day_lock:
+            first_today = today not in _last_work_date.values()
+            _last_work_date[device_id] = today
+        found = processor._find_zone(BeaconCoordinateCreate(
+            latitude=lat, longitude=lon, recorded_at=dt_utc
+        ))
+        if found:
+            notify(f"🔔 Начало работы ({name}): автомобиль в зоне «{found[1]}»")
+        else:
+            notify(f"🔔 Начало работы ({name}): автомобиль в пути")
+
+        # После уведомления о старте рабочего дня отправляем отчёт по задачам (раз в день)
+        if first_today:
             try:
                 send_task_report()
             except Exception as err:
                 logger.error("❌ Ошибка при отправке отчёта по задачам: %s", err, exc_info=True)
 
-        # 3) Сохраняем в БД
-        coord_in = BeaconCoordinateCreate(
-            latitude=lat, longitude=lon, recorded_at=dt_utc
-        )
+    # 3) Сохраняем в БД
+    coord_in = BeaconCoordinateCreate(
+        latitude=lat, longitude=lon, recorded_at=dt_utc, device_id=device_id
+    )
+    if buffer is not None:
+        buffer.add(coord_in)
+        logger.info("📥 [%s] %s: device_time=%s, lat=%.6f, lon=%.6f (в буфере)",
+                    now_local.isoformat(), name, dt_local.isoformat(), lat, lon)
+    else:
         db: Session = SessionLocal()
         try:
             db_coord = create_beacon_coordinate(db, coord_in)
         finally:
             db.close()
-        logger.info("✅ [%s] Сохранено: device_time=%s, lat=%.6f, lon=%.6f",
-                    now_local.isoformat(), dt_local.isoformat(), lat, lon)
+        logger.info("✅ [%s] %s: device_time=%s, lat=%.6f, lon=%.6f",
+                    now_local.isoformat(), name, dt_local.isoformat(), lat, lon)
 
         # 4) Real-time аналитика (въезд/выезд/стопы)
-        try:
-            rt_processor.process(db_coord)
-        except Exception as err:
-            logger.error("❌ [RT] Ошибка обработки: %s", err, exc_info=True)
+        process_saved(db_coord)
+
+    # 5) Финиш дня: пересечение порога 21:59
+    if (last_run is None or last_run < end_thresh) \
+       and dt_local >= end_thresh:
 
-        # 5) Финиш дня: пересечение порога 21:59
-        if (_last_run_time is None or _last_run_time < end_thresh) \
-           and dt_local >= end_thresh:
+        found = processor._find_zone(coord_in)
+        if found:
+            notify(f"🔔 Конец работы ({name}): автомобиль завершил день в зоне «{found[1]}»")
+        else:
+            notify(f"🔔 Конец работы ({name}): автомобиль завершил день в пути")
 
-            found = rt_processor._find_zone(db_coord)
-            if found:
-                send_to_telegram(f"🔔 Конец работы: автомобиль завершил день в зоне «{found[1]}»")
-            else:
-                send_to_telegram("🔔 Конец работы: автомобиль завершил день в пути")
+    # 6) Обновляем отметку последнего запуска
+    _last_run_time[device_id] = dt_local
 
-        # 6) Обновляем отметку последнего запуска
-        _last_run_time = dt_local
 
+def process_saved(coord) -> None:
+    """Real-time аналитика сохранённой точки (въезд/выезд/стопы)."""
+    try:
+        get_rt_processor(coord.device_id).process(coord)
+    except Exception as err:
+        logger.error("❌ [RT %s] Ошибка обработки: %s", coord.device_id, err, exc_info=True)
+
+
+def process_flushed(coords) -> None:
+    """on_flushed буфера записи: точки приходят упорядоченными по (device_id, recorded_at)."""
+    for coord in coords:
+        process_saved(coord)
+
+
+def record_beacon_coordinate() -> None:
+    now_local = datetime.now(IRKUTSK)
+
+    try:
+        # 1) Получаем свежие координаты всех устройств
+        positions = fetch_positions()
     except Exception as e:
-        logger.error("❌ [%s] Ошибка записи: %s", now_local.isoformat(), e, exc_info=True)
+        logger.error("❌ [%s] Ошибка получения координат: %s", now_local.isoformat(), e, exc_info=True)
+        return
+
+    for position in positions:
+        try:
+            record_position(position, now_local)
+        except Exception as e:
+            logger.error("❌ [%s] Ошибка записи устройства %s: %s",
+                         now_local.isoformat(), position["device_id"], e, exc_info=True)
+
+
+def startup() -> None:
+    """Работа с БД при старте сервиса (процессоры устройств создаются при первой точке)."""
+    init_db()
+    # досылаем сообщения, оставшиеся в очереди с прошлого запуска
+    outbox.start()
 
 
 if __name__ == "__main__":
-    scheduler = BlockingScheduler(timezone=IRKUTSK)
-    # Запуск каждую минуту с 00:00 до 21:59 локального времени
-    trigger   = CronTrigger(minute="*", hour="8-21", timezone=IRKUTSK)
-    scheduler.add_job(record_beacon_coordinate, trigger, id="beacon_log")
-    logger.info("🕑 Сервис запущен: запись координат каждую минуту (08–22 Irkutsk)")
-    try:
-        scheduler.start()
-    except (KeyboardInterrupt, SystemExit):
-        logger.info("Останавливаем сервис…")
+    # Опрос по расписанию — асинхронный поллер (app.beacon_poller)
+    from app.beacon_poller import main as run_poller
 
+    run_poller()
@@ -0,0 +1,162 @@
+# app/beacon_writer.py
+"""
+Буфер записи координат маяков.
+
+Точки всех устройств копятся в памяти и сбрасываются в БД одним
+многострочным INSERT — раз в FLUSH_INTERVAL_SEC или сразу при
+FLUSH_SIZE точках (вместо add/commit/refresh на каждую точку).
+После записи сохранённые строки с id передаются в on_flushed
+(real-time процессоры) в порядке (device_id, recorded_at).
+
+Неудачная пачка возвращается в начало буфера. После FLUSH_RETRIES
+неудач подряд она пишется построчно: записанные точки идут дальше,
+не записанные уходят в журнал ошибок (dead letter) и отбрасываются —
+одна плохая строка не блокирует буфер. Буфер ограничен MAX_PENDING
+точками: при переполнении (БД долго недоступна) отбрасываются самые
+старые.
+"""
+import atexit
+import logging
+import os
+import threading
+from typing import Callable, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from app.crud import bulk_create_beacon_coordinates
+from app.db import SessionLocal
+from app.models import BeaconCoordinate
+from app.schemas import BeaconCoordinateCreate
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SEC = float(os.getenv("BEACON_FLUSH_INTERVAL_SEC", "5"))
+FLUSH_SIZE = int(os.getenv("BEACON_FLUSH_SIZE", "200"))
+FLUSH_RETRIES = int(os.getenv("BEACON_FLUSH_RETRIES", "5"))
+MAX_PENDING = int(os.getenv("BEACON_MAX_PENDING", "50000"))
+
+
+class BeaconWriteBuffer:
+    def __init__(
+        self,
+        on_flushed: Optional[Callable[[Sequence[BeaconCoordinate]], None]] = None,
+        interval: float = FLUSH_INTERVAL_SEC,
+        max_points: int = FLUSH_SIZE,
+        retries: int = FLUSH_RETRIES,
+        max_pending: int = MAX_PENDING,
+    ):
+        self.on_flushed = on_flushed
+        self.interval = interval
+        self.max_points = max_points
+        self.retries = retries
+        self.max_pending = max_pending
+        self._pending: list[BeaconCoordinateCreate] = []
+        # неудачных сбросов подряд
+        self._failures = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        # один сброс за раз: порядок точек устройства сохраняется
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # close при выходе регистрируется один раз, при первом start()
+        self._atexit_registered = False
+
+    def add(self, coord_in: BeaconCoordinateCreate) -> None:
+        """Ставит точку в буфер; при заполнении будит поток сброса."""
+        with self._lock:
+            self._pending.append(coord_in)
+            self._trim()
+            full = len(self._pending) >= self.max_points
+        self.start()
+        if full:
+            self._wakeup.set()
+
+    def _trim(self) -> None:
+        """Под self._lock: сверх max_pending отбрасываются самые старые точки."""
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            self.dropped += overflow
+            logger.warning("⚠️ Буфер координат переполнен: отброшено старых точек %s (всего %s)",
+                           overflow, self.dropped)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="beacon-writer", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def close(self) -> None:
+        """Останавливает поток и сбрасывает остаток буфера."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(self.interval + 30)
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as err:
+                logger.error("❌ Ошибка сброса буфера координат: %s", err, exc_info=True)
+
+    def flush(self) -> list[BeaconCoordinate]:
+        """Записывает накопленные точки одним INSERT и отдаёт их в on_flushed."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return []
+
+            db = SessionLocal()
+            try:
+                saved = bulk_create_beacon_coordinates(db, batch)
+                self._failures = 0
+            except Exception:
+                db.rollback()
+                self._failures += 1
+                if self._failures < self.retries:
+                    # точки не потеряны: возвращаем их в начало буфера до следующего сброса
+                    with self._lock:
+                        self._pending[:0] = batch
+                        self._trim()
+                    raise
+                logger.error("❌ Пачка из %s точек не записана %s раз подряд — пишем построчно",
+                             len(batch), self._failures, exc_info=True)
+                self._failures = 0
+                saved = self._write_rows(db, batch)
+            finally:
+                db.close()
+            logger.info("💾 Записано точек: %s", len(saved))
+
+            if self.on_flushed is not None:
+                self.on_flushed(saved)
+            return saved
+
+    def _write_rows(self, db: Session, batch: list[BeaconCoordinateCreate]) -> list[BeaconCoordinate]:
+        """Построчная запись; не записанные точки — в журнал ошибок и в счётчик dropped."""
+        saved: list[BeaconCoordinate] = []
+        for coord_in in batch:
+            try:
+                saved += bulk_create_beacon_coordinates(db, [coord_in])
+            except Exception as err:
+                db.rollback()
+                with self._lock:
+                    self.dropped += 1
+                logger.error("☠️ Точка отброшена: %s (%s)", coord_in.model_dump_json(), err)
+        return sorted(saved, key=lambda c: (c.device_id or 0, c.recorded_at, c.id))
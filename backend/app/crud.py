@@ -1,12 +1,219 @@
 # app/crud.py
-from sqlalchemy.orm import Session
+import base64
+import binascii
+import json
+from sqlalchemy import and_, delete, insert, or_, update
+from sqlalchemy.orm import Session, raiseload, selectinload
 from . import models, schemas
-from datetime import datetime, timedelta, date
-from typing import List, Optional
+from .geodesy import bounding_box, distances_to_point, points_to_arrays
+from .spatial_index import task_index
+from datetime import datetime, timedelta, date, timezone
+from typing import List, Optional, Sequence
 
-def get_tasks(db: Session) -> list[models.Task]:
-    """Возвращает список всех задач"""
-    return db.query(models.Task).all()
+# ─── Стратегии загрузки связей ──────────────────────────────────────────────
+# Связи моделей ленивые; запросы списков явно подгружают только то, что
+# сериализует схема ответа, а остальные связи закрыты raiseload — случайное
+# обращение к ним падает сразу, а не превращается в N+1 или каскад JOIN.
+
+# schemas.ExecutorBrief внутри schemas.Task
+EXECUTOR_BRIEF_COLUMNS = (models.Executor.exec_id, models.Executor.surname, models.Executor.name)
+
+
+def task_list_options():
+    """Задача + краткие исполнители одним доп. запросом (SELECT … IN)"""
+    return (
+        selectinload(models.Task.executors)
+            .load_only(*EXECUTOR_BRIEF_COLUMNS)
+            .raiseload("*"),
+        raiseload("*"),
+    )
+
+
+# ─── Keyset-пагинация задач ──────────────────────────────────────────────────
+# Курсор — непрозрачная строка с (planned_start, task_id) последней задачи
+# страницы; следующая страница начинается строго после неё. В отличие от
+# OFFSET стоимость страницы не растёт с её номером.
+
+def _encode_token(value) -> str:
+    raw = json.dumps(value)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_token(token: str):
+    raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    return json.loads(raw)
+
+
+def encode_task_cursor(task: models.Task) -> str:
+    return _encode_token([task.planned_start.isoformat(), task.task_id])
+
+
+def decode_task_cursor(cursor: str) -> tuple[datetime, int]:
+    """ValueError, если курсор не наш"""
+    try:
+        planned_start, task_id = _decode_token(cursor)
+        return datetime.fromisoformat(planned_start), int(task_id)
+    except (TypeError, ValueError, binascii.Error) as err:
+        raise ValueError("Некорректный курсор") from err
+
+
+def get_tasks(
+    db: Session,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    statuses: Sequence[str] = (),
+    types: Sequence[str] = (),
+    priorities: Sequence[str] = (),
+    exec_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    contract_number: Optional[str] = None,
+) -> tuple[list[models.Task], Optional[str]]:
+    """
+    Задачи по порядку (planned_start, task_id) с фильтрами; planned_start
+    в [date_from, date_to). Без limit — все подходящие задачи.
+    Возвращает (задачи, курсор следующей страницы или None).
+    """
+    T = models.Task
+    q = db.query(T)
+    if statuses:
+        q = q.filter(T.status.in_(statuses))
+    if types:
+        q = q.filter(T.type.in_(types))
+    if priorities:
+        q = q.filter(T.priority.in_(priorities))
+    if exec_id is not None:
+        q = q.filter(T.executors.any(models.Executor.exec_id == exec_id))
+    if date_from is not None:
+        q = q.filter(T.planned_start >= date_from)
+    if date_to is not None:
+        q = q.filter(T.planned_start < date_to)
+    if contract_number is not None:
+        q = q.filter(T.contract_number == contract_number)
+    if cursor is not None:
+        after_start, after_id = decode_task_cursor(cursor)
+        # развёрнутая форма (a, b) > (x, y) — её MySQL использует как диапазон индекса
+        q = q.filter(or_(
+            T.planned_start > after_start,
+            and_(T.planned_start == after_start, T.task_id > after_id),
+        ))
+
+    q = q.options(*task_list_options()).order_by(T.planned_start, T.task_id)
+    if limit is None:
+        return q.all(), None
+    tasks = q.limit(limit + 1).all()
+    if len(tasks) <= limit:
+        return tasks, None
+    tasks = tasks[:limit]
+    return tasks, encode_task_cursor(tasks[-1])
+
+
+# ─── Дельта-синхронизация задач ─────────────────────────────────────────────
+# Токен — непрозрачная строка с отметкой времени (UTC, как updated_at).
+# Следующий запрос отдаёт задачи с updated_at >= отметки и удалённые задачи
+# из task_tombstones. Отметка отстаёт от текущего времени на
+# CHANGES_SAFETY_LAG: транзакция, поставившая updated_at, могла ещё не
+# закоммититься к моменту чтения. Поэтому updated_at ставится последним
+# шагом перед commit (одиночные изменения — flush при commit, пакетные —
+# _touch_tasks), и CHANGES_SAFETY_LAG — верхняя граница времени от этой
+# отметки до commit, а не всей транзакции. Повторы на стыке безвредны —
+# клиент перезаписывает задачу по task_id.
+
+CHANGES_SAFETY_LAG = timedelta(seconds=5)
+
+
+def encode_sync_token(watermark: datetime) -> str:
+    return _encode_token(watermark.isoformat())
+
+
+def decode_sync_token(token: str) -> datetime:
+    """ValueError, если токен не наш"""
+    try:
+        return datetime.fromisoformat(_decode_token(token))
+    except (TypeError, ValueError, binascii.Error) as err:
+        raise ValueError("Некорректный токен синхронизации") from err
+
+
+def get_task_changes(
+    db: Session, since: Optional[str] = None
+) -> tuple[list[models.Task], list[int], str]:
+    """
+    Изменения задач после токена since: (созданные/изменённые задачи,
+    id удалённых, токен следующего запроса). Без since — все задачи.
+    """
+    started = datetime.utcnow()
+    q = db.query(models.Task)
+    deleted: list[int] = []
+    watermark = started - CHANGES_SAFETY_LAG
+    if since is not None:
+        after = decode_sync_token(since)
+        q = q.filter(models.Task.updated_at >= after)
+        deleted = [
+            task_id for (task_id,) in
+            db.query(models.TaskTombstone.task_id)
+              .filter(models.TaskTombstone.deleted_at >= after)
+              .order_by(models.TaskTombstone.task_id)
+        ]
+        # частые запросы не сдвигают отметку назад
+        watermark = max(watermark, after)
+    tasks = q.options(*task_list_options()).order_by(models.Task.task_id).all()
+    return tasks, deleted, encode_sync_token(watermark)
+
+
+def _touch_tasks(db: Session, task_ids: Sequence[int]) -> None:
+    """
+    Сдвигает updated_at задач на текущее время: смена исполнителей не меняет
+    строку tasks, а пакетным изменениям отметка нужна перед самым commit.
+    """
+    db.query(models.Task).filter(models.Task.task_id.in_(task_ids)).update(
+        {models.Task.updated_at: datetime.utcnow()}, synchronize_session=False
+    )
+
+
+def _touch_task(db: Session, task_id: int) -> None:
+    _touch_tasks(db, [task_id])
+
+
+def get_tasks_in_radius(
+    db: Session,
+    lat: float,
+    lon: float,
+    radius_m: float,
+    exclude_statuses: Sequence[str] = (),
+) -> list[models.Task]:
+    """
+    Задачи в радиусе radius_m от точки.
+    Прямоугольник-префильтр выполняется в SQL (индекс ix_tasks_lat_lng),
+    точное расстояние — векторно по уже отобранным строкам.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_m)
+    q = db.query(models.Task).filter(
+        models.Task.lat.between(min_lat, max_lat),
+        models.Task.lng.between(min_lon, max_lon),
+    )
+    if exclude_statuses:
+        q = q.filter(models.Task.status.notin_(exclude_statuses))
+    candidates = q.order_by(models.Task.task_id).all()
+    dists = distances_to_point(*points_to_arrays(candidates, "lat", "lng"), lat, lon)
+    return [t for t, d in zip(candidates, dists) if d <= radius_m]
+
+
+def get_open_tasks_for_day(db: Session, day: date, exec_id: int | None = None) -> list[models.Task]:
+    """Незавершённые задачи с planned_start в этот день (опционально — одного исполнителя)"""
+    start = datetime.combine(day, datetime.min.time())
+    q = db.query(models.Task).filter(
+        models.Task.planned_start >= start,
+        models.Task.planned_start < start + timedelta(days=1),
+        models.Task.status.in_(("scheduled", "in_progress")),
+    )
+    if exec_id is not None:
+        q = q.filter(models.Task.executors.any(models.Executor.exec_id == exec_id))
+    # маршрутам нужны только id исполнителей
+    q = q.options(
+        selectinload(models.Task.executors).load_only(models.Executor.exec_id).raiseload("*"),
+        raiseload("*"),
+    )
+    return q.order_by(models.Task.task_id).all()
 
 
 def create_task(db: Session, task_in: schemas.TaskCreate, user_id: int | None) -> models.Task:
@@ -33,6 +240,7 @@ def create_task(db: Session, task_in: schemas.TaskCreate, user_id: int | None) -
     db.add(db_task)
     db.commit()
     db.refresh(db_task)
+    task_index.upsert(db_task.task_id, db_task.lat, db_task.lng)
     return db_task
 
 
@@ -53,10 +261,13 @@ def update_task(db: Session, task_id: int, task_in: schemas.TaskUpdate, user_id:
               .all()
         )
         db_task.executors = executors
+        # строка tasks могла не измениться — дельта-синхронизация смотрит на updated_at
+        db_task.updated_at = datetime.utcnow()
 
     db_task.last_modified_by = user_id
     db.commit()
     db.refresh(db_task)
+    task_index.upsert(db_task.task_id, db_task.lat, db_task.lng)
     return db_task
 
 
@@ -66,13 +277,220 @@ def delete_task(db: Session, task_id: int) -> bool:
     if not db_task:
         return False
     db.delete(db_task)
+    db.merge(models.TaskTombstone(task_id=task_id, deleted_at=datetime.utcnow()))
     db.commit()
+    task_index.discard(task_id)
     return True
 
 
+# ─── Пакетные операции с задачами ───────────────────────────────────────────
+# POST/PATCH /tasks/bulk: весь пакет проверяется за один проход (исполнители,
+# абоненты и задачи — по одному IN-запросу), затем пишется в одной транзакции
+# многострочными INSERT. Ошибка в любой строке — ничего не записано.
+
+TASK_PRIORITIES = ("A", "B", "C")
+TASK_TYPES = ("connection", "service", "incident")
+# строк в одном INSERT (ограничение max_allowed_packet)
+BULK_INSERT_BATCH = 500
+
+
+class BulkTaskError(ValueError):
+    """Ошибки проверки пакета: [{"index", "field", "error"}, …]"""
+    def __init__(self, errors: list[dict]):
+        super().__init__(f"Ошибок в пакете: {len(errors)}")
+        self.errors = errors
+
+
+def _parse_task_datetime(value: str) -> datetime:
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        # в БД время хранится как UTC без таймзоны
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _check_task_fields(data: dict, index: int, errors: list[dict]) -> dict:
+    """Проверяет и приводит поля одной задачи пакета; ошибки — в errors"""
+    def fail(field: str, message: str) -> None:
+        errors.append({"index": index, "field": field, "error": message})
+
+    row = dict(data)
+    for field in ("planned_start", "due_datetime"):
+        if row.get(field) is not None:
+            try:
+                row[field] = _parse_task_datetime(row[field])
+            except ValueError:
+                fail(field, "ожидается дата-время ISO 8601")
+    for field in ("lat", "lng", "address_raw", "service_minutes", "movable"):
+        if field in row and row[field] is None:
+            fail(field, "обязательное поле")
+    if row.get("service_minutes") is not None and row["service_minutes"] <= 0:
+        fail("service_minutes", "должно быть > 0")
+    if "priority" in row and row["priority"] not in TASK_PRIORITIES:
+        fail("priority", f"допустимо: {', '.join(TASK_PRIORITIES)}")
+    if "type" in row and row["type"] not in TASK_TYPES:
+        fail("type", f"допустимо: {', '.join(TASK_TYPES)}")
+    return row
+
+
+def _check_references(db: Session, items: Sequence, errors: list[dict]) -> None:
+    """Исполнители и абоненты всего пакета — по одному IN-запросу"""
+    exec_ids = {e for item in items for e in (item.executor_ids or ())}
+    contracts = {item.contract_number for item in items if item.contract_number}
+    known_execs = {
+        exec_id for (exec_id,) in
+        db.query(models.Executor.exec_id).filter(models.Executor.exec_id.in_(exec_ids))
+    } if exec_ids else set()
+    known_contracts = {
+        number for (number,) in
+        db.query(models.Subscriber.contract_number)
+          .filter(models.Subscriber.contract_number.in_(contracts))
+    } if contracts else set()
+
+    for index, item in enumerate(items):
+        missing = sorted(set(item.executor_ids or ()) - known_execs)
+        if missing:
+            errors.append({"index": index, "field": "executor_ids",
+                           "error": f"нет исполнителей {missing}"})
+        if item.contract_number and item.contract_number not in known_contracts:
+            errors.append({"index": index, "field": "contract_number",
+                           "error": f"нет абонента {item.contract_number}"})
+
+
+def _insert_task_links(db: Session, links: list[dict]) -> None:
+    for start in range(0, len(links), BULK_INSERT_BATCH):
+        db.execute(insert(models.TaskExecutor).values(links[start:start + BULK_INSERT_BATCH]))
+
+
+def _load_tasks(db: Session, task_ids: Sequence[int]) -> list[models.Task]:
+    """Задачи по id в порядке task_ids (для ответа: с краткими исполнителями)"""
+    tasks = (
+        db.query(models.Task)
+          .filter(models.Task.task_id.in_(task_ids))
+          .options(*task_list_options())
+          .all()
+    )
+    by_id = {t.task_id: t for t in tasks}
+    return [by_id[task_id] for task_id in task_ids]
+
+
+def bulk_create_tasks(
+    db: Session, tasks_in: Sequence[schemas.TaskCreate], user_id: int | None
+) -> list[models.Task]:
+    """
+    Создаёт пакет задач одной транзакцией; возвращает их в порядке пакета.
+    BulkTaskError — если хоть одна строка не прошла проверку.
+    """
+    if not tasks_in:
+        return []
+    errors: list[dict] = []
+    # DATETIME без долей секунды — иначе проверка по created_at ниже не совпадёт
+    now = datetime.utcnow().replace(microsecond=0)
+    rows = []
+    for index, task_in in enumerate(tasks_in):
+        row = _check_task_fields(task_in.model_dump(exclude={"executor_ids"}), index, errors)
+        row.update(last_modified_by=user_id, created_at=now, updated_at=now)
+        rows.append(row)
+    _check_references(db, tasks_in, errors)
+    if errors:
+        raise BulkTaskError(errors)
+
+    try:
+        task_ids: list[int] = []
+        for start in range(0, len(rows), BULK_INSERT_BATCH):
+            batch = rows[start:start + BULK_INSERT_BATCH]
+            result = db.execute(insert(models.Task).values(batch))
+            # В MySQL нет RETURNING: LAST_INSERT_ID многострочного INSERT — id
+            # первой строки, InnoDB выдаёт такому INSERT непрерывный диапазон
+            first_id = result.lastrowid
+            task_ids += range(first_id, first_id + len(batch))
+        # проверка диапазона: все id наши (в своей транзакции видны только свои строки)
+        own = db.query(models.Task.task_id).filter(
+            models.Task.task_id.in_(task_ids),
+            models.Task.created_at == now,
+        ).count()
+        if own != len(task_ids):
+            raise RuntimeError("id вставленных задач не образуют непрерывный диапазон")
+
+        _insert_task_links(db, [
+            {"task_id": task_id, "exec_id": exec_id}
+            for task_id, task_in in zip(task_ids, tasks_in)
+            for exec_id in dict.fromkeys(task_in.executor_ids)
+        ])
+        # отметка для дельта-синхронизации — перед самым commit (см. CHANGES_SAFETY_LAG)
+        _touch_tasks(db, task_ids)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    for task_id, row in zip(task_ids, rows):
+        task_index.upsert(task_id, row["lat"], row["lng"])
+    return _load_tasks(db, task_ids)
+
+
+def bulk_update_tasks(
+    db: Session, tasks_in: Sequence[schemas.TaskBulkUpdate], user_id: int | None
+) -> list[models.Task]:
+    """
+    Обновляет пакет задач одной транзакцией (только переданные поля);
+    возвращает их в порядке пакета. BulkTaskError — при ошибках проверки.
+    """
+    if not tasks_in:
+        return []
+    errors: list[dict] = []
+    task_ids = [item.task_id for item in tasks_in]
+    known = {
+        task_id for (task_id,) in
+        db.query(models.Task.task_id).filter(models.Task.task_id.in_(task_ids))
+    }
+    seen: set[int] = set()
+    rows = []
+    for index, item in enumerate(tasks_in):
+        if item.task_id not in known:
+            errors.append({"index": index, "field": "task_id", "error": "задача не найдена"})
+        elif item.task_id in seen:
+            errors.append({"index": index, "field": "task_id", "error": "задача повторяется в пакете"})
+        seen.add(item.task_id)
+        data = item.model_dump(exclude_unset=True, exclude={"task_id", "executor_ids"})
+        row = _check_task_fields(data, index, errors)
+        row.update(task_id=item.task_id, last_modified_by=user_id)
+        rows.append(row)
+    _check_references(db, tasks_in, errors)
+    if errors:
+        raise BulkTaskError(errors)
+
+    relinked = [item for item in tasks_in if item.executor_ids is not None]
+    try:
+        # UPDATE по первичному ключу; строки с одинаковым набором полей — одним executemany
+        db.execute(update(models.Task), rows)
+        if relinked:
+            db.execute(
+                delete(models.TaskExecutor)
+                  .where(models.TaskExecutor.task_id.in_([item.task_id for item in relinked]))
+            )
+            _insert_task_links(db, [
+                {"task_id": item.task_id, "exec_id": exec_id}
+                for item in relinked
+                for exec_id in dict.fromkeys(item.executor_ids)
+            ])
+        # updated_at — явно и последним: смена одних исполнителей строку tasks
+        # не меняет, а отметка нужна перед самым commit (см. CHANGES_SAFETY_LAG)
+        _touch_tasks(db, task_ids)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    tasks = _load_tasks(db, task_ids)
+    for task in tasks:
+        task_index.upsert(task.task_id, task.lat, task.lng)
+    return tasks
+
+
 def get_executors(db: Session) -> list[models.Executor]:
-    """Возвращает список всех исполнителей"""
-    return db.query(models.Executor).all()
+    """Возвращает список всех исполнителей (без задач и рабочего времени)"""
+    return db.query(models.Executor).options(raiseload("*")).all()
 
 
 def create_executor(db: Session, ex_in: schemas.ExecutorCreate) -> models.Executor:
@@ -85,14 +503,21 @@ def create_executor(db: Session, ex_in: schemas.ExecutorCreate) -> models.Execut
 
 def get_task_executors(db: Session, task_id: int) -> list[models.Executor]:
     """Возвращает исполнителей для конкретной задачи"""
-    task = db.get(models.Task, task_id)
-    return task.executors if task else []
+    return (
+        db.query(models.Executor)
+          .join(models.TaskExecutor, models.TaskExecutor.exec_id == models.Executor.exec_id)
+          .filter(models.TaskExecutor.task_id == task_id)
+          .options(raiseload("*"))
+          .order_by(models.Executor.exec_id)
+          .all()
+    )
 
 
 def assign_executor(db: Session, task_id: int, exec_id: int) -> None:
     """Привязывает исполнителя к задаче"""
     link = models.TaskExecutor(task_id=task_id, exec_id=exec_id)
     db.add(link)
+    _touch_task(db, task_id)
     db.commit()
 
 
@@ -113,6 +538,7 @@ def remove_executor(db: Session, task_id: int, exec_id: int) -> bool:
 
     # 2) удалить саму связь
     db.delete(link)
+    _touch_task(db, task_id)
     db.commit()
     return True
 
@@ -120,6 +546,7 @@ def remove_executor(db: Session, task_id: int, exec_id: int) -> bool:
 def create_beacon_coordinate(db: Session, bc_in: schemas.BeaconCoordinateCreate) -> models.BeaconCoordinate:
     """Создает запись координат маяка"""
     db_coord = models.BeaconCoordinate(
+        device_id=bc_in.device_id,
         latitude=bc_in.latitude,
         longitude=bc_in.longitude,
         recorded_at=bc_in.recorded_at
@@ -130,19 +557,96 @@ def create_beacon_coordinate(db: Session, bc_in: schemas.BeaconCoordinateCreate)
     return db_coord
 
 
-def get_latest_beacon_coordinate(db: Session) -> models.BeaconCoordinate | None:
-    """Возвращает последнюю запись координат маяка"""
-    return (
-        db.query(models.BeaconCoordinate)
-          .order_by(models.BeaconCoordinate.recorded_at.desc())
-          .first()
+def bulk_create_beacon_coordinates(
+    db: Session,
+    coords_in: Sequence[schemas.BeaconCoordinateCreate],
+) -> list[models.BeaconCoordinate]:
+    """
+    Записывает пачку точек одним многострочным INSERT и возвращает
+    сохранённые строки (с id) в порядке (device_id, recorded_at).
+    В MySQL нет RETURNING: LAST_INSERT_ID многострочного INSERT — id первой
+    строки, InnoDB выдаёт такому INSERT непрерывный диапазон; строки
+    дочитываются по этому диапазону (в т.ч. точки без устройства и повторы
+    одного момента — каждая вставленная строка возвращается ровно один раз).
+    """
+    if not coords_in:
+        return []
+    rows = []
+    for c in coords_in:
+        recorded_at = c.recorded_at
+        if recorded_at.tzinfo is not None:
+            # в БД время хранится как UTC без таймзоны
+            recorded_at = recorded_at.astimezone(timezone.utc).replace(tzinfo=None)
+        rows.append({
+            "device_id": c.device_id,
+            "latitude": c.latitude,
+            "longitude": c.longitude,
+            "recorded_at": recorded_at,
+        })
+    try:
+        first_id = db.execute(insert(models.BeaconCoordinate).values(rows)).lastrowid
+        saved = (
+            db.query(models.BeaconCoordinate)
+              .filter(models.BeaconCoordinate.id >= first_id,
+                      models.BeaconCoordinate.id < first_id + len(rows))
+              .order_by(models.BeaconCoordinate.id)
+              .all()
+        )
+        # проверка диапазона: в нём ровно наши строки в порядке пачки
+        if [(c.device_id, c.recorded_at) for c in saved] != [(r["device_id"], r["recorded_at"]) for r in rows]:
+            raise RuntimeError("id вставленных точек не образуют непрерывный диапазон")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return sorted(saved, key=lambda c: (c.device_id or 0, c.recorded_at, c.id))
+
+
+def get_beacon_timestamps(
+    db: Session,
+    device_id: int,
+    start: datetime,
+    end: datetime,
+) -> set[datetime]:
+    """Моменты recorded_at уже сохранённых точек устройства в [start, end) — для дедупликации"""
+    rows = db.query(models.BeaconCoordinate.recorded_at).filter(
+        models.BeaconCoordinate.device_id == device_id,
+        models.BeaconCoordinate.recorded_at >= start,
+        models.BeaconCoordinate.recorded_at < end,
     )
+    return {recorded_at for (recorded_at,) in rows}
+
+
+def get_latest_beacon_coordinate(db: Session, device_id: int | None = None) -> models.BeaconCoordinate | None:
+    """Возвращает последнюю запись координат маяка (всех устройств или только device_id)"""
+    q = db.query(models.BeaconCoordinate)
+    if device_id is not None:
+        q = q.filter(models.BeaconCoordinate.device_id == device_id)
+    return q.order_by(models.BeaconCoordinate.recorded_at.desc()).first()
 
 
 def get_all_geozones(db: Session) -> list[models.GeoZone]:
     """Возвращает список всех геозон"""
     return db.query(models.GeoZone).all()
 
+def get_nodes(db: Session) -> list[models.Node]:
+    """Все узлы Node по node_id"""
+    return db.query(models.Node).order_by(models.Node.node_id).all()
+
+
+def get_route_start_zone(db: Session) -> models.GeoZone | None:
+    """Геозона, откуда начинается маршрут: «start», а если её нет — «garage»"""
+    for zone_type in ("start", "garage"):
+        zone = (
+            db.query(models.GeoZone)
+              .filter(models.GeoZone.type == zone_type)
+              .order_by(models.GeoZone.zone_id)
+              .first()
+        )
+        if zone:
+            return zone
+    return None
+
 # --- GeofenceRule ---
 
 def get_geofence_rules(db: Session, skip: int = 0, limit: int = 100) -> list[models.GeofenceRule]:
@@ -196,6 +700,49 @@ def close_geozone_session(
         db.rollback()
         raise
 
+
+def get_geozone_sessions_overlapping(
+    db: Session, device_id: int | None, start: datetime, end: datetime,
+) -> list[models.GeozoneSession]:
+    """
+    Сессии устройства, пересекающиеся с [start, end): entry_time < end и
+    (exit_time IS NULL или exit_time >= start). Открытые — тоже.
+    """
+    return (
+        db.query(models.GeozoneSession)
+          .filter(
+              models.GeozoneSession.device_id == device_id,
+              models.GeozoneSession.entry_time < end,
+              or_(models.GeozoneSession.exit_time.is_(None),
+                  models.GeozoneSession.exit_time >= start),
+          )
+          .order_by(models.GeozoneSession.entry_time)
+          .all()
+    )
+
+
+def delete_geozone_sessions(db: Session, session_ids: Sequence[int]) -> int:
+    """
+    Удаляет закрытые сессии вместе с состояниями и историей визитов
+    (перед пересчётом истории). Открытые сессии из списка не трогаются —
+    их ведёт живой процессор. Без commit: вызывающий коммитит удаление
+    вместе с пересчитанными сессиями. Возвращает число удалённых сессий.
+    """
+    ids = [
+        sid for (sid,) in db.query(models.GeozoneSession.session_id).filter(
+            models.GeozoneSession.session_id.in_(session_ids),
+            models.GeozoneSession.status == 'closed',
+        )
+    ]
+    if not ids:
+        return 0
+    for model in (models.TaskVisitHistory, models.TaskVisitState):
+        db.query(model).filter(model.session_id.in_(ids)).delete(synchronize_session=False)
+    db.query(models.GeozoneSession).filter(
+        models.GeozoneSession.session_id.in_(ids)
+    ).delete(synchronize_session=False)
+    return len(ids)
+
 # --- TaskVisitState ---
 
 def get_task_visit_state(
@@ -246,6 +793,16 @@ def create_telegram_message(db: Session, chat_id: int, message_text: str, telegr
     db.refresh(db_message)
     return db_message
 
+def bulk_create_telegram_messages(db: Session, rows: list[dict]) -> None:
+    """
+    Пакетная запись отправленных сообщений одним INSERT
+    (rows — словари chat_id / message_text / telegram_message_id / sent_at).
+    """
+    if not rows:
+        return
+    db.bulk_insert_mappings(models.TelegramMessage, rows)
+    db.commit()
+
 def delete_telegram_message_by_id(db: Session, chat_id: int, message_id: int) -> bool:
     """Удаляет сообщение из базы данных по chat_id и message_id."""
     db_message = db.query(models.TelegramMessage).filter_by(chat_id=chat_id, message_id=message_id).first()
@@ -268,11 +825,14 @@ def list_daily_zone_statistics(
     db: Session,
     zone_id: Optional[int] = None,
     from_dt: Optional[datetime] = None,
-    to_dt:   Optional[datetime] = None
+    to_dt:   Optional[datetime] = None,
+    device_id: Optional[int] = None
 ) -> List[models.DailyZoneStatistics]:
     q = db.query(models.DailyZoneStatistics)
     if zone_id is not None:
         q = q.filter(models.DailyZoneStatistics.zone_id == zone_id)
+    if device_id is not None:
+        q = q.filter(models.DailyZoneStatistics.device_id == device_id)
     if from_dt is not None:
         q = q.filter(models.DailyZoneStatistics.stats_datetime >= from_dt)
     if to_dt is not None:
@@ -281,32 +841,85 @@ def list_daily_zone_statistics(
         models.DailyZoneStatistics.stats_datetime,
         models.DailyZoneStatistics.zone_id
     ).all()
-def get_beacon_coords_by_day(db: Session, day: datetime.date) -> list[models.BeaconCoordinate]:
+
+
+def replace_daily_zone_statistics(
+    db: Session,
+    stats_datetime: datetime,
+    device_id: Optional[int],
+    rows: list[dict],
+) -> int:
+    """
+    Заменяет статистику дня устройства: удаляет строки (stats_datetime, device_id)
+    и пишет rows одним INSERT в той же транзакции — пересчёт дня идемпотентен.
+    """
+    stats = models.DailyZoneStatistics
+    q = db.query(stats).filter(stats.stats_datetime == stats_datetime)
+    if device_id is None:
+        q = q.filter(stats.device_id.is_(None))
+    else:
+        q = q.filter(stats.device_id == device_id)
+    try:
+        removed = q.delete(synchronize_session=False)
+        if rows:
+            db.execute(insert(stats).values(rows))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return removed
+
+
+def get_beacon_coords_by_day(
+    db: Session,
+    day: datetime.date,
+    device_id: int | None = None,
+) -> list[models.BeaconCoordinate]:
+    """Точки за день: всех устройств или только device_id (индекс device_id, recorded_at)"""
     start = datetime.combine(day, datetime.min.time())
     end = start + timedelta(days=1)
-    return (
-        db.query(models.BeaconCoordinate)
-          .filter(
-            models.BeaconCoordinate.recorded_at >= start,
-            models.BeaconCoordinate.recorded_at < end,
-          )
-          .order_by(models.BeaconCoordinate.recorded_at)
-          .all()
+    q = db.query(models.BeaconCoordinate).filter(
+        models.BeaconCoordinate.recorded_at >= start,
+        models.BeaconCoordinate.recorded_at < end,
+    )
+    if device_id is not None:
+        q = q.filter(models.BeaconCoordinate.device_id == device_id)
+    return q.order_by(models.BeaconCoordinate.recorded_at).all()
+
+
+def get_beacon_track_rows_by_day(
+    db: Session,
+    day: datetime.date,
+    device_id: int | None = None,
+) -> list[tuple]:
+    """
+    Точки за день без ORM-объектов: (device_id, latitude, longitude, recorded_at)
+    по порядку (device_id, recorded_at) — для компактных кодировок трека.
+    """
+    BC = models.BeaconCoordinate
+    start = datetime.combine(day, datetime.min.time())
+    q = db.query(BC.device_id, BC.latitude, BC.longitude, BC.recorded_at).filter(
+        BC.recorded_at >= start,
+        BC.recorded_at < start + timedelta(days=1),
     )
+    if device_id is not None:
+        q = q.filter(BC.device_id == device_id)
+    return [tuple(r) for r in q.order_by(BC.device_id, BC.recorded_at, BC.id)]
 
 # В crud.py
 def get_executor_by_telegram_id(db: Session, telegram_id: int) -> models.Executor | None:
     return (
         db.query(models.Executor)
           .filter(models.Executor.id_telegram == telegram_id)
+          .options(raiseload("*"))
           .first()
     )
 #таблица с Абонентами
 def get_subscribers(db: Session) -> list[models.Subscriber]:
     """
-    Возвращает всех подписчиков
+    Возвращает всех подписчиков (без их задач)
     """
-    return db.query(models.Subscriber).all()
+    return db.query(models.Subscriber).options(raiseload("*")).all()
 
 def create_subscriber(db: Session, subscriber_in: schemas.SubscriberCreate) -> models.Subscriber:
     db_subscriber = models.Subscriber(**subscriber_in.model_dump())
@@ -341,7 +954,7 @@ def get_executor_work_times(
     Если указать exec_id, фильтруем по конкретному исполнителю.
     Если указать work_date, возвращаем только для конкретной даты.
     """
-    query = db.query(models.ExecutorWorkTime)
+    query = db.query(models.ExecutorWorkTime).options(raiseload("*"))
     if exec_id is not None:
         query = query.filter(models.ExecutorWorkTime.exec_id == exec_id)
     if work_date is not None:
@@ -45,6 +45,16 @@ SessionLocal = sessionmaker(
 Base = declarative_base()
 
 
+def init_db() -> None:
+    """
+    Создаёт недостающие таблицы. Вызывается явно при старте сервиса
+    (startup FastAPI, beacon_updater), а не при импорте модулей.
+    """
+    from . import models  # noqa: F401 — регистрирует модели в Base.metadata
+
+    Base.metadata.create_all(bind=engine)
+
+
 def get_db():
     """Зависимость для FastAPI — отдаёт сессию SQLAlchemy и гарантированно закрывает её."""
     db = SessionLocal()
@@ -0,0 +1,60 @@
+# app/dwell.py
+"""
+Векторный движок «самой длинной серии» нахождения у задач.
+
+Повторяет семантику прежнего цикла координаты × задачи × правила из
+visit_analysis.analyze_session, но считается массивами:
+
+  * правила отсортированы по radius_m; для точки и задачи «срабатывает»
+    первое правило, в радиус которого попала точка (break в старом цикле);
+  * для сработавшего правила серия продолжается (+1 точка);
+  * для правил с меньшим радиусом серия обрывается;
+  * правила с большим радиусом точку пропускают — их серия не растёт,
+    но и не сбрасывается;
+  * лучшей считается самая длинная серия, при равенстве — самая ранняя.
+"""
+from typing import Sequence
+
+import numpy as np
+
+
+def longest_dwell_runs(dist: np.ndarray, radii: Sequence[float]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    :param dist:  матрица расстояний (n_coords, n_tasks) в метрах, строки по времени
+    :param radii: радиусы правил по возрастанию (как order_by(GeofenceRule.radius_m))
+    :return: (best_run, best_start) формы (n_rules, n_tasks):
+             длина лучшей серии в точках и индекс её первой координаты (-1, если серии нет)
+    """
+    dist = np.asarray(dist, dtype=np.float64)
+    radii = np.asarray(radii, dtype=np.float64)
+    n_coords, n_tasks = dist.shape
+    best_run = np.zeros((radii.size, n_tasks), dtype=np.int64)
+    best_start = np.full((radii.size, n_tasks), -1, dtype=np.int64)
+    if not n_coords or not n_tasks:
+        return best_run, best_start
+
+    # индекс первого правила, в радиус которого попала точка (len(radii) — ни в одно)
+    first_rule = np.searchsorted(radii, dist, side="left")
+    rows = np.arange(n_coords)[:, None]
+    cols = np.arange(n_tasks)
+
+    for k in range(radii.size):
+        inc = first_rule == k
+        reset = first_rule > k
+
+        # длина текущей серии в каждой точке: число inc после последнего reset
+        count = np.cumsum(inc, axis=0)
+        base = np.maximum.accumulate(np.where(reset, count, 0), axis=0)
+        run = count - base
+
+        # argmax берёт первое вхождение максимума → самая ранняя из равных серий
+        at = run.argmax(axis=0)
+        longest = run[at, cols]
+
+        # начало серии — последняя точка до `at`, где серия стала равна 1
+        starts = np.maximum.accumulate(np.where(inc & (run == 1), rows, -1), axis=0)
+
+        best_run[k] = longest
+        best_start[k] = np.where(longest > 0, starts[at, cols], -1)
+
+    return best_run, best_start
@@ -0,0 +1,151 @@
+# app/geocode_cache.py
+"""
+Кэш ответов геокодера Яндекса.
+
+Два уровня:
+  * в памяти процесса — LRU на MEMORY_SIZE записей;
+  * на диске — локальная SQLite (переживает перезапуски), с TTL и
+    вытеснением давно не использованных записей сверх MAX_ROWS.
+
+Ключи — строки с префиксом вида запроса:
+  * обратное геокодирование — ячейка сетки ~CELL_M метров (reverse_key),
+    поэтому стоянки у одной базы или кафе попадают в одну запись;
+  * прямое геокодирование — нормализованный адрес (forward_key).
+Значения — любые JSON-совместимые объекты.
+"""
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.geodesy import METERS_PER_DEG
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.getenv(
+    "GEOCODE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "geocode_cache.sqlite3"),
+)
+TTL_SEC = float(os.getenv("GEOCODE_CACHE_TTL_DAYS", "90")) * 86400
+MAX_ROWS = int(os.getenv("GEOCODE_CACHE_MAX_ROWS", "100000"))
+MEMORY_SIZE = 2048
+# Размер ячейки для обратного геокодирования (метры)
+CELL_M = 25.0
+
+
+def reverse_key(lat: float, lon: float, cell_m: float = CELL_M) -> str:
+    """Ключ ячейки сетки ~cell_m × cell_m метров, в которую попала точка."""
+    cell_lat = cell_m / METERS_PER_DEG
+    i = math.floor(lat / cell_lat)
+    # шаг по долготе — по широте ряда ячеек, чтобы ячейка была «квадратной»
+    cell_lon = cell_lat / max(math.cos(math.radians(i * cell_lat)), 0.01)
+    j = math.floor(lon / cell_lon)
+    return f"rev:{cell_m:g}:{i}:{j}"
+
+
+def normalize_address(address: str) -> str:
+    """Нижний регистр, ё→е, без кавычек, единый вид пробелов и запятых."""
+    addr = address.lower().replace("ё", "е")
+    addr = re.sub(r"[\"'«»]", "", addr)
+    addr = re.sub(r"\s*([,;])\s*", r"\1 ", addr)
+    addr = re.sub(r"\s+", " ", addr)
+    return addr.strip(" ,;")
+
+
+def forward_key(address: str) -> str:
+    return f"fwd:{normalize_address(address)}"
+
+
+class GeocodeCache:
+    def __init__(self, path: str = CACHE_PATH, ttl_sec: float = TTL_SEC,
+                 max_rows: int = MAX_ROWS, memory_size: int = MEMORY_SIZE):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self.max_rows = max_rows
+        self.memory_size = memory_size
+        self._memory: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        """Соединение с SQLite (открывается лениво; вызывать под self._lock)."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS geocode_cache (
+                    key        TEXT PRIMARY KEY,
+                    value      TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    used_at    REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_geocode_cache_used_at ON geocode_cache (used_at)")
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, key: str, created_at: float, value: Any) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Значение из кэша или None (нет записи или истёк TTL)."""
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None and now - hit[0] <= self.ttl_sec:
+                self._memory.move_to_end(key)
+                return hit[1]
+            try:
+                db = self._db()
+                row = db.execute(
+                    "SELECT value, created_at FROM geocode_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                value, created_at = row
+                if now - created_at > self.ttl_sec:
+                    db.execute("DELETE FROM geocode_cache WHERE key = ?", (key,))
+                    self._memory.pop(key, None)
+                    return None
+                db.execute("UPDATE geocode_cache SET used_at = ? WHERE key = ?", (now, key))
+            except sqlite3.Error as err:
+                logger.warning("Кэш геокодера недоступен: %s", err)
+                return None
+            value = json.loads(value)
+            self._remember(key, created_at, value)
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            try:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO geocode_cache (key, value, created_at, used_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now, now),
+                )
+                # LRU: оставляем max_rows самых свежих по использованию
+                db.execute(
+                    "DELETE FROM geocode_cache WHERE key IN ("
+                    " SELECT key FROM geocode_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_rows,),
+                )
+            except sqlite3.Error as err:
+                logger.warning("Не удалось записать в кэш геокодера: %s", err)
+
+
+# общий кэш процесса (SQLite открывается при первом обращении)
+geocode_cache = GeocodeCache()
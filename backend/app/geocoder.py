@@ -0,0 +1,101 @@
+# app/geocoder.py
+"""
+Прямое геокодирование адресов (Яндекс) с кэшем и пакетным режимом.
+
+geocode_many() нормализует и дедуплицирует адреса, берёт уже известные
+координаты из app.geocode_cache, а остальные запрашивает параллельно
+(пул потоков + общий token bucket вместо фиксированного time.sleep).
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional, Tuple
+
+import requests
+from dotenv import load_dotenv
+
+from app.geocode_cache import forward_key, geocode_cache
+from app.rate_limit import TokenBucket
+
+load_dotenv()
+
+YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")
+GEOCODE_URL = "https://geocode-maps.yandex.ru/1.x/"
+
+# Частота запросов к геокодеру (в секунду) и число параллельных запросов
+GEOCODE_RATE = float(os.getenv("GEOCODE_RATE", "5"))
+GEOCODE_WORKERS = int(os.getenv("GEOCODE_WORKERS", "4"))
+
+logger = logging.getLogger(__name__)
+
+LatLon = Tuple[Optional[float], Optional[float]]
+
+http = requests.Session()
+bucket = TokenBucket(GEOCODE_RATE, capacity=GEOCODE_WORKERS)
+
+
+def geocode_yandex(address: str) -> LatLon:
+    """
+    Запрос к геокодеру без кэша.
+    Возвращает (lat, lon) или (None, None) если не найдено.
+    """
+    bucket.acquire()
+    params = {
+        "apikey": YANDEX_API_KEY,
+        "format": "json",
+        "geocode": address
+    }
+    resp = http.get(GEOCODE_URL, params=params, timeout=(5, 15))
+    resp.raise_for_status()
+    members = resp.json()["response"]["GeoObjectCollection"]["featureMember"]
+    if not members:
+        return None, None
+    lon, lat = map(float, members[0]["GeoObject"]["Point"]["pos"].split())
+    return lat, lon
+
+
+def geocode_cached(address: str) -> LatLon:
+    """geocode_yandex с кэшем; в кэш попадают только найденные адреса."""
+    key = forward_key(address)
+    cached = geocode_cache.get(key)
+    if cached is not None:
+        return cached[0], cached[1]
+    lat, lon = geocode_yandex(address)
+    if lat is not None:
+        geocode_cache.put(key, [lat, lon])
+    return lat, lon
+
+
+def geocode_many(addresses: Iterable[str], workers: int = GEOCODE_WORKERS) -> list[LatLon]:
+    """
+    Геокодирует список адресов; результат — в том же порядке.
+    Ошибки запроса по отдельному адресу логируются и дают (None, None).
+    """
+    addresses = list(addresses)
+    unique: dict[str, str] = {}
+    for addr in addresses:
+        unique.setdefault(forward_key(addr), addr)
+
+    resolved: dict[str, LatLon] = {}
+    missing: list[str] = []
+    for key, addr in unique.items():
+        cached = geocode_cache.get(key)
+        if cached is not None:
+            resolved[key] = (cached[0], cached[1])
+        else:
+            missing.append(key)
+
+    def fetch(key: str) -> LatLon:
+        try:
+            return geocode_cached(unique[key])
+        except (requests.RequestException, KeyError, ValueError) as e:
+            logger.error(f"Ошибка геокодирования «{unique[key]}»: {e}")
+            return None, None
+
+    if missing:
+        logger.info(f"Геокодирование: {len(unique) - len(missing)} из кэша, {len(missing)} запросов")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for key, coords in zip(missing, pool.map(fetch, missing)):
+                resolved[key] = coords
+
+    return [resolved[forward_key(addr)] for addr in addresses]
@@ -0,0 +1,90 @@
+# app/geodesy.py
+"""
+Единое геодезическое ядро: расстояния по формуле Haversine.
+
+Скалярная `haversine` — для одиночных проверок, векторные функции
+работают с массивами координат NumPy и используются во всех «горячих»
+циклах аналитики (маяк × задачи, маяк × зоны, соседние точки трека).
+Все расстояния — в метрах.
+"""
+import math
+from typing import Iterable, Sequence
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+
+# Метров в одном градусе дуги большого круга
+METERS_PER_DEG = EARTH_RADIUS_M * math.pi / 180
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние между двумя точками (метры), формула Haversine."""
+    φ1, φ2 = math.radians(lat1), math.radians(lat2)
+    dφ = math.radians(lat2 - lat1)
+    dλ = math.radians(lon2 - lon1)
+    a = math.sin(dφ / 2) ** 2 + math.cos(φ1) * math.cos(φ2) * math.sin(dλ / 2) ** 2
+    return EARTH_RADIUS_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def bounding_box(lat: float, lon: float, radius_m: float) -> tuple[float, float, float, float]:
+    """
+    Описанный прямоугольник круга (min_lat, max_lat, min_lon, max_lon) в градусах.
+    Гарантированно содержит все точки, для которых haversine(...) <= radius_m.
+    """
+    dlat = radius_m / METERS_PER_DEG * 1.001
+    # долготный градус короче всего на самой «полярной» кромке круга
+    edge = min(abs(lat) + dlat, 89.9)
+    dlon = min(dlat / math.cos(math.radians(edge)), 180.0)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def _haversine_rad(φ1, λ1, φ2, λ2) -> np.ndarray:
+    """Векторная Haversine по координатам в радианах (с broadcasting)."""
+    dφ = φ2 - φ1
+    dλ = λ2 - λ1
+    a = np.sin(dφ / 2) ** 2 + np.cos(φ1) * np.cos(φ2) * np.sin(dλ / 2) ** 2
+    # a может чуть выйти за [0, 1] из-за погрешностей округления
+    a = np.clip(a, 0.0, 1.0)
+    return EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def as_arrays(lats: Iterable[float], lons: Iterable[float]) -> tuple[np.ndarray, np.ndarray]:
+    """Приводит последовательности широт/долгот к массивам float64."""
+    return np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+
+
+def points_to_arrays(points: Sequence, lat_attr: str = "latitude", lon_attr: str = "longitude"):
+    """
+    Достаёт координаты из списка ORM-объектов (BeaconCoordinate, Task, …).
+    Для задач: points_to_arrays(tasks, "lat", "lng").
+    """
+    lats = np.fromiter((getattr(p, lat_attr) for p in points), dtype=np.float64, count=len(points))
+    lons = np.fromiter((getattr(p, lon_attr) for p in points), dtype=np.float64, count=len(points))
+    return lats, lons
+
+
+def distances_to_point(lats, lons, lat: float, lon: float) -> np.ndarray:
+    """Один-ко-многим: расстояния от каждой точки массива до (lat, lon). Форма (n,)."""
+    lats, lons = as_arrays(lats, lons)
+    return _haversine_rad(
+        np.radians(lats), np.radians(lons),
+        math.radians(lat), math.radians(lon),
+    )
+
+
+def distance_matrix(lats1, lons1, lats2, lons2) -> np.ndarray:
+    """Многие-ко-многим: матрица расстояний формы (n1, n2)."""
+    lats1, lons1 = as_arrays(lats1, lons1)
+    lats2, lons2 = as_arrays(lats2, lons2)
+    return _haversine_rad(
+        np.radians(lats1)[:, None], np.radians(lons1)[:, None],
+        np.radians(lats2)[None, :], np.radians(lons2)[None, :],
+    )
+
+
+def consecutive_distances(lats, lons) -> np.ndarray:
+    """Попарно соседние точки трека: d[i] = dist(p[i], p[i+1]). Форма (n-1,)."""
+    lats, lons = as_arrays(lats, lons)
+    φ, λ = np.radians(lats), np.radians(lons)
+    return _haversine_rad(φ[:-1], λ[:-1], φ[1:], λ[1:])
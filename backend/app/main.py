@@ -1,10 +1,12 @@
 # app/main.py
-from fastapi import FastAPI, Depends, Query, Header, HTTPException
+from fastapi import FastAPI, Depends, Query, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi import APIRouter
 from sqlalchemy.orm import Session
-from datetime import datetime, date
-from . import db, crud, models, schemas
+from datetime import datetime, date, time
+from typing import Literal
+from . import db, crud, models, schemas, route_planner, track_encoding, travel_matrix
 import logging, sys, traceback
 from analytics.compute_overdue import compute_overdue as overdue_stats
 
@@ -29,10 +31,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# 3) Регистрируем все модели в БД (если нужно)
-models.Base.metadata.create_all(bind=db.engine)
+# 3) Регистрируем все модели в БД (если нужно) — при старте, а не при импорте
+@app.on_event("startup")
+def on_startup():
+    db.init_db()
 
 # 4) Зависимость для работы с сессией
 def get_db():
@@ -49,9 +54,54 @@ def ping():
     return {"status": "pong"}
 
 # — TASKS —
+TASKS_PAGE_SIZE = 500
+TASKS_MAX_LIMIT = 1000
+
 @app.get("/tasks", response_model=list[schemas.Task])
-def read_tasks(db_sess: Session = Depends(get_db)):
-    return crud.get_tasks(db_sess)
+def read_tasks(
+    response: Response,
+    cursor: str | None = Query(None, description="Курсор из заголовка X-Next-Cursor"),
+    limit: int = Query(TASKS_PAGE_SIZE, ge=1, le=TASKS_MAX_LIMIT, description="Размер страницы"),
+    status: list[Literal["scheduled", "in_progress", "done", "cancelled"]] = Query([]),
+    type: list[Literal["connection", "service", "incident"]] = Query([]),
+    priority: list[Literal["A", "B", "C"]] = Query([]),
+    exec_id: int | None = Query(None),
+    date_from: datetime | None = Query(None, description="planned_start >= date_from"),
+    date_to: datetime | None = Query(None, description="planned_start < date_to"),
+    contract_number: str | None = Query(None),
+    db_sess: Session = Depends(get_db),
+):
+    """
+    Задачи по порядку (planned_start, task_id), постранично (limit, по
+    умолчанию TASKS_PAGE_SIZE): если есть следующая страница, её курсор
+    приходит в заголовке X-Next-Cursor.
+    """
+    try:
+        tasks, next_cursor = crud.get_tasks(
+            db_sess, cursor=cursor, limit=limit,
+            statuses=status, types=type, priorities=priority, exec_id=exec_id,
+            date_from=date_from, date_to=date_to, contract_number=contract_number,
+        )
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return tasks
+
+@app.get("/tasks/changes", response_model=schemas.TaskChanges)
+def read_task_changes(
+    since: str | None = Query(None, description="Токен из предыдущего ответа (без него — все задачи)"),
+    db_sess: Session = Depends(get_db),
+):
+    """
+    Дельта-синхронизация: задачи, созданные или изменённые после токена,
+    и id удалённых. Токен для следующего запроса — в поле since ответа.
+    """
+    try:
+        tasks, deleted, next_since = crud.get_task_changes(db_sess, since)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    return {"tasks": tasks, "deleted": deleted, "since": next_since}
 
 from fastapi import HTTPException
 
@@ -73,6 +123,45 @@ def add_task(
 
 
 
+TASKS_BULK_MAX = 2000
+
+
+def _check_bulk_size(items: list) -> None:
+    if len(items) > TASKS_BULK_MAX:
+        raise HTTPException(413, detail=f"Не больше {TASKS_BULK_MAX} задач за запрос")
+
+
+@app.post("/tasks/bulk", response_model=list[schemas.Task])
+def add_tasks_bulk(
+    tasks: list[schemas.TaskCreate],
+    user_id: int | None = Header(None, alias="X-User-Id"),
+    db_sess: Session = Depends(get_db),
+):
+    """
+    Пакетное создание задач одной транзакцией. Если хоть одна строка
+    не прошла проверку — 422 со списком ошибок по индексам, ничего не записано.
+    """
+    _check_bulk_size(tasks)
+    try:
+        return crud.bulk_create_tasks(db_sess, tasks, user_id)
+    except crud.BulkTaskError as e:
+        raise HTTPException(422, detail=e.errors)
+
+
+@app.patch("/tasks/bulk", response_model=list[schemas.Task])
+def edit_tasks_bulk(
+    tasks: list[schemas.TaskBulkUpdate],
+    user_id: int | None = Header(None, alias="X-User-Id"),
+    db_sess: Session = Depends(get_db),
+):
+    """Пакетное обновление задач (только переданные поля) одной транзакцией"""
+    _check_bulk_size(tasks)
+    try:
+        return crud.bulk_update_tasks(db_sess, tasks, user_id)
+    except crud.BulkTaskError as e:
+        raise HTTPException(422, detail=e.errors)
+
+
 @app.put("/tasks/{task_id}", response_model=schemas.Task)
 def edit_task(
     task_id: int,
@@ -114,15 +203,113 @@ def remove_task_executor(task_id: int, exec_id: int, db_sess: Session = Depends(
     if not ok:
         raise HTTPException(404, "Assignment not found")
 
+# — ROUTES —
+@app.get("/routes/plan", response_model=list[schemas.RoutePlan])
+def plan_routes(
+    day: date = Query(..., description="Дата в формате YYYY-MM-DD"),
+    exec_id: int | None = Query(None, description="ID исполнителя (необязательно)"),
+    start_at: time = Query(time(8, 0), description="Время выезда HH:MM"),
+    start_lat: float | None = Query(None, description="Точка старта (по умолчанию — геозона start/garage)"),
+    start_lng: float | None = Query(None),
+    db_sess: Session = Depends(get_db),
+):
+    """
+    Порядок объезда незавершённых задач дня для каждого исполнителя
+    (задача с несколькими исполнителями попадает в маршрут каждого).
+    Время в пути — из travel_times для точек, совпадающих с узлами Node,
+    остальное — оценка по прямой.
+    """
+    if (start_lat is None) != (start_lng is None):
+        raise HTTPException(400, detail="start_lat и start_lng задаются вместе")
+    if start_lat is None:
+        zone = crud.get_route_start_zone(db_sess)
+        if zone is None:
+            raise HTTPException(400, detail="Нет геозоны start/garage — передайте start_lat/start_lng")
+        start_lat, start_lng = zone.center_lat, zone.center_lon
+    start_time = datetime.combine(day, start_at)
+    bucket = travel_matrix.time_bucket(start_time)
+
+    groups: dict[int | None, list[models.Task]] = {}
+    for task in crud.get_open_tasks_for_day(db_sess, day, exec_id):
+        ids = [e.exec_id for e in task.executors] or [None]
+        for eid in ids:
+            if exec_id is None or eid == exec_id:
+                groups.setdefault(eid, []).append(task)
+
+    plans = []
+    for eid, tasks in sorted(groups.items(), key=lambda kv: (kv[0] is None, kv[0] or 0)):
+        travel = route_planner.stored_travel_matrix(
+            db_sess, [start_lat] + [t.lat for t in tasks], [start_lng] + [t.lng for t in tasks], bucket,
+        )
+        stops = route_planner.plan_tasks(tasks, (start_lat, start_lng), start_time, travel)
+        plans.append(schemas.RoutePlan(
+            exec_id=eid,
+            start_time=start_time,
+            total_travel_sec=sum(s["travel_sec"] for s in stops),
+            total_late_sec=sum(s["late_sec"] for s in stops),
+            stops=stops,
+        ))
+    return plans
+
+@app.get("/routes/nodes", response_model=schemas.NodeRoutePlan)
+def plan_node_route(
+    day: date = Query(..., description="Дата в формате YYYY-MM-DD"),
+    start_at: time = Query(time(8, 0), description="Время выезда HH:MM"),
+    db_sess: Session = Depends(get_db),
+):
+    """
+    Порядок объезда незавершённых узлов Node от узла is_start до is_end
+    по матрице travel_times слота времени выезда.
+    """
+    start_time = datetime.combine(day, start_at)
+    bucket = travel_matrix.time_bucket(start_time)
+    stops = route_planner.plan_nodes(db_sess, crud.get_nodes(db_sess), start_time, bucket)
+    return schemas.NodeRoutePlan(
+        start_time=start_time,
+        time_bucket=bucket,
+        total_travel_sec=sum(s["travel_sec"] for s in stops),
+        total_late_sec=sum(s["late_sec"] for s in stops),
+        stops=stops,
+    )
+
 # — остальное (nodes, zones, beacon, parking) оставляем без изменений —
 @app.get("/beacon-coordinates", response_model=list[schemas.BeaconCoordinate])
 def read_beacon_coords_by_day(
-    date_str: str = Query(..., regex=r"^\d{4}-\d{2}-\d{2}$", description="Дата в формате YYYY-MM-DD"),
+    date_str: str = Query(..., pattern=r"^\d{4}-\d{2}-\d{2}$", description="Дата в формате YYYY-MM-DD"),
+    device_id: int | None = Query(None, description="Устройство StarLine (по умолчанию — все)"),
+    format: Literal["json", "polyline", "columnar"] | None = Query(
+        None, description="Кодировка ответа; по умолчанию — по заголовку Accept, иначе json"
+    ),
+    accept: str | None = Header(None),
     db_sess: Session = Depends(get_db),
 ):
+    """
+    Точки за день. Кроме списка объектов — компактные кодировки трека
+    (см. app.track_encoding): ?format=polyline|columnar или Accept с их media type.
+    """
     # дата будет в правильном формате
     day = datetime.strptime(date_str, "%Y-%m-%d").date()
-    return crud.get_beacon_coords_by_day(db_sess, day)
+    if format is None and accept:
+        if track_encoding.POLYLINE_MEDIA_TYPE in accept:
+            format = "polyline"
+        elif track_encoding.COLUMNAR_MEDIA_TYPE in accept:
+            format = "columnar"
+
+    if format == "polyline":
+        rows = crud.get_beacon_track_rows_by_day(db_sess, day, device_id)
+        return JSONResponse(
+            track_encoding.encode_polyline_tracks(rows),
+            media_type=track_encoding.POLYLINE_MEDIA_TYPE,
+            headers={"Vary": "Accept"},
+        )
+    if format == "columnar":
+        rows = crud.get_beacon_track_rows_by_day(db_sess, day, device_id)
+        return Response(
+            track_encoding.encode_columnar_tracks(rows),
+            media_type=track_encoding.COLUMNAR_MEDIA_TYPE,
+            headers={"Vary": "Accept"},
+        )
+    return crud.get_beacon_coords_by_day(db_sess, day, device_id)
 
 
 @app.get("/me", response_model=schemas.Executor)
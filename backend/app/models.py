@@ -12,7 +12,7 @@ from sqlalchemy import (
     ForeignKey,
     text,
     BigInteger,
-
+    Index,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.mysql import DOUBLE
@@ -45,17 +45,19 @@ class Executor(Base):
         default = "user",
                          )
 
+    # Связи ленивые: что подгружать (selectinload / raiseload), решает
+    # каждый запрос в crud под свою схему ответа — без каскада JOIN.
     tasks = relationship(
         "Task",
         secondary="task_executors",
         back_populates="executors",
-        lazy="joined",
+        lazy="select",
     )
     work_times = relationship(
         "ExecutorWorkTime",
         back_populates="executor",
         cascade="all, delete-orphan",
-        lazy="joined",
+        lazy="select",
     )
 
 # ─── Новая модель для хранения рабочего времени исполнителя по дням ────────
@@ -95,12 +97,16 @@ class ExecutorWorkTime(Base):
     executor = relationship(
         "Executor",
         back_populates="work_times",
-        lazy="joined",
+        lazy="select",
     )
 
 # ─── Pivot task_executors ────────────────────────────────────────────────────
 class TaskExecutor(Base):
     __tablename__ = "task_executors"
+    __table_args__ = (
+        # фильтр задач по исполнителю (crud.get_tasks, exec_id)
+        Index("ix_task_executors_exec_task", "exec_id", "task_id"),
+    )
 
     task_id = Column(
         Integer,
@@ -132,8 +138,26 @@ class Node(Base):
     is_start    = Column(Boolean, default=False)
     is_end      = Column(Boolean, default=False)
 
+# ─── Матрица времени в пути между узлами ────────────────────────────────────
+class TravelTime(Base):
+    __tablename__ = "travel_times"
+
+    from_id     = Column(Integer, ForeignKey("nodes.node_id", ondelete="CASCADE"), primary_key=True)
+    to_id       = Column(Integer, ForeignKey("nodes.node_id", ondelete="CASCADE"), primary_key=True)
+    # слот времени суток (см. app.travel_matrix.time_bucket): пробки днём и ночью разные
+    time_bucket = Column(SmallInteger, primary_key=True, default=0)
+    travel_sec  = Column(Integer, nullable=False)
+    fetched_at  = Column(DateTime, default=datetime.utcnow, nullable=False)
+
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # bbox-префильтр задач по геозоне (см. crud.get_tasks_in_radius)
+        Index("ix_tasks_lat_lng", "lat", "lng"),
+        # keyset-пагинация GET /tasks: порядок (planned_start, task_id)
+        Index("ix_tasks_planned_start_id", "planned_start", "task_id"),
+        Index("ix_tasks_status_planned_start_id", "status", "planned_start", "task_id"),
+    )
 
     task_id = Column(
         Integer,
@@ -229,13 +253,14 @@ class Task(Base):
         default=datetime.utcnow,
         onupdate=datetime.utcnow,
         nullable=False,
+        index=True,
     )
 
     executors = relationship(
         "Executor",
         secondary="task_executors",
         back_populates="tasks",
-        lazy="joined",
+        lazy="select",
     )
 
     contract_number = Column(
@@ -247,14 +272,34 @@ class Task(Base):
     subscriber = relationship(
         "Subscriber",
         back_populates="tasks",
-        lazy="joined",
+        lazy="select",
+    )
+
+# ─── TaskTombstone ──────────────────────────────────────────────────────────
+class TaskTombstone(Base):
+    """Отметка об удалённой задаче для дельта-синхронизации (GET /tasks/changes)"""
+    __tablename__ = "task_tombstones"
+
+    # id задач не переиспользуются (AUTO_INCREMENT), поэтому без FK
+    task_id    = Column(Integer, primary_key=True)
+    deleted_at = Column(
+        DateTime,
+        default=datetime.utcnow,
+        nullable=False,
+        index=True,
     )
 
 # ─── BeaconCoordinate ───────────────────────────────────────────────────────
 class BeaconCoordinate(Base):
     __tablename__ = "beacon_coordinates"
+    __table_args__ = (
+        # трек одного устройства за период
+        Index("ix_beacon_coordinates_device_recorded", "device_id", "recorded_at"),
+    )
 
     id          = Column(Integer, primary_key=True, index=True)
+    # device_id StarLine; NULL — точки, записанные до поддержки нескольких машин
+    device_id   = Column(BigInteger, nullable=True)
     latitude    = Column(DOUBLE(asdecimal=False), nullable=False)
     longitude   = Column(DOUBLE(asdecimal=False), nullable=False)
     recorded_at = Column(
@@ -297,8 +342,12 @@ class GeofenceRule(Base):
 
 class GeozoneSession(Base):
     __tablename__ = "geozone_session"
+    __table_args__ = (
+        Index("ix_geozone_session_device_zone_status", "device_id", "zone_id", "status"),
+    )
     session_id = Column(Integer, primary_key=True, index=True)
     zone_id    = Column(Integer, ForeignKey("geo_zones.zone_id"), nullable=False)
+    device_id  = Column(BigInteger, nullable=True)
     entry_time = Column(DateTime, nullable=False)
     exit_time  = Column(DateTime, nullable=True)
     entry_lat  = Column(DOUBLE, nullable=False)
@@ -354,9 +403,14 @@ class TelegramMessage(Base):
 
 class DailyZoneStatistics(Base):
     __tablename__ = "daily_zone_statistics"
+    __table_args__ = (
+        # пересчёт дня заменяет строки по (stats_datetime, device_id)
+        Index("ix_daily_zone_statistics_day_device", "stats_datetime", "device_id"),
+    )
 
     stats_id        = Column(Integer, primary_key=True, index=True)
     zone_id         = Column(Integer, nullable=False, index=True)
+    device_id       = Column(BigInteger, nullable=True)
     stats_datetime  = Column(DateTime, nullable=False)
     start_time      = Column(DateTime, nullable=False)
     end_time        = Column(DateTime, nullable=False)
@@ -411,4 +465,4 @@ class Subscriber(Base):
         default="active",
     )
 
-    tasks = relationship("Task", back_populates="subscriber", lazy="joined")
\ No newline at end of file
+    tasks = relationship("Task", back_populates="subscriber", lazy="select")
\ No newline at end of file
@@ -0,0 +1,46 @@
+# app/rate_limit.py
+"""
+Потокобезопасный token bucket для внешних API (Telegram, геокодер, TomTom).
+
+Ведро ёмкостью `capacity` пополняется со скоростью `rate` токенов в секунду;
+acquire() забирает токен, а если ведро пусто — спит ровно столько,
+сколько нужно до следующего токена.
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """
+        :param rate:     токенов в секунду (средняя частота запросов)
+        :param capacity: размер «всплеска» — сколько запросов можно сделать подряд
+        """
+        if rate <= 0:
+            raise ValueError("rate должен быть > 0")
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Блокирует поток, пока не наберётся `tokens` токенов."""
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Обнуляет ведро на `seconds` секунд (ответ 429 с retry_after)."""
+        with self._lock:
+            self._tokens = -seconds * self.rate
+            self._updated = time.monotonic()
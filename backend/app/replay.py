@@ -0,0 +1,487 @@
+# app/replay.py
+"""
+Прогон real-time аналитики по истории (replay).
+
+ReplayEngine проводит точки beacon_coordinates за период через ту же
+логику, что и RealTimeProcessor (въезд/выезд/перескок между зонами,
+сессии только для зон 'territory', стоянки на пути, оценка визитов
+visit_analysis.evaluate_session), но без побочных эффектов: результаты
+уходят в приёмник (sink), а не в Telegram и построчные commit.
+
+Быстрее живого процессора за счёт того, что:
+  * точки читаются только нужными колонками, окнами по CHUNK;
+  * зоны размечаются векторно (ZoneIndex.classify + zone_runs), по
+    отдельности обрабатываются только точки смены зоны и точки пути;
+  * правила и зоны загружаются один раз на прогон, задачи — один раз
+    на период (по окну задачи, а не по текущему статусу);
+  * геокодирование стоянок не выполняется.
+
+Приёмники:
+  * DryRunSink   — только счётчики (подбор порогов GeofenceRule);
+  * CollectSink  — всё в списки, для анализа в коде/ноутбуке;
+  * BulkWriteSink — заменяет сессии и историю визитов периода в БД,
+    один commit на пачку сессий.
+
+Правила можно подменить: ReplayEngine(db, rules=[...]) — любые объекты с
+rule_id, radius_m, dwell_minutes, confidence.
+
+Запуск (из каталога backend):
+    python -m app.replay --from 2026-07-01 --to 2026-09-30 [--device 123] [--write]
+"""
+import argparse
+import logging
+import time as monotonic_time
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, Optional, Sequence
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+import app.crud as crud
+from app.db import SessionLocal
+from app.detect_stops import new_stop_detector
+from app.models import BeaconCoordinate, GeofenceRule, GeoZone, GeozoneSession, Task, TaskVisitHistory
+from app.spatial_index import ZoneIndex, task_index, zone_runs
+from app.stop_detector import STOP_CLOSED
+from app.visit_analysis import evaluate_session
+
+logger = logging.getLogger(__name__)
+
+IRKUTSK = ZoneInfo('Asia/Irkutsk')
+
+# Окно чтения точек из БД
+CHUNK = timedelta(days=1)
+# Сессий на одну пачку записи BulkWriteSink
+WRITE_BATCH = 500
+# Запас вокруг периода при выборе задач по planned_start/due_datetime/actual_end
+TASK_WINDOW_MARGIN = timedelta(days=1)
+# Шаг recorded_at: конец периода сдвигается на него за exit_time, чтобы
+# точка выезда попала в прогон
+POINT_STEP = timedelta(seconds=1)
+
+
+def utc_naive(dt: datetime) -> datetime:
+    """Время в формате beacon_coordinates.recorded_at (UTC без таймзоны)."""
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+# ——— Приёмники ———————————————————————————————————————————————————————
+
+class ReplaySink:
+    """
+    Базовый приёмник: session() — закрытая сессия территории со своими
+    stops/visits, stop() — стоянка на пути. begin() вызывается перед
+    прогоном устройства за период и возвращает период, который реально
+    прогоняется; end() — после успешного прогона устройства; close() —
+    в конце прогона (в том числе после ошибки).
+    """
+    def begin(self, device_id: Optional[int], start: datetime,
+              end: datetime) -> tuple[datetime, datetime]:
+        return start, end
+
+    def end(self, device_id: Optional[int]) -> None:
+        pass
+
+    def session(self, rec: dict) -> None:
+        pass
+
+    def stop(self, rec: dict) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class DryRunSink(ReplaySink):
+    """Только счётчики."""
+    def __init__(self):
+        self.sessions = 0
+        self.visits = 0
+        self.confirmed = 0
+        self.zone_stops = 0
+        self.travel_stops = 0
+
+    def session(self, rec: dict) -> None:
+        self.sessions += 1
+        self.visits += len(rec['visits'])
+        self.confirmed += sum(v['result'] == 'confirmed' for v in rec['visits'])
+        self.zone_stops += len(rec['stops'])
+
+    def stop(self, rec: dict) -> None:
+        self.travel_stops += 1
+
+    def summary(self) -> str:
+        return (
+            f"сессий {self.sessions}, визитов {self.visits} (подтверждено {self.confirmed}), "
+            f"стоянок в зонах {self.zone_stops}, на пути {self.travel_stops}"
+        )
+
+
+class CollectSink(ReplaySink):
+    """Складывает результаты в списки sessions / stops."""
+    def __init__(self):
+        self.sessions: list[dict] = []
+        self.stops: list[dict] = []
+
+    def session(self, rec: dict) -> None:
+        self.sessions.append(rec)
+
+    def stop(self, rec: dict) -> None:
+        self.stops.append(rec)
+
+
+class BulkWriteSink(ReplaySink):
+    """
+    Пишет закрытые сессии и историю визитов в БД пачками.
+    Перед прогоном устройства удаляет его закрытые сессии, пересекающиеся
+    с периодом, — повторный прогон идемпотентен. Период расширяется до
+    въезда первой и выезда последней такой сессии (чтобы пересчитать их
+    целиком) и обрезается по въезду открытой сессии: живой хвост ведёт
+    RealTimeProcessor. Удаление и запись сессий устройства — одна
+    транзакция (commit в end()), после ошибки close() её откатывает.
+    Поля detected_* задач не трогаются.
+    """
+    def __init__(self, db: Session, batch_size: int = WRITE_BATCH):
+        self.db = db
+        self.batch_size = batch_size
+        self._pending: list[dict] = []
+        self._device_written = 0
+        self.written = 0
+
+    def begin(self, device_id: Optional[int], start: datetime,
+              end: datetime) -> tuple[datetime, datetime]:
+        closed: dict[int, GeozoneSession] = {}
+        while True:
+            sessions = crud.get_geozone_sessions_overlapping(self.db, device_id, start, end)
+            live = [s.entry_time for s in sessions if s.status == 'open']
+            if live and min(live) < end:
+                end = min(live)
+                logger.info("⏸ Устройство %s: открытая сессия с %s — пересчёт до неё", device_id, end)
+            closed.update(
+                (s.session_id, s) for s in sessions if s.status == 'closed' and s.entry_time < end
+            )
+            # соседние сессии (перескок между зонами) тоже попадают в расширенный период
+            new_start = min([start] + [s.entry_time for s in closed.values()])
+            new_end = max([end] + [s.exit_time + POINT_STEP for s in closed.values()])
+            if live:
+                new_end = min(new_end, min(live))
+            if (new_start, new_end) == (start, end):
+                break
+            start, end = new_start, new_end
+        if end <= start:
+            return start, start
+        removed = crud.delete_geozone_sessions(self.db, list(closed))
+        logger.info("🧹 Устройство %s: к пересчёту сессий %s (%s — %s)", device_id, removed, start, end)
+        self._device_written = 0
+        return start, end
+
+    def session(self, rec: dict) -> None:
+        self._pending.append(rec)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Отправляет пачку сессий в БД (без commit — он в end())."""
+        if not self._pending:
+            return
+        rows = []
+        for rec in self._pending:
+            sess = GeozoneSession(
+                zone_id=rec['zone_id'],
+                device_id=rec['device_id'],
+                entry_time=rec['entry_time'],
+                exit_time=rec['exit_time'],
+                entry_lat=rec['entry_lat'],
+                entry_lon=rec['entry_lon'],
+                exit_lat=rec['exit_lat'],
+                exit_lon=rec['exit_lon'],
+                status='closed',
+            )
+            sess.logs = [
+                TaskVisitHistory(
+                    task_id=v['task_id'],
+                    rule_id=v['rule_id'],
+                    attempt_start=v['attempt_start'],
+                    attempt_end=v['attempt_end'],
+                    duration_sec=v['duration_sec'],
+                    result=v['result'],
+                    notes=f"final_percent={v['final_percent']:.1f}%",
+                )
+                for v in rec['visits']
+            ]
+            rows.append(sess)
+        self.db.add_all(rows)
+        self.db.flush()
+        self._device_written += len(rows)
+        self._pending = []
+
+    def end(self, device_id: Optional[int]) -> None:
+        self.flush()
+        self.db.commit()
+        self.written += self._device_written
+        self._device_written = 0
+
+    def close(self) -> None:
+        # незавершённый прогон устройства (ошибка) — удаление и запись откатываются
+        self._pending = []
+        self._device_written = 0
+        self.db.rollback()
+
+
+# ——— Прогон одного устройства —————————————————————————————————————————
+
+class _DeviceReplay:
+    """Состояние одного устройства — те же переходы, что в RealTimeProcessor._transition."""
+
+    def __init__(self, engine: "ReplayEngine", device_id: Optional[int]):
+        self.engine = engine
+        self.device_id = device_id
+        self.pos = -1                 # позиция зоны в zone_defs, -1 — движение
+        self.session: Optional[dict] = None
+        self.session_coords: list = []
+        self.stops = new_stop_detector()
+        self.last = None
+
+    def feed(self, rows: Sequence) -> None:
+        """Очередное окно точек устройства по времени."""
+        if not rows:
+            return
+        lats = np.fromiter((r.latitude for r in rows), dtype=np.float64, count=len(rows))
+        lons = np.fromiter((r.longitude for r in rows), dtype=np.float64, count=len(rows))
+        for start, end, pos in zone_runs(self.engine.zone_index.classify(lats, lons)):
+            if pos != self.pos:
+                self._transition(rows[start], pos)
+                start += 1
+            if self.pos == -1:
+                for pt in rows[start:end + 1]:
+                    self._travel_events(self.stops.push(pt))
+            elif self.session is not None:
+                self.session_coords.extend(rows[start:end + 1])
+        self.last = rows[-1]
+
+    def finish(self) -> None:
+        """Конец периода: закрываем сессию по последней точке, дожимаем стоянку пути."""
+        if self.pos == -1:
+            self._travel_events(self.stops.flush())
+        elif self.session is not None and self.last is not None:
+            self._close_session(self.last, include=False)
+
+    def _transition(self, pt, pos: int) -> None:
+        if self.pos >= 0:
+            # выезд из зоны или перескок в другую
+            self._close_session(pt)
+            if pos == -1:
+                # путь начинается с точки выезда
+                self.stops = new_stop_detector()
+                self.stops.push(pt)
+            else:
+                self._open_session(pt, pos)
+        else:
+            # въезд из движения: точка въезда — граница последнего кластера пути
+            self._travel_events(self.stops.push(pt) + self.stops.flush())
+            self._open_session(pt, pos)
+        self.pos = pos
+
+    def _open_session(self, pt, pos: int) -> None:
+        zid, zname, *_, ztype = self.engine.zone_index.zone_defs[pos]
+        if ztype != 'territory':
+            self.session = None
+            return
+        self.session = {
+            'device_id': self.device_id,
+            'zone_id': zid,
+            'zone_name': zname,
+            'entry_time': pt.recorded_at,
+            'entry_lat': pt.latitude,
+            'entry_lon': pt.longitude,
+        }
+        self.session_coords = [pt]
+
+    def _close_session(self, pt, include: bool = True) -> None:
+        if self.session is None:
+            return
+        # как в analyze_session: точки в [entry_time, exit_time] включительно
+        if include:
+            self.session_coords.append(pt)
+        rec = self.session
+        rec.update(exit_time=pt.recorded_at, exit_lat=pt.latitude, exit_lon=pt.longitude)
+        stops, visits = evaluate_session(
+            self.session_coords,
+            self.engine.zone_tasks(self.pos),
+            self.engine.rules,
+            rec['exit_time'],
+            self.engine.threshold,
+        )
+        rec.update(points=len(self.session_coords), stops=stops, visits=visits)
+        self.engine.sink.session(rec)
+        self.session = None
+        self.session_coords = []
+
+    def _travel_events(self, events) -> None:
+        for kind, stop in events:
+            if kind == STOP_CLOSED:
+                self.engine.sink.stop({**stop, 'device_id': self.device_id})
+
+
+# ——— Движок ———————————————————————————————————————————————————————————
+
+@dataclass
+class ReplayStats:
+    devices: int = 0
+    points: int = 0
+    seconds: float = 0.0
+
+    @property
+    def points_per_sec(self) -> float:
+        return self.points / self.seconds if self.seconds else 0.0
+
+
+class ReplayEngine:
+    def __init__(self, db: Session, sink: Optional[ReplaySink] = None,
+                 rules: Optional[Iterable] = None, threshold: float = 0.95,
+                 chunk: timedelta = CHUNK):
+        self.db = db
+        self.sink = sink if sink is not None else DryRunSink()
+        self.threshold = threshold
+        self.chunk = chunk
+
+        self.zone_index = ZoneIndex.from_zones(db.query(GeoZone).all())
+        if rules is None:
+            rules = db.query(GeofenceRule).all()
+        self.rules = sorted(rules, key=lambda r: r.radius_m)
+
+        # кандидаты зоны — из пространственного индекса; сами задачи грузятся в run()
+        # по периоду прогона
+        task_index.refresh(db)
+        self.tasks: dict[int, Task] = {}
+        self._zone_tasks: dict[int, list] = {}
+        self._tasks_period: Optional[tuple[datetime, datetime]] = None
+
+    def load_tasks(self, start: datetime, end: datetime) -> None:
+        """
+        Задачи, окно которых пересекается с периодом: planned_start до конца
+        периода, due_datetime или actual_end — после начала (с запасом
+        TASK_WINDOW_MARGIN). Текущий статус не важен: выполненные с тех пор
+        задачи в истории ещё не выполнены.
+        """
+        if self._tasks_period == (start, end):
+            return
+        q = self.db.query(Task).filter(
+            Task.planned_start < end + TASK_WINDOW_MARGIN,
+            or_(Task.due_datetime >= start - TASK_WINDOW_MARGIN,
+                Task.actual_end >= start - TASK_WINDOW_MARGIN),
+        )
+        self.tasks = {t.task_id: t for t in q}
+        self._zone_tasks = {}
+        self._tasks_period = (start, end)
+
+    def zone_tasks(self, pos: int) -> list:
+        tasks = self._zone_tasks.get(pos)
+        if tasks is None:
+            _, _, lat, lon, radius, _ = self.zone_index.zone_defs[pos]
+            tasks = self._zone_tasks[pos] = [
+                self.tasks[i] for i in task_index.query(lat, lon, radius) if i in self.tasks
+            ]
+        return tasks
+
+    def device_ids(self, start: datetime, end: datetime) -> list[Optional[int]]:
+        """Устройства, у которых есть точки в периоде."""
+        rows = (
+            self.db.query(BeaconCoordinate.device_id)
+                   .filter(BeaconCoordinate.recorded_at >= start,
+                           BeaconCoordinate.recorded_at < end)
+                   .distinct()
+        )
+        return [device_id for (device_id,) in rows]
+
+    def _points(self, device_id: Optional[int], start: datetime, end: datetime) -> list:
+        q = self.db.query(
+            BeaconCoordinate.latitude, BeaconCoordinate.longitude, BeaconCoordinate.recorded_at
+        ).filter(BeaconCoordinate.recorded_at >= start, BeaconCoordinate.recorded_at < end)
+        if device_id is None:
+            q = q.filter(BeaconCoordinate.device_id.is_(None))
+        else:
+            q = q.filter(BeaconCoordinate.device_id == device_id)
+        return q.order_by(BeaconCoordinate.recorded_at).all()
+
+    def run(self, start: datetime, end: datetime,
+            device_ids: Optional[Iterable[Optional[int]]] = None) -> ReplayStats:
+        """Прогон всех (или указанных) устройств за [start, end)."""
+        started = monotonic_time.monotonic()
+        start, end = utc_naive(start), utc_naive(end)
+        stats = ReplayStats()
+        devices = list(device_ids) if device_ids is not None else self.device_ids(start, end)
+        try:
+            for device_id in devices:
+                first, last = self.sink.begin(device_id, start, end)
+                self.load_tasks(first, last)
+                replay = _DeviceReplay(self, device_id)
+                window = first
+                while window < last:
+                    window_end = min(window + self.chunk, last)
+                    rows = self._points(device_id, window, window_end)
+                    stats.points += len(rows)
+                    replay.feed(rows)
+                    window = window_end
+                replay.finish()
+                self.sink.end(device_id)
+                stats.devices += 1
+        finally:
+            self.sink.close()
+        stats.seconds = monotonic_time.monotonic() - started
+        logger.info("⏩ Replay: устройств %s, точек %s за %.1f с (%.0f точек/с)",
+                    stats.devices, stats.points, stats.seconds, stats.points_per_sec)
+        return stats
+
+
+def replay_device(db: Session, device_id: Optional[int], start: datetime, end: datetime,
+                  threshold: float = 0.95) -> int:
+    """
+    Пересчитывает сессии и визиты устройства за [start, end) в БД
+    (ReplayEngine + BulkWriteSink). Возвращает число записанных сессий.
+    """
+    sink = BulkWriteSink(db)
+    ReplayEngine(db, sink, threshold=threshold).run(start, end, [device_id])
+    return sink.written
+
+
+# ——— CLI ————————————————————————————————————————————————————————————
+
+def get_args(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Пересчёт сессий и визитов по истории")
+    parser.add_argument("--from", dest="first", type=date.fromisoformat, required=True,
+                        help="первый день (местное время), YYYY-MM-DD")
+    parser.add_argument("--to", dest="last", type=date.fromisoformat, required=True,
+                        help="последний день включительно, YYYY-MM-DD")
+    parser.add_argument("--device", type=int, action="append",
+                        help="device_id (можно несколько); по умолчанию — все устройства периода")
+    parser.add_argument("--write", action="store_true",
+                        help="заменить сессии и визиты периода в БД (иначе dry-run)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    logging.basicConfig(format='[%(asctime)s] %(levelname)s: %(message)s', level=logging.INFO)
+    args = get_args(argv)
+    start = datetime.combine(args.first, time(0), tzinfo=IRKUTSK)
+    end = datetime.combine(args.last + timedelta(days=1), time(0), tzinfo=IRKUTSK)
+
+    db: Session = SessionLocal()
+    try:
+        sink = BulkWriteSink(db) if args.write else DryRunSink()
+        ReplayEngine(db, sink).run(start, end, args.device)
+        if isinstance(sink, DryRunSink):
+            logger.info("📊 %s", sink.summary())
+        else:
+            logger.info("💾 Записано сессий: %s", sink.written)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+# app/route_planner.py
+"""
+Планировщик порядка объезда задач (TSP с временными окнами).
+
+Решатель работает с любой матрицей времени в пути (секунды):
+  1) построение — вставка задач по возрастанию дедлайна в самое
+     «дешёвое» место маршрута (cheapest insertion);
+  2) локальный поиск — relocate (перенос одной задачи) и 2-opt
+     (разворот участка), пока есть улучшение.
+
+Стоимость маршрута = время в пути + LATE_WEIGHT × опоздание к due_datetime
+(с весом приоритета). Неперемещаемые задачи (movable=False) не начинаются
+раньше planned_start — исполнитель ждёт.
+
+Время в пути — из матрицы TomTom (travel_times, app.travel_matrix.load_matrix):
+для узлов Node (plan_nodes) напрямую, для задач (plan_tasks +
+stored_travel_matrix) — если обе точки пары совпадают с узлами (ближе
+NODE_MATCH_M). Пустые ячейки (нет данных или пара недостижима) — оценка
+по прямой (estimate_travel_matrix).
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.geodesy import distance_matrix
+
+# Средняя скорость по городу (км/ч) и коэффициент извилистости дорог
+AVG_SPEED_KMH = 30.0
+ROAD_FACTOR = 1.3
+# Секунда опоздания «стоит» столько секунд в пути
+LATE_WEIGHT = 10.0
+PRIORITY_WEIGHT = {"A": 3.0, "B": 2.0, "C": 1.0}
+# Ограничение числа проходов локального поиска
+MAX_PASSES = 50
+# Точка задачи считается узлом Node, если до него ближе (м)
+NODE_MATCH_M = 50.0
+
+
+@dataclass
+class Stop:
+    key: int                          # task_id / node_id
+    service_sec: float
+    earliest: Optional[float] = None  # секунды от начала маршрута
+    latest: Optional[float] = None
+    weight: float = 1.0               # вес опоздания
+
+
+@dataclass
+class Visit:
+    key: int
+    arrival: float      # секунды от начала маршрута
+    start: float        # начало работ (после ожидания earliest)
+    departure: float
+    travel_sec: float
+    late_sec: float
+
+
+def estimate_travel_matrix(lats: Sequence[float], lons: Sequence[float]) -> np.ndarray:
+    """Оценка времени в пути (сек) между всеми точками по расстоянию по прямой."""
+    dist = distance_matrix(lats, lons, lats, lons)
+    return dist * ROAD_FACTOR / (AVG_SPEED_KMH / 3.6)
+
+
+class RoutePlanner:
+    def __init__(self, travel: np.ndarray, stops: Sequence[Stop], finish: bool = False):
+        """
+        :param travel: матрица (n+1, n+1): индекс 0 — старт (депо), i — stops[i-1];
+                       при finish=True — (n+2, n+2), последний индекс — точка финиша
+        :param stops:  задачи маршрута
+        :param finish: маршрут заканчивается в точке финиша (иначе — на последней задаче)
+        """
+        self.travel = np.asarray(travel, dtype=np.float64)
+        self.stops = list(stops)
+        size = len(self.stops) + (2 if finish else 1)
+        if self.travel.shape != (size, size):
+            raise ValueError("Размер матрицы не совпадает с числом задач")
+        self.finish = size - 1 if finish else None
+
+    # ——— Оценка маршрута ————————————————————————————————————————————————
+
+    def cost(self, route: Sequence[int]) -> float:
+        """route — индексы задач (1..n) в порядке объезда."""
+        t = 0.0
+        travel_total = 0.0
+        late_total = 0.0
+        prev = 0
+        for i in route:
+            leg = self.travel[prev, i]
+            travel_total += leg
+            t += leg
+            stop = self.stops[i - 1]
+            if stop.earliest is not None and t < stop.earliest:
+                t = stop.earliest
+            if stop.latest is not None and t > stop.latest:
+                late_total += (t - stop.latest) * stop.weight
+            t += stop.service_sec
+            prev = i
+        if self.finish is not None:
+            travel_total += self.travel[prev, self.finish]
+        return travel_total + LATE_WEIGHT * late_total
+
+    def finish_leg(self, route: Sequence[int]) -> float:
+        """Переезд от последней задачи до финиша (0 — маршрут без финиша)."""
+        if self.finish is None:
+            return 0.0
+        return float(self.travel[route[-1] if route else 0, self.finish])
+
+    def schedule(self, route: Sequence[int]) -> list[Visit]:
+        """Расписание по маршруту: прибытие, начало, отъезд, опоздание."""
+        visits = []
+        t = 0.0
+        prev = 0
+        for i in route:
+            leg = float(self.travel[prev, i])
+            arrival = t + leg
+            stop = self.stops[i - 1]
+            start = max(arrival, stop.earliest) if stop.earliest is not None else arrival
+            late = max(0.0, start - stop.latest) if stop.latest is not None else 0.0
+            t = start + stop.service_sec
+            visits.append(Visit(stop.key, arrival, start, t, leg, late))
+            prev = i
+        return visits
+
+    # ——— Построение и улучшение ——————————————————————————————————————
+
+    def construct(self) -> list[int]:
+        """Cheapest insertion в порядке возрастания дедлайна."""
+        order = sorted(
+            range(1, len(self.stops) + 1),
+            key=lambda i: (self.stops[i - 1].latest is None, self.stops[i - 1].latest or 0.0),
+        )
+        route: list[int] = []
+        for i in order:
+            best_pos, best_cost = 0, None
+            for pos in range(len(route) + 1):
+                c = self.cost(route[:pos] + [i] + route[pos:])
+                if best_cost is None or c < best_cost:
+                    best_pos, best_cost = pos, c
+            route.insert(best_pos, i)
+        return route
+
+    def improve(self, route: list[int]) -> list[int]:
+        """Relocate + 2-opt до локального минимума (не больше MAX_PASSES проходов)."""
+        best = self.cost(route)
+        n = len(route)
+        for _ in range(MAX_PASSES):
+            improved = False
+
+            # relocate: переносим одну задачу на другое место
+            for a in range(n):
+                for b in range(n):
+                    if a == b:
+                        continue
+                    cand = route[:a] + route[a + 1:]
+                    cand.insert(b, route[a])
+                    c = self.cost(cand)
+                    if c < best - 1e-9:
+                        route, best, improved = cand, c, True
+
+            # 2-opt: разворачиваем участок route[a..b]
+            for a in range(n - 1):
+                for b in range(a + 1, n):
+                    cand = route[:a] + route[a:b + 1][::-1] + route[b + 1:]
+                    c = self.cost(cand)
+                    if c < best - 1e-9:
+                        route, best, improved = cand, c, True
+
+            if not improved:
+                break
+        return route
+
+    def solve(self) -> list[Visit]:
+        if not self.stops:
+            return []
+        return self.schedule(self.improve(self.construct()))
+
+
+def _fill_stored(travel: np.ndarray, stored: Sequence[Sequence[Optional[int]]],
+                 rows: Sequence[int], cols: Sequence[int]) -> None:
+    """travel[rows[a], cols[b]] = stored[a][b] там, где значение есть (кроме диагонали)."""
+    for a, i in enumerate(rows):
+        for b, j in enumerate(cols):
+            sec = stored[a][b]
+            if sec is not None and i != j:
+                travel[i, j] = sec
+
+
+def stored_travel_matrix(db: Session, lats: Sequence[float], lons: Sequence[float],
+                         bucket: Optional[int] = None) -> np.ndarray:
+    """
+    Матрица времени в пути между точками: пары, где обе точки совпадают
+    с узлами Node (ближе NODE_MATCH_M), — из travel_times за bucket,
+    остальные — оценка по прямой.
+    """
+    from app.models import Node
+    from app.travel_matrix import load_matrix
+
+    travel = estimate_travel_matrix(lats, lons)
+    nodes = db.query(Node).order_by(Node.node_id).all()
+    if not nodes:
+        return travel
+    dist = distance_matrix(lats, lons, [n.lat for n in nodes], [n.lng for n in nodes])
+    nearest = dist.argmin(axis=1)
+    matched = [i for i in range(len(lats)) if dist[i, nearest[i]] <= NODE_MATCH_M]
+    if len(matched) < 2:
+        return travel
+    used = sorted({int(nearest[i]) for i in matched})
+    pos = {k: p for p, k in enumerate(used)}
+    stored = load_matrix(db, [nodes[k] for k in used], bucket)
+    # строки/столбцы stored — узлы, travel — точки: раскладываем по совпадениям
+    expanded = [[stored[pos[nearest[i]]][pos[nearest[j]]] for j in matched] for i in matched]
+    _fill_stored(travel, expanded, matched, matched)
+    return travel
+
+
+def plan_tasks(tasks: Sequence, start: tuple[float, float], start_time: datetime,
+               travel: Optional[np.ndarray] = None) -> list[dict]:
+    """
+    Порядок объезда задач (объекты Task) из точки start, выезд в start_time.
+    travel — матрица времени в пути в порядке [start] + tasks (например,
+    stored_travel_matrix); по умолчанию — оценка по прямой.
+    Возвращает список словарей для схемы RouteStop.
+    """
+    if not tasks:
+        return []
+
+    def offset(dt: Optional[datetime]) -> Optional[float]:
+        return None if dt is None else (dt - start_time).total_seconds()
+
+    stops = [
+        Stop(
+            key=t.task_id,
+            service_sec=t.service_minutes * 60,
+            earliest=None if t.movable else offset(t.planned_start),
+            latest=offset(t.due_datetime),
+            weight=PRIORITY_WEIGHT.get(t.priority, 1.0),
+        )
+        for t in tasks
+    ]
+    if travel is None:
+        travel = estimate_travel_matrix([start[0]] + [t.lat for t in tasks],
+                                        [start[1]] + [t.lng for t in tasks])
+    visits = RoutePlanner(travel, stops).solve()
+
+    by_id = {t.task_id: t for t in tasks}
+    return [
+        {
+            "task_id": v.key,
+            "address_raw": by_id[v.key].address_raw,
+            "lat": by_id[v.key].lat,
+            "lng": by_id[v.key].lng,
+            "arrival": start_time + timedelta(seconds=v.arrival),
+            "start": start_time + timedelta(seconds=v.start),
+            "departure": start_time + timedelta(seconds=v.departure),
+            "travel_sec": int(round(v.travel_sec)),
+            "late_sec": int(round(v.late_sec)),
+        }
+        for v in visits
+    ]
+
+
+def plan_nodes(db: Session, nodes: Sequence, start_time: datetime, bucket: Optional[int] = None) -> list[dict]:
+    """
+    Порядок объезда узлов Node: старт — узел is_start (иначе первый из nodes),
+    финиш — узел is_end (если есть); завершённые узлы пропускаются.
+    Неперемещаемые узлы (movable=False) назначены на planned_at: раньше не
+    начинаем, позже — опоздание. Время в пути — из travel_times за bucket
+    (по умолчанию — текущий), недостающие ячейки — оценка по прямой.
+    Возвращает список словарей: node_id, address, lat, lng, arrival, start,
+    departure, travel_sec, late_sec; последним — финиш, если он задан.
+    """
+    from app.travel_matrix import load_matrix
+
+    if not nodes:
+        return []
+    start = next((n for n in nodes if n.is_start), nodes[0])
+    finish = next((n for n in nodes if n.is_end and n is not start), None)
+    todo = [n for n in nodes if n is not start and n is not finish and not n.completed]
+
+    def offset(dt: datetime) -> float:
+        return (dt - start_time).total_seconds()
+
+    stops = [
+        Stop(
+            key=n.node_id,
+            service_sec=n.service_sec,
+            earliest=None if n.movable else offset(n.planned_at),
+            latest=None if n.movable else offset(n.planned_at),
+        )
+        for n in todo
+    ]
+    ordered = [start] + todo + ([finish] if finish is not None else [])
+    travel = estimate_travel_matrix([n.lat for n in ordered], [n.lng for n in ordered])
+    indices = range(len(ordered))
+    _fill_stored(travel, load_matrix(db, ordered, bucket), indices, indices)
+
+    planner = RoutePlanner(travel, stops, finish=finish is not None)
+    route = planner.improve(planner.construct()) if stops else []
+    visits = planner.schedule(route)
+    if finish is not None:
+        leg = planner.finish_leg(route)
+        t = (visits[-1].departure if visits else 0.0) + leg
+        visits.append(Visit(finish.node_id, t, t, t, leg, 0.0))
+
+    by_id = {n.node_id: n for n in ordered}
+    return [
+        {
+            "node_id": v.key,
+            "address": by_id[v.key].address,
+            "lat": by_id[v.key].lat,
+            "lng": by_id[v.key].lng,
+            "arrival": start_time + timedelta(seconds=v.arrival),
+            "start": start_time + timedelta(seconds=v.start),
+            "departure": start_time + timedelta(seconds=v.departure),
+            "travel_sec": int(round(v.travel_sec)),
+            "late_sec": int(round(v.late_sec)),
+        }
+        for v in visits
+    ]
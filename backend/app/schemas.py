@@ -24,6 +24,14 @@ class ExecutorCreate(BaseModel):
 
 class Executor(ExecutorBase):
     pass
+
+class ExecutorBrief(BaseModel):
+    """Исполнитель внутри задачи — только то, что показывает список задач"""
+    exec_id: int
+    surname: str
+    name:    str | None = None
+
+    model_config = ConfigDict(from_attributes=True)
 # ─── Новая Pydantic-схема для создания записи о времени работы исполнителя ─
 class ExecutorWorkTimeBase(BaseModel):
     exec_id: int = Field(..., description="ID исполнителя")
@@ -116,15 +124,62 @@ class TaskUpdate(BaseModel):
     executor_ids: Optional[List[int]] = None
     contract_number: Optional[str] = None
 
+class TaskBulkUpdate(TaskUpdate):
+    """Строка PATCH /tasks/bulk: id задачи + изменяемые поля"""
+    task_id: int
+
 class Task(TaskBase):
     task_id:          int
     last_modified_by: int | None
     created_at:       datetime
     updated_at:       datetime
 
-    executors: List[Executor] = []
+    executors: List[ExecutorBrief] = []
     contract_number: Optional[str] = None
 
+class TaskChanges(BaseModel):
+    """Ответ GET /tasks/changes"""
+    tasks:   List[Task]        # созданные и изменённые задачи
+    deleted: List[int]         # task_id удалённых задач
+    since:   str               # токен для следующего запроса
+
+# ─── Route planner schemas ───────────────────────────────────────────────────
+class RouteStop(BaseModel):
+    task_id:     int
+    address_raw: str
+    lat:         float
+    lng:         float
+    arrival:     datetime
+    start:       datetime   # начало работ (с учётом ожидания planned_start)
+    departure:   datetime
+    travel_sec:  int        # переезд от предыдущей точки
+    late_sec:    int        # опоздание относительно due_datetime
+
+class RoutePlan(BaseModel):
+    exec_id:          int | None   # None — задачи без исполнителя
+    start_time:       datetime
+    total_travel_sec: int
+    total_late_sec:   int
+    stops:            List[RouteStop] = []
+
+class NodeRouteStop(BaseModel):
+    node_id:    int
+    address:    str
+    lat:        float
+    lng:        float
+    arrival:    datetime
+    start:      datetime   # начало работ (неперемещаемый узел — не раньше planned_at)
+    departure:  datetime
+    travel_sec: int        # переезд от предыдущей точки
+    late_sec:   int        # опоздание относительно planned_at
+
+class NodeRoutePlan(BaseModel):
+    start_time:       datetime
+    time_bucket:      int      # слот travel_times, по которому считался маршрут
+    total_travel_sec: int
+    total_late_sec:   int
+    stops:            List[NodeRouteStop] = []
+
 # ─── Legacy Node schemas (не менялись) ─────────────────────────────────────
 class NodeBase(BaseModel):
     # …
@@ -135,6 +190,7 @@ class BeaconCoordinateBase(BaseModel):
     latitude:   float
     longitude:  float
     recorded_at: datetime
+    device_id:  int | None = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -178,6 +234,7 @@ class GeofenceRule(GeofenceRuleBase):
 # 2) Сессии геозоны
 class GeozoneSessionBase(BaseModel):
     zone_id: int
+    device_id: Optional[int] = None
     entry_time: datetime
     exit_time: Optional[datetime] = None
     entry_lat: float
@@ -226,6 +283,7 @@ class TaskVisitHistory(TaskVisitHistoryBase):
 
 class DailyZoneStatisticsBase(BaseModel):
     zone_id:         int      = Field(..., description="ID зоны из geo_zones")
+    device_id:       Optional[int] = None
     stats_datetime:  datetime = Field(..., description="дата и время сбора статистики")
     start_time:      datetime
     end_time:        datetime
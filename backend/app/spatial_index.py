@@ -0,0 +1,256 @@
+# app/spatial_index.py
+"""
+Пространственный индекс геозон.
+
+Сетка из ячеек фиксированного размера (в градусах): каждая зона
+регистрируется во всех ячейках, которые пересекает её описанный
+прямоугольник. Поиск зоны для точки смотрит только кандидатов своей
+ячейки, а не весь список zone_defs. Порядок кандидатов совпадает с
+порядком zone_defs, поэтому правило «первое совпадение побеждает»
+сохраняется.
+
+Для пакетной обработки дня: `ZoneIndex.classify` размечает весь массив
+координат за один векторный проход, а `zone_runs` сворачивает разметку
+в сессии (start_idx, end_idx, zone_pos).
+
+TaskSpatialIndex — такая же сетка по точкам задач (tasks.lat/lng) в памяти
+процесса: обновляется хуками crud при создании/изменении задач и
+инкрементально по tasks.updated_at, если задачи пишет другой процесс.
+"""
+import heapq
+import math
+import threading
+from statistics import median
+from typing import Iterable, Optional
+
+import numpy as np
+
+from app.geodesy import METERS_PER_DEG, as_arrays, bounding_box, distances_to_point, haversine
+
+# Границы размера ячейки сетки (метры)
+MIN_CELL_M = 100.0
+MAX_CELL_M = 20000.0
+# Зона, покрывающая больше ячеек, проверяется для каждой точки без сетки
+MAX_CELLS_PER_ZONE = 4096
+
+# Размер ячейки сетки задач (метры)
+TASK_CELL_M = 500.0
+# Если bbox запроса покрывает больше ячеек — проверяем все задачи подряд
+MAX_QUERY_CELLS = 10000
+
+# (zone_id, name, center_lat, center_lon, radius_m, type)
+ZoneDef = tuple
+
+
+def zone_defs_from_models(zones: Iterable) -> list[ZoneDef]:
+    """Преобразует объекты GeoZone в кортежи zone_defs (в исходном порядке)."""
+    return [
+        (z.zone_id, z.name, z.center_lat, z.center_lon, z.radius_m, z.type)
+        for z in zones
+    ]
+
+
+class ZoneIndex:
+    """Сеточный индекс кругов геозон с сохранением порядка zone_defs."""
+
+    def __init__(self, zone_defs: Iterable[ZoneDef], cell_m: Optional[float] = None):
+        self.zone_defs: list[ZoneDef] = list(zone_defs)
+
+        if cell_m is None:
+            # ячейка порядка диаметра типичной зоны
+            radii = [z[4] for z in self.zone_defs] or [MIN_CELL_M]
+            cell_m = 2 * median(radii)
+        cell_m = min(max(cell_m, MIN_CELL_M), MAX_CELL_M)
+
+        # Долготный шаг считаем по средней широте зон — индекс локальный
+        ref_lat = (
+            sum(z[2] for z in self.zone_defs) / len(self.zone_defs)
+            if self.zone_defs else 0.0
+        )
+        self.cell_lat = cell_m / METERS_PER_DEG
+        self.cell_lon = self.cell_lat / max(math.cos(math.radians(ref_lat)), 0.01)
+
+        self._cells: dict[tuple[int, int], list[int]] = {}
+        self._oversize: list[int] = []
+
+        for pos, (_, _, lat, lon, radius, _) in enumerate(self.zone_defs):
+            min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius)
+            i0, j0 = self._cell(min_lat, min_lon)
+            i1, j1 = self._cell(max_lat, max_lon)
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > MAX_CELLS_PER_ZONE:
+                self._oversize.append(pos)
+                continue
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    # позиции добавляются по возрастанию → списки уже отсортированы
+                    self._cells.setdefault((i, j), []).append(pos)
+
+    @classmethod
+    def from_zones(cls, zones: Iterable, cell_m: Optional[float] = None) -> "ZoneIndex":
+        return cls(zone_defs_from_models(zones), cell_m=cell_m)
+
+    def __len__(self) -> int:
+        return len(self.zone_defs)
+
+    def _cell(self, lat: float, lon: float) -> tuple[int, int]:
+        return math.floor(lat / self.cell_lat), math.floor(lon / self.cell_lon)
+
+    def candidates(self, lat: float, lon: float) -> list[int]:
+        """Позиции зон (в порядке zone_defs), которые могут содержать точку."""
+        in_cell = self._cells.get(self._cell(lat, lon), [])
+        if not self._oversize:
+            return in_cell
+        return list(heapq.merge(in_cell, self._oversize))
+
+    def find(self, lat: float, lon: float) -> Optional[ZoneDef]:
+        """Первая по порядку zone_defs зона, содержащая точку, или None."""
+        for pos in self.candidates(lat, lon):
+            zone = self.zone_defs[pos]
+            if haversine(lat, lon, zone[2], zone[3]) <= zone[4]:
+                return zone
+        return None
+
+    def find_point(self, pt) -> Optional[ZoneDef]:
+        """То же для объекта с атрибутами latitude/longitude (BeaconCoordinate)."""
+        return self.find(pt.latitude, pt.longitude)
+
+    def classify(self, lats, lons) -> np.ndarray:
+        """
+        Пакетная разметка трека: для каждой точки — позиция зоны в zone_defs
+        (первое совпадение) или -1, если точка вне всех зон.
+
+        Точки группируются по ячейкам сетки, и каждая зона-кандидат
+        проверяется сразу для всех ещё не размеченных точек своей ячейки.
+        """
+        lats, lons = as_arrays(lats, lons)
+        result = np.full(lats.shape[0], -1, dtype=np.int64)
+        if not lats.size or not self.zone_defs:
+            return result
+
+        cells = np.stack([
+            np.floor(lats / self.cell_lat).astype(np.int64),
+            np.floor(lons / self.cell_lon).astype(np.int64),
+        ], axis=1)
+        uniq, inverse = np.unique(cells, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind="stable")
+        groups = np.split(order, np.flatnonzero(np.diff(inverse[order])) + 1)
+
+        for (i, j), pending in zip(uniq, groups):
+            in_cell = self._cells.get((int(i), int(j)), [])
+            for pos in heapq.merge(in_cell, self._oversize):
+                _, _, z_lat, z_lon, z_r, _ = self.zone_defs[pos]
+                inside = distances_to_point(lats[pending], lons[pending], z_lat, z_lon) <= z_r
+                result[pending[inside]] = pos
+                pending = pending[~inside]
+                if not pending.size:
+                    break
+        return result
+
+
+def zone_runs(zone_pos) -> list[tuple[int, int, int]]:
+    """
+    Run-length кодирование разметки classify():
+    список (start_idx, end_idx, zone_pos) с включительными границами.
+    Серии с zone_pos == -1 — участки движения вне зон.
+    """
+    values = np.asarray(zone_pos)
+    if not values.size:
+        return []
+    change = np.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = np.concatenate(([0], change))
+    ends = np.concatenate((change - 1, [values.size - 1]))
+    return [
+        (int(start), int(end), int(values[start]))
+        for start, end in zip(starts, ends)
+    ]
+
+
+class TaskSpatialIndex:
+    """Сеточный индекс точек задач: task_id → (lat, lng)."""
+
+    def __init__(self, cell_m: float = TASK_CELL_M):
+        self.cell_deg = cell_m / METERS_PER_DEG
+        self._cells: dict[tuple[int, int], set[int]] = {}
+        self._points: dict[int, tuple[float, float]] = {}
+        self._watermark = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _cell(self, lat: float, lon: float) -> tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def upsert(self, task_id: int, lat: Optional[float], lng: Optional[float]) -> None:
+        """Добавляет задачу или переносит её в новую ячейку."""
+        with self._lock:
+            self._discard(task_id)
+            if lat is None or lng is None:
+                return
+            self._points[task_id] = (lat, lng)
+            self._cells.setdefault(self._cell(lat, lng), set()).add(task_id)
+
+    def discard(self, task_id: int) -> None:
+        with self._lock:
+            self._discard(task_id)
+
+    def _discard(self, task_id: int) -> None:
+        old = self._points.pop(task_id, None)
+        if old is None:
+            return
+        cell = self._cell(*old)
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.discard(task_id)
+            if not bucket:
+                del self._cells[cell]
+
+    def refresh(self, db) -> None:
+        """
+        Подтягивает из БД задачи, изменённые после последнего refresh
+        (при первом вызове — все). Читаются только task_id/lat/lng/updated_at.
+        Удалённые задачи из индекса не вычищаются: вызывающий код всё равно
+        дочитывает кандидатов из БД по id.
+        """
+        from app.models import Task
+
+        q = db.query(Task.task_id, Task.lat, Task.lng, Task.updated_at)
+        if self._watermark is not None:
+            # >= — чтобы не потерять изменения в ту же секунду
+            q = q.filter(Task.updated_at >= self._watermark)
+        watermark = self._watermark
+        for task_id, lat, lng, updated_at in q:
+            self.upsert(task_id, lat, lng)
+            if watermark is None or updated_at > watermark:
+                watermark = updated_at
+        self._watermark = watermark
+
+    def query(self, lat: float, lon: float, radius_m: float) -> list[int]:
+        """task_id задач в радиусе radius_m от точки, по возрастанию id."""
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_m)
+        i0, j0 = self._cell(min_lat, min_lon)
+        i1, j1 = self._cell(max_lat, max_lon)
+
+        with self._lock:
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > MAX_QUERY_CELLS:
+                ids = list(self._points)
+            else:
+                ids = [
+                    task_id
+                    for i in range(i0, i1 + 1)
+                    for j in range(j0, j1 + 1)
+                    for task_id in self._cells.get((i, j), ())
+                ]
+            if not ids:
+                return []
+            ids.sort()
+            lats = [self._points[task_id][0] for task_id in ids]
+            lngs = [self._points[task_id][1] for task_id in ids]
+
+        inside = distances_to_point(lats, lngs, lat, lon) <= radius_m
+        return [task_id for task_id, ok in zip(ids, inside) if ok]
+
+
+# общий индекс задач процесса (построение ленивое — при первом refresh)
+task_index = TaskSpatialIndex()
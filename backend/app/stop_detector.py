@@ -0,0 +1,187 @@
+# app/stop_detector.py
+"""
+Потоковый детектор стоянок — общий для real-time и пакетной аналитики.
+
+Точки подаются по одной через push(); детектор хранит только текущий
+кластер в виде бегущих сумм (число точек, сумма широт/долгот, время
+начала/конца, опорная точка), поэтому работа на точку — O(1), а память
+не зависит от длины трека.
+
+События:
+  * STOP_STARTED — кластер набрал min_points, стоянка началась;
+  * STOP_CLOSED  — кластер с >= min_points точек завершился;
+  * STOP_DROPPED — кластер завершился «скачком» GPS дальше spike_threshold
+                   и стоянкой не считается.
+
+Стоянка — словарь {'start', 'end', 'duration', 'center', 'points'}
+(duration — в минутах), как и в прежних детекторах.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from app.geodesy import haversine
+
+logger = logging.getLogger(__name__)
+
+STOP_STARTED = "started"
+STOP_CLOSED = "closed"
+STOP_DROPPED = "dropped"
+
+# С какой точкой кластера сравнивается новая точка
+ANCHOR_FIRST = "first"   # с первой (классическая кластеризация по радиусу)
+ANCHOR_LAST = "last"     # с предыдущей (цепочка одинаковых координат)
+
+
+class StopDetector:
+    def __init__(
+        self,
+        radius_m: float,
+        min_points: int,
+        spike_threshold: Optional[float] = None,
+        anchor: str = ANCHOR_FIRST,
+        max_gap: Optional[timedelta] = None,
+    ):
+        """
+        :param radius_m:        радиус кластера (метры) относительно опорной точки
+        :param min_points:      минимум точек, чтобы кластер считался стоянкой
+        :param spike_threshold: если задан — стоянка отбрасывается, когда точка,
+                                закрывшая кластер, дальше этого порога от его конца
+        :param anchor:          ANCHOR_FIRST или ANCHOR_LAST
+        :param max_gap:         если задан — разрыв по времени больше него
+                                тоже закрывает кластер
+        """
+        if anchor not in (ANCHOR_FIRST, ANCHOR_LAST):
+            raise ValueError(f"Неизвестный anchor: {anchor}")
+        self.radius_m = radius_m
+        self.min_points = min_points
+        self.spike_threshold = spike_threshold
+        self.anchor = anchor
+        self.max_gap = max_gap
+        self._reset()
+
+    def _reset(self) -> None:
+        self.count = 0
+        self.sum_lat = 0.0
+        self.sum_lon = 0.0
+        self.start: Optional[datetime] = None
+        self.end: Optional[datetime] = None
+        self.first_lat = self.first_lon = None
+        self.last_lat = self.last_lon = None
+
+    # ——— Публичный API ——————————————————————————————————————————————
+
+    @property
+    def open_stop(self) -> Optional[dict]:
+        """Текущая стоянка, если кластер уже набрал min_points, иначе None."""
+        if self.count >= self.min_points:
+            return self._build_stop()
+        return None
+
+    def push(self, pt) -> list[tuple[str, dict]]:
+        """Обрабатывает очередную точку (BeaconCoordinate или аналог)."""
+        events: list[tuple[str, dict]] = []
+        lat, lon, t = pt.latitude, pt.longitude, pt.recorded_at
+
+        if self.count:
+            if self.anchor == ANCHOR_FIRST:
+                ref_lat, ref_lon = self.first_lat, self.first_lon
+            else:
+                ref_lat, ref_lon = self.last_lat, self.last_lon
+            inside = haversine(lat, lon, ref_lat, ref_lon) <= self.radius_m
+            if inside and self.max_gap is not None:
+                inside = (t - self.end) <= self.max_gap
+            if not inside:
+                events.extend(self._close(next_lat=lat, next_lon=lon, next_t=t))
+
+        self._add(lat, lon, t, events)
+        return events
+
+    def flush(self) -> list[tuple[str, dict]]:
+        """Закрывает последний кластер (конец сегмента): проверки скачка нет."""
+        return self._close()
+
+    def feed(self, points: Iterable) -> list[tuple[str, dict]]:
+        """push() для всех точек и flush() в конце."""
+        events: list[tuple[str, dict]] = []
+        for pt in points:
+            events.extend(self.push(pt))
+        events.extend(self.flush())
+        return events
+
+    def dump_state(self) -> dict:
+        """
+        Снимок открытого кластера (JSON-совместимый, O(1) по размеру).
+        Параметры детектора в снимок не входят — они задаются кодом.
+        """
+        if not self.count:
+            return {}
+        return {
+            'count': self.count,
+            'sum_lat': self.sum_lat,
+            'sum_lon': self.sum_lon,
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'first': [self.first_lat, self.first_lon],
+            'last': [self.last_lat, self.last_lon],
+        }
+
+    def load_state(self, state: dict) -> None:
+        """Восстанавливает открытый кластер из dump_state()."""
+        self._reset()
+        if not state:
+            return
+        self.count = int(state['count'])
+        self.sum_lat = float(state['sum_lat'])
+        self.sum_lon = float(state['sum_lon'])
+        self.start = datetime.fromisoformat(state['start'])
+        self.end = datetime.fromisoformat(state['end'])
+        self.first_lat, self.first_lon = state['first']
+        self.last_lat, self.last_lon = state['last']
+
+    # ——— Внутреннее ——————————————————————————————————————————————————
+
+    def _add(self, lat: float, lon: float, t: datetime, events: list) -> None:
+        if not self.count:
+            self.start = t
+            self.first_lat, self.first_lon = lat, lon
+        self.count += 1
+        self.sum_lat += lat
+        self.sum_lon += lon
+        self.end = t
+        self.last_lat, self.last_lon = lat, lon
+        if self.count == self.min_points:
+            events.append((STOP_STARTED, self._build_stop()))
+
+    def _build_stop(self) -> dict:
+        return {
+            'start': self.start,
+            'end': self.end,
+            'duration': (self.end - self.start).total_seconds() / 60,
+            'center': (self.sum_lat / self.count, self.sum_lon / self.count),
+            'points': self.count,
+        }
+
+    def _close(self, next_lat=None, next_lon=None, next_t=None) -> list[tuple[str, dict]]:
+        events: list[tuple[str, dict]] = []
+        if self.count >= self.min_points:
+            kind = STOP_CLOSED
+            if self.spike_threshold is not None and next_lat is not None:
+                d_spike = haversine(self.last_lat, self.last_lon, next_lat, next_lon)
+                if d_spike > self.spike_threshold:
+                    logger.info(
+                        f"[DEBUG] Пропущён idle: {self.end} → {next_t}, "
+                        f"дистанция {d_spike:.0f}м > порог {self.spike_threshold:.0f}м"
+                    )
+                    kind = STOP_DROPPED
+            events.append((kind, self._build_stop()))
+        self._reset()
+        return events
+
+
+def collect_stops(points: Iterable, **params) -> list[dict]:
+    """Пакетный режим: все закрытые стоянки сегмента точек по порядку."""
+    return [
+        stop for kind, stop in StopDetector(**params).feed(points)
+        if kind == STOP_CLOSED
+    ]
@@ -18,44 +18,67 @@ YANDEX_API_KEY = os.getenv('YANDEX_API_KEY')
 if not TELEGRAM_TOKEN or not CHAT_ID or not YANDEX_API_KEY:
     raise ValueError("Не все ключи были загружены из .env")
 
-# Функция для отправки сообщения
-def send_to_telegram(message: str) -> Optional[str]:
+# Пул соединений с api.telegram.org (общий для send_to_telegram и outbox)
+http = requests.Session()
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "10"))
+
+
+class TelegramError(Exception):
+    """Ответ Telegram API с ошибкой; retry_after — для 429 Too Many Requests."""
+    def __init__(self, status: int, description: str, retry_after: Optional[float] = None):
+        super().__init__(f"{status}: {description}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def post_message(message: str) -> str:
+    """
+    Отправляет сообщение в чат и возвращает telegram message_id.
+    Сетевые ошибки пробрасывает как requests.RequestException,
+    ошибки API — как TelegramError.
+    """
     url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
     payload = {
         "chat_id": CHAT_ID,  # Используем глобальный CHAT_ID
         "text": message,
         "parse_mode": "Markdown"
     }
+    response = http.post(url, data=payload, timeout=TELEGRAM_TIMEOUT)
+    if response.status_code >= 400:
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        retry_after = (body.get("parameters") or {}).get("retry_after")
+        raise TelegramError(response.status_code, body.get("description", response.text), retry_after)
+    return str(response.json()['result']['message_id'])
 
-    # Создаем сессию для работы с базой данных
-    db = SessionLocal()
 
+# Функция для отправки сообщения (синхронно — для CLI-скриптов).
+# Сервисы ставят сообщения в очередь: app.telegram_outbox.notify
+def send_to_telegram(message: str) -> Optional[str]:
     try:
         # Отправляем сообщение в Telegram
-        response = requests.post(url, data=payload)
-        response.raise_for_status()  # Проверка на ошибки
-        response_data = response.json()
-        telegram_message_id = response_data['result']['message_id']  # Получаем ID сообщения
+        telegram_message_id = post_message(message)
+    except (requests.exceptions.RequestException, TelegramError) as e:
+        logging.error(f"Error sending message to Telegram: {e}")
+        return None
 
-        # Сохраняем сообщение в базе данных
+    # Сохраняем сообщение в базе данных
+    db = SessionLocal()
+    try:
         db_message = models.TelegramMessage(
             chat_id=CHAT_ID,  # Сохраняем идентификатор чата
             message_text=message,
-            telegram_message_id=str(telegram_message_id)
+            telegram_message_id=telegram_message_id
         )
         db.add(db_message)
         db.commit()
-        db.refresh(db_message)
-
-        return str(telegram_message_id)  # Возвращаем ID сообщения для дальнейших операций
-
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error sending message to Telegram: {e}")
-        return None
-
     finally:
         db.close()  # Закрываем сессию после выполнения операций с базой данных
 
+    return telegram_message_id  # Возвращаем ID сообщения для дальнейших операций
+
 
 # Функция для отправки информации о сессии
 def send_session_info(session_id: int, entry_time: datetime, exit_time: datetime, zone_name: str, time_spent: float):
@@ -99,7 +122,7 @@ def delete_telegram_message(telegram_message_id: str) -> bool:
         "message_id": telegram_message_id
     }
     try:
-        response = requests.post(url, data=payload)
+        response = http.post(url, data=payload, timeout=TELEGRAM_TIMEOUT)
         response.raise_for_status()
         return True
     except requests.exceptions.RequestException as e:
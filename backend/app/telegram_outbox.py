@@ -0,0 +1,225 @@
+# app/telegram_outbox.py
+"""
+Очередь исходящих сообщений Telegram (outbox).
+
+notify() только записывает сообщение в локальную SQLite-очередь и сразу
+возвращает управление — обработка точек маяка больше не ждёт Telegram.
+Фоновый поток доставляет сообщения по порядку:
+
+  * общий пул HTTP-соединений (telegram_bot.http) и таймауты;
+  * token bucket — не чаще SEND_RATE сообщений в секунду в чат;
+  * повторы с экспоненциальной задержкой при сетевых ошибках и 5xx,
+    пауза retry_after при 429; 4xx (кроме 429) — сообщение отбрасывается;
+  * строки TelegramMessage пишутся в БД пачкой, одним INSERT.
+
+Очередь переживает перезапуск: недоставленные сообщения уйдут при
+следующем старте воркера.
+"""
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import requests
+
+import app.crud as crud
+from app.db import SessionLocal
+from app.rate_limit import TokenBucket
+from app.telegram_bot import CHAT_ID, TelegramError, post_message
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_PATH = os.getenv(
+    "TELEGRAM_OUTBOX_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "telegram_outbox.sqlite3"),
+)
+# Telegram ограничивает частоту сообщений в один чат (~1 в секунду)
+SEND_RATE = float(os.getenv("TELEGRAM_SEND_RATE", "1"))
+SEND_BURST = 3
+MAX_ATTEMPTS = 8
+MAX_BACKOFF_SEC = 300
+# Сколько сообщений выбирается из очереди за проход (и пишется в БД одним INSERT)
+BATCH_SIZE = 20
+# Сколько ждать доставки оставшихся сообщений при завершении процесса
+DRAIN_TIMEOUT_SEC = 10
+
+
+class TelegramOutbox:
+    def __init__(self, path: str = OUTBOX_PATH, rate: float = SEND_RATE, burst: float = SEND_BURST):
+        self.path = path
+        self.bucket = TokenBucket(rate, burst)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # drain при выходе регистрируется один раз, при первом start()
+        self._atexit_registered = False
+
+    # ——— Локальная очередь ————————————————————————————————————————————
+
+    def _db(self) -> sqlite3.Connection:
+        """Соединение с SQLite (открывается лениво; вызывать под self._lock)."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                    text       TEXT    NOT NULL,
+                    attempts   INTEGER NOT NULL DEFAULT 0,
+                    next_try   REAL    NOT NULL DEFAULT 0
+                )
+                """
+            )
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._db().execute(sql, params).fetchall()
+
+    def pending(self) -> int:
+        """Сколько сообщений ждёт доставки."""
+        return self._execute("SELECT COUNT(*) FROM outbox")[0][0]
+
+    # ——— Публичный API ——————————————————————————————————————————————
+
+    def enqueue(self, message: str) -> None:
+        """Ставит сообщение в очередь и будит воркер (O(1), без сети)."""
+        self._execute("INSERT INTO outbox (text) VALUES (?)", (message,))
+        self.start()
+        self._wakeup.set()
+
+    def start(self) -> None:
+        """Запускает фоновый поток доставки (повторный вызов — no-op)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="telegram-outbox", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.drain)
+                self._atexit_registered = True
+
+    def drain(self, timeout: float = DRAIN_TIMEOUT_SEC) -> bool:
+        """
+        Ждёт, пока очередь опустеет (не дольше timeout).
+        True — всё доставлено; остальное уйдёт при следующем запуске.
+        """
+        deadline = time.monotonic() + timeout
+        while self.pending():
+            if self._thread is None or not self._thread.is_alive() or time.monotonic() >= deadline:
+                return False
+            self._wakeup.set()
+            time.sleep(0.1)
+        return True
+
+    def stop(self, timeout: float = DRAIN_TIMEOUT_SEC) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # ——— Воркер ——————————————————————————————————————————————————————
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                if self._deliver_batch():
+                    continue
+                row = self._execute("SELECT MIN(next_try) FROM outbox")[0]
+                wait = None if row[0] is None else max(row[0] - time.time(), 0.0)
+            except Exception as err:
+                logger.error("❌ [outbox] Ошибка доставки: %s", err, exc_info=True)
+                wait = 5.0
+            self._wakeup.wait(wait)
+
+    def _deliver_batch(self) -> int:
+        """Доставляет очередную пачку сообщений; возвращает число отправленных."""
+        rows = self._execute(
+            "SELECT id, text, attempts FROM outbox WHERE next_try <= ? ORDER BY id LIMIT ?",
+            (time.time(), BATCH_SIZE),
+        )
+        delivered: list[dict] = []
+        for outbox_id, text, attempts in rows:
+            if self._stopping.is_set():
+                break
+            self.bucket.acquire()
+            try:
+                telegram_message_id = post_message(text)
+            except TelegramError as err:
+                if err.status == 429:
+                    retry_after = float(err.retry_after or 1)
+                    self.bucket.pause(retry_after)
+                    self._retry(outbox_id, attempts, retry_after, err)
+                    break
+                if 400 <= err.status < 500:
+                    # битая разметка, чат недоступен и т.п. — повтор не поможет
+                    logger.error("❌ [outbox] Сообщение %s отклонено: %s", outbox_id, err)
+                    self._execute("DELETE FROM outbox WHERE id = ?", (outbox_id,))
+                    continue
+                self._retry(outbox_id, attempts, None, err)
+                continue
+            except requests.exceptions.RequestException as err:
+                # сеть недоступна — остальные сообщения пачки тоже не уйдут
+                self._retry(outbox_id, attempts, None, err)
+                break
+
+            # удаляем сразу после отправки, чтобы не продублировать при сбое
+            self._execute("DELETE FROM outbox WHERE id = ?", (outbox_id,))
+            delivered.append({
+                "chat_id": CHAT_ID,
+                "message_text": text,
+                "telegram_message_id": telegram_message_id,
+                "sent_at": datetime.utcnow(),
+            })
+
+        if delivered:
+            self._record(delivered)
+        return len(delivered)
+
+    def _retry(self, outbox_id: int, attempts: int, delay: Optional[float], err: Exception) -> None:
+        attempts += 1
+        if attempts >= MAX_ATTEMPTS:
+            logger.error("❌ [outbox] Сообщение %s не доставлено за %s попыток: %s", outbox_id, attempts, err)
+            self._execute("DELETE FROM outbox WHERE id = ?", (outbox_id,))
+            return
+        if delay is None:
+            delay = min(2 ** attempts, MAX_BACKOFF_SEC)
+        logger.warning("[outbox] Сообщение %s: попытка %s неудачна (%s), повтор через %.0f с",
+                       outbox_id, attempts, err, delay)
+        self._execute(
+            "UPDATE outbox SET attempts = ?, next_try = ? WHERE id = ?",
+            (attempts, time.time() + delay, outbox_id),
+        )
+
+    def _record(self, rows: list[dict]) -> None:
+        """Журнал отправленных сообщений в БД — одной транзакцией на пачку."""
+        db = SessionLocal()
+        try:
+            crud.bulk_create_telegram_messages(db, rows)
+        except Exception as err:
+            db.rollback()
+            logger.error("❌ [outbox] Не удалось записать %s сообщений в БД: %s", len(rows), err)
+        finally:
+            db.close()
+
+
+# общая очередь процесса (SQLite открывается при первом сообщении)
+outbox = TelegramOutbox()
+
+
+def notify(message: str) -> None:
+    """Асинхронная отправка сообщения в Telegram через outbox."""
+    outbox.enqueue(message)
@@ -1,11 +1,12 @@
 # territory_analysis.py
 
 import logging
-from math import radians, sin, cos, sqrt, atan2
 from sqlalchemy.orm import Session
 from datetime import datetime
 from app.db import SessionLocal
-from app.models import GeoZone, Task
+from app.models import GeoZone
+from app.crud import get_tasks_in_radius
+from app.geodesy import distances_to_point, points_to_arrays
 
 # ——— Logging —————————————————————————————————————————————————
 logging.basicConfig(
@@ -15,15 +16,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ——— Haversine для метрик расстояний —————————————————————————
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371000.0
-    φ1, φ2 = radians(lat1), radians(lat2)
-    dφ = radians(lat2 - lat1)
-    dλ = radians(lon2 - lon1)
-    a = sin(dφ/2)**2 + cos(φ1)*cos(φ2)*sin(dλ/2)**2
-    return R * 2 * atan2(sqrt(a), sqrt(1 - a))
-
 # ——— Основная точечная функция —————————————————————————————
 def analyze_tasks_in_zone(zone_id: int, start_dt: datetime, end_dt: datetime):
     """
@@ -41,19 +33,18 @@ def analyze_tasks_in_zone(zone_id: int, start_dt: datetime, end_dt: datetime):
 
         logger.info(f"--- Задачи внутри '{zone.name}' (territory) с {start_dt} по {end_dt}:")
 
-        # Берем все задачи (или можно отфильтровать по дате создания, если нужно)
-        tasks = db.query(Task).all()
-        found = 0
-        for t in tasks:
-            # считаем расстояние до центра зоны
-            dist = haversine(t.lat, t.lng, zone.center_lat, zone.center_lon)
-            if dist <= zone.radius_m:
-                found += 1
-                logger.info(
-                    f"Task {t.task_id}: '{t.address_raw}', "
-                    f"коорд=({t.lat:.5f},{t.lng:.5f}), dist={int(dist)}м"
-                )
-        if found == 0:
+        # Незавершённые задачи внутри зоны: bbox-префильтр в SQL, точный радиус — векторно
+        tasks = get_tasks_in_radius(
+            db, zone.center_lat, zone.center_lon, zone.radius_m,
+            exclude_statuses=("done",),
+        )
+        dists = distances_to_point(*points_to_arrays(tasks, "lat", "lng"), zone.center_lat, zone.center_lon)
+        for t, dist in zip(tasks, dists):
+            logger.info(
+                f"Task {t.task_id}: '{t.address_raw}', "
+                f"коорд=({t.lat:.5f},{t.lng:.5f}), dist={int(dist)}м"
+            )
+        if not tasks:
             logger.info("Ни одной задачи не обнаружено в пределах зоны.")
     finally:
         db.close()
@@ -0,0 +1,112 @@
+# app/track_encoding.py
+"""
+Компактные кодировки трека маяков для GET /beacon-coordinates.
+
+Точки группируются по устройствам (порядок recorded_at), у каждого
+трека — device_id, время первой точки t0 (Unix-секунды, UTC) и число
+точек. Две формы:
+
+polyline (JSON, application/vnd.track.polyline+json) — координаты в
+алгоритме Google Encoded Polyline (точность 1e-5°, ≈1 м), интервалы
+между точками в секундах — тем же алгоритмом, по одному числу:
+    {"format": "polyline", "precision": 5,
+     "tracks": [{"device_id": 1, "t0": 1760000000, "count": 3,
+                 "points": "…", "times": "…"}]}
+
+columnar (двоичный, application/vnd.track.columnar) — little-endian:
+    заголовок:  b"BTRK", uint8 версия, uint8 0, uint16 0, uint32 число треков
+    трек:       int64 device_id (-1 — без устройства), int64 t0, uint32 n,
+                float32 lat[n], float32 lon[n], int32 dt[n] (секунды от t0)
+"""
+import struct
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+POLYLINE_MEDIA_TYPE = "application/vnd.track.polyline+json"
+COLUMNAR_MEDIA_TYPE = "application/vnd.track.columnar"
+
+POLYLINE_PRECISION = 5
+COLUMNAR_MAGIC = b"BTRK"
+COLUMNAR_VERSION = 1
+
+# (device_id, latitude, longitude, recorded_at — UTC без таймзоны)
+TrackRow = tuple[Optional[int], float, float, datetime]
+
+
+def _epoch(dt: datetime) -> int:
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+def group_tracks(rows: Iterable[TrackRow]) -> list[tuple[Optional[int], np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Строки, упорядоченные по (device_id, recorded_at) →
+    [(device_id, широты, долготы, Unix-секунды), …].
+    """
+    tracks = []
+    for device_id, points in groupby(rows, key=lambda r: r[0]):
+        points = list(points)
+        tracks.append((
+            device_id,
+            np.fromiter((p[1] for p in points), dtype=np.float64, count=len(points)),
+            np.fromiter((p[2] for p in points), dtype=np.float64, count=len(points)),
+            np.fromiter((_epoch(p[3]) for p in points), dtype=np.int64, count=len(points)),
+        ))
+    return tracks
+
+
+# ——— polyline ———————————————————————————————————————————————————————
+
+def _encode_signed(values: Sequence[int]) -> str:
+    """Последовательность целых (уже разностей) в символы Encoded Polyline."""
+    out = []
+    for value in values:
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            out.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        out.append(chr(value + 63))
+    return "".join(out)
+
+
+def _deltas(values: np.ndarray) -> list[int]:
+    return np.diff(values, prepend=0).tolist()
+
+
+def encode_polyline(lats: np.ndarray, lons: np.ndarray, precision: int = POLYLINE_PRECISION) -> str:
+    """Google Encoded Polyline: пары (lat, lon), каждая — разность с предыдущей."""
+    factor = 10 ** precision
+    dlat = _deltas(np.round(lats * factor).astype(np.int64))
+    dlon = _deltas(np.round(lons * factor).astype(np.int64))
+    interleaved = [v for pair in zip(dlat, dlon) for v in pair]
+    return _encode_signed(interleaved)
+
+
+def encode_polyline_tracks(rows: Iterable[TrackRow]) -> dict:
+    tracks = []
+    for device_id, lats, lons, ts in group_tracks(rows):
+        tracks.append({
+            "device_id": device_id,
+            "t0": int(ts[0]),
+            "count": len(ts),
+            "points": encode_polyline(lats, lons),
+            # первый интервал — 0, далее разности между соседними точками
+            "times": _encode_signed(np.diff(ts, prepend=ts[0]).tolist()),
+        })
+    return {"format": "polyline", "precision": POLYLINE_PRECISION, "tracks": tracks}
+
+
+# ——— columnar ———————————————————————————————————————————————————————
+
+def encode_columnar_tracks(rows: Iterable[TrackRow]) -> bytes:
+    tracks = group_tracks(rows)
+    parts = [struct.pack("<4sBBHI", COLUMNAR_MAGIC, COLUMNAR_VERSION, 0, 0, len(tracks))]
+    for device_id, lats, lons, ts in tracks:
+        t0 = int(ts[0])
+        parts.append(struct.pack("<qqI", -1 if device_id is None else device_id, t0, len(ts)))
+        parts.append(lats.astype("<f4").tobytes())
+        parts.append(lons.astype("<f4").tobytes())
+        parts.append((ts - t0).astype("<i4").tobytes())
+    return b"".join(parts)
@@ -0,0 +1,196 @@
+# app/travel_matrix.py
+"""
+Хранилище матрицы времени в пути между узлами (travel_times).
+
+Ключ — (from_id, to_id, time_bucket). refresh_travel_times() запрашивает
+у TomTom только отсутствующие или устаревшие пары, а не всю N×N матрицу:
+при добавлении одного узла к N уходит ~2N ячеек.
+
+Недостающие пары группируются в прямоугольные блоки «источники ×
+назначения» (источники с одинаковым набором недостающих назначений
+идут одним блоком), блоки режутся под лимит ячеек запроса TomTom,
+результаты пишутся одним INSERT … ON DUPLICATE KEY UPDATE на пачку.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Sequence
+from zoneinfo import ZoneInfo
+
+import requests
+from dotenv import load_dotenv
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from app.models import Node, TravelTime
+
+load_dotenv()
+
+TOMTOM_API_KEY = os.getenv("TOMTOM_API_KEY")
+TOMTOM_MATRIX_URL = "https://api.tomtom.com/routing/matrix/2"
+
+# Лимит ячеек (origins × destinations) синхронного запроса Matrix v2
+MAX_CELLS = int(os.getenv("TOMTOM_MATRIX_MAX_CELLS", "100"))
+# Ширина слота времени суток (часы местного времени)
+BUCKET_HOURS = int(os.getenv("TRAVEL_BUCKET_HOURS", "3"))
+# Через сколько значение считается устаревшим
+MAX_AGE = timedelta(days=int(os.getenv("TRAVEL_MAX_AGE_DAYS", "30")))
+# Строк на один INSERT
+WRITE_BATCH = 1000
+# travel_sec недостижимой пары: хранится с fetched_at, чтобы её не
+# перезапрашивали на каждом прогоне, а только по истечении MAX_AGE
+UNREACHABLE_SEC = -1
+
+IRKUTSK = ZoneInfo("Asia/Irkutsk")
+
+logger = logging.getLogger(__name__)
+
+http = requests.Session()
+
+
+def time_bucket(dt: Optional[datetime] = None) -> int:
+    """Номер слота суток для момента dt (по умолчанию — сейчас), 0..24/BUCKET_HOURS-1."""
+    dt = dt or datetime.now(IRKUTSK)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(IRKUTSK)
+    return dt.hour // BUCKET_HOURS
+
+
+def tomtom_matrix(origins: Sequence[tuple[float, float]],
+                  destinations: Sequence[tuple[float, float]]) -> list[list[Optional[int]]]:
+    """
+    Один синхронный запрос Matrix v2: матрица travelTimeInSeconds
+    размера len(origins) × len(destinations); недостижимые ячейки — None.
+    """
+    body = {
+        "origins":      [{"point": {"latitude": lat, "longitude": lon}} for lat, lon in origins],
+        "destinations": [{"point": {"latitude": lat, "longitude": lon}} for lat, lon in destinations],
+        "options": {
+            "departAt":   "now",
+            "routeType":  "fastest",
+            "traffic":    "live",
+            "travelMode": "car"
+        }
+    }
+    resp = http.post(
+        TOMTOM_MATRIX_URL,
+        params={"key": TOMTOM_API_KEY},
+        json=body,
+        headers={"Content-Type": "application/json"},
+        timeout=(10, 20)
+    )
+    resp.raise_for_status()
+    matrix: list[list[Optional[int]]] = [[None] * len(destinations) for _ in origins]
+    for item in resp.json().get("data", []):
+        summary = item.get("routeSummary") or {}
+        matrix[item["originIndex"]][item["destinationIndex"]] = summary.get("travelTimeInSeconds")
+    return matrix
+
+
+def plan_blocks(missing: dict[int, set[int]], max_cells: int = MAX_CELLS) -> list[tuple[list[int], list[int]]]:
+    """
+    Разбивает недостающие пары {from_id: {to_id, …}} на запросы
+    (origins, destinations) размером не больше max_cells ячеек.
+    """
+    groups: dict[frozenset, list[int]] = {}
+    for from_id in sorted(missing):
+        if missing[from_id]:
+            groups.setdefault(frozenset(missing[from_id]), []).append(from_id)
+
+    blocks = []
+    for dests, origins in groups.items():
+        dests = sorted(dests)
+        d_step = min(len(dests), max_cells)
+        o_step = max(1, max_cells // d_step)
+        for d0 in range(0, len(dests), d_step):
+            for o0 in range(0, len(origins), o_step):
+                blocks.append((origins[o0:o0 + o_step], dests[d0:d0 + d_step]))
+    return blocks
+
+
+def missing_pairs(db: Session, nodes: Sequence[Node], bucket: int,
+                  changed: Iterable[int] = (), max_age: timedelta = MAX_AGE) -> dict[int, set[int]]:
+    """Пары узлов без свежего значения в слоте bucket (и все пары изменённых узлов)."""
+    ids = [n.node_id for n in nodes]
+    changed = set(changed)
+    fresh_after = datetime.utcnow() - max_age
+    have = {
+        (from_id, to_id)
+        for from_id, to_id in db.query(TravelTime.from_id, TravelTime.to_id)
+                                .filter(TravelTime.time_bucket == bucket,
+                                        TravelTime.from_id.in_(ids),
+                                        TravelTime.to_id.in_(ids),
+                                        TravelTime.fetched_at >= fresh_after)
+    }
+    missing: dict[int, set[int]] = {}
+    for i in ids:
+        for j in ids:
+            if (i, j) not in have or i in changed or j in changed:
+                missing.setdefault(i, set()).add(j)
+    return missing
+
+
+def save_travel_times(db: Session, rows: list[dict]) -> None:
+    """Upsert строк travel_times пачками (один INSERT на WRITE_BATCH строк)."""
+    for start in range(0, len(rows), WRITE_BATCH):
+        stmt = mysql_insert(TravelTime).values(rows[start:start + WRITE_BATCH])
+        stmt = stmt.on_duplicate_key_update(
+            travel_sec=stmt.inserted.travel_sec,
+            fetched_at=stmt.inserted.fetched_at,
+        )
+        db.execute(stmt)
+    db.commit()
+
+
+def refresh_travel_times(db: Session, nodes: Sequence[Node], changed: Iterable[int] = (),
+                         bucket: Optional[int] = None, max_age: timedelta = MAX_AGE) -> int:
+    """
+    Дозапрашивает недостающие/устаревшие пары для узлов nodes в слоте bucket.
+    changed — node_id, у которых поменялись координаты (их пары пересчитываются).
+    Возвращает число запрошенных ячеек.
+    """
+    if bucket is None:
+        bucket = time_bucket()
+    located = [n for n in nodes if n.lat is not None and n.lng is not None]
+    points = {n.node_id: (n.lat, n.lng) for n in located}
+    missing = missing_pairs(db, located, bucket, changed=changed, max_age=max_age)
+
+    cells = 0
+    for origins, dests in plan_blocks(missing):
+        matrix = tomtom_matrix([points[i] for i in origins], [points[j] for j in dests])
+        now = datetime.utcnow()
+        rows = [
+            {
+                "from_id": i,
+                "to_id": j,
+                "time_bucket": bucket,
+                "travel_sec": UNREACHABLE_SEC if matrix[a][b] is None else matrix[a][b],
+                "fetched_at": now,
+            }
+            for a, i in enumerate(origins)
+            for b, j in enumerate(dests)
+        ]
+        # пишем после каждого блока: прерванный прогон не потеряет полученное
+        save_travel_times(db, rows)
+        cells += len(origins) * len(dests)
+
+    logger.info(f"travel_times: слот {bucket}, запрошено {cells} ячеек")
+    return cells
+
+
+def load_matrix(db: Session, nodes: Sequence[Node], bucket: Optional[int] = None) -> list[list[Optional[int]]]:
+    """Матрица travel_sec в порядке nodes (None — нет значения или пара недостижима)."""
+    if bucket is None:
+        bucket = time_bucket()
+    pos = {n.node_id: k for k, n in enumerate(nodes)}
+    matrix: list[list[Optional[int]]] = [[None] * len(nodes) for _ in nodes]
+    rows = (
+        db.query(TravelTime.from_id, TravelTime.to_id, TravelTime.travel_sec)
+          .filter(TravelTime.time_bucket == bucket,
+                  TravelTime.from_id.in_(pos),
+                  TravelTime.to_id.in_(pos))
+    )
+    for from_id, to_id, travel_sec in rows:
+        if travel_sec != UNREACHABLE_SEC:
+            matrix[pos[from_id]][pos[to_id]] = travel_sec
+    return matrix
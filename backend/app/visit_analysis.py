@@ -1,16 +1,20 @@
 #app.visit_analysis.py
 import logging
 import sys
-from math import radians, sin, cos, sqrt, atan2
 from datetime import timedelta, datetime, timezone
 from zoneinfo import ZoneInfo
 from sqlalchemy.orm import Session
-from app.db import engine, Base, SessionLocal
+from app.db import SessionLocal
 import app.models as models
 import requests
 from dotenv import load_dotenv
 import os
-from app.telegram_bot import send_to_telegram
+from app.telegram_outbox import notify
+from app.geodesy import distance_matrix, points_to_arrays
+from app.stop_detector import collect_stops
+from app.spatial_index import task_index
+from app.dwell import longest_dwell_runs
+from app.geocode_cache import geocode_cache, reverse_key
 
 # ——— Конфигурация и инициализация ——————————————————————————————————————————————————
 
@@ -26,9 +30,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Создаём таблицы (если ещё не созданы)
-Base.metadata.create_all(bind=engine)
-
 # Часовые пояса
 UTC = timezone.utc
 IRKUTSK = ZoneInfo('Asia/Irkutsk')
@@ -45,21 +46,17 @@ def format_dt_to_irkutsk(dt: datetime) -> str:
 
 # ——— Утилитарные функции ——————————————————————————————————————————————————————
 
-def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Расстояние между двумя точками (метры), формула Haversine."""
-    R = 6371000
-    φ1, φ2 = radians(lat1), radians(lat2)
-    Δφ = radians(lat2 - lat1)
-    Δλ = radians(lon2 - lon1)
-    a = sin(Δφ/2)**2 + cos(φ1) * cos(φ2) * sin(Δλ/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
-
 def get_address_from_coordinates(lat: float, lon: float, lang: str = "ru_RU") -> str:
     """
     Обратное геокодирование с учётом ближайшего дома.
     Возвращает полную строку адреса (из поля text).
+    Адреса кэшируются по ячейке ~25 м (app.geocode_cache).
     """
+    key = f"{reverse_key(lat, lon)}:{lang}"
+    cached = geocode_cache.get(key)
+    if cached is not None:
+        return cached
+
     params = {
         'apikey': YANDEX_API_KEY,
         'geocode': f"{lon},{lat}",
@@ -80,11 +77,85 @@ def get_address_from_coordinates(lat: float, lon: float, lang: str = "ru_RU") ->
         geo_obj = resp.json()['response']['GeoObjectCollection']\
                           ['featureMember'][0]['GeoObject']
         # Полный адрес из метаданных
-        return geo_obj['metaDataProperty']['GeocoderMetaData']['text']
+        address = geo_obj['metaDataProperty']['GeocoderMetaData']['text']
     except (KeyError, IndexError, ValueError) as e:
         logger.error(f"Ошибка разбора ответа Geocoder: {e}")
         return "Адрес не найден"
 
+    geocode_cache.put(key, address)
+    return address
+
+# ——— Оценка сессии (без БД и уведомлений) ————————————————————————————————————
+
+# Стоянки в геозоне ищутся среди точек дальше этого радиуса от всех задач
+OUTSIDE_TASK_RADIUS = 200
+CLUSTER_RADIUS = 5
+MIN_POINTS = 10
+
+
+def evaluate_session(coords, tasks, rules, exit_time: datetime, threshold: float = 0.95):
+    """
+    Стоянки вне задач и лучшие визиты к задачам за одну сессию.
+
+    :param coords: точки сессии по времени (атрибуты latitude/longitude/recorded_at)
+    :param tasks:  задачи геозоны (lat/lng/planned_start/task_id)
+    :param rules:  правила geofence_rule по возрастанию radius_m
+    :return: (stops, visits); visit — словарь task_id, rule_id, attempt_start,
+             attempt_end, duration_sec, confidence, final_percent, result
+    """
+    # Матрица расстояний координаты × задачи — считаем один раз на всю сессию
+    dist = distance_matrix(
+        *points_to_arrays(coords),
+        *points_to_arrays(tasks, "lat", "lng"),
+    )
+
+    # Детекция стоянок вне задач
+    if tasks:
+        idle_mask = (dist > OUTSIDE_TASK_RADIUS).all(axis=1)
+        idle_coords = [c for c, idle in zip(coords, idle_mask) if idle]
+    else:
+        idle_coords = list(coords)
+    stops = collect_stops(idle_coords, radius_m=CLUSTER_RADIUS, min_points=MIN_POINTS)
+
+    visits = []
+    if not tasks or not rules:
+        return stops, visits
+    max_conf = max(r.confidence for r in rules)
+
+    # Самые длинные серии точек в радиусе каждого правила — массивами
+    best_runs, best_starts = longest_dwell_runs(dist, [r.radius_m for r in rules])
+
+    for j, task in enumerate(tasks):
+        best_score, best_rule, best_start, best_run = 0, None, None, 0
+        for k, rule in enumerate(rules):
+            run = int(best_runs[k, j])
+            if not run:
+                continue
+            dwell_ratio = min(run / rule.dwell_minutes, 1.0)
+            base_score = dwell_ratio * rule.confidence
+            time_factor = 1.2 if task.planned_start <= exit_time else 0.8
+            score = base_score * time_factor
+            if score > best_score:
+                best_score, best_rule, best_run = score, rule, run
+                best_start = coords[best_starts[k, j]].recorded_at
+
+        if not best_rule:
+            continue
+
+        final_percent = min(best_score / max_conf * 100, 100.0)
+        visits.append({
+            'task_id': task.task_id,
+            'rule_id': best_rule.rule_id,
+            'attempt_start': best_start,
+            'attempt_end': best_start + timedelta(minutes=best_run - 1),
+            'duration_sec': best_run * 60,
+            'confidence': best_rule.confidence,
+            'final_percent': final_percent,
+            'result': 'confirmed' if final_percent >= threshold*100 else 'false',
+        })
+    return stops, visits
+
+
 # ——— Основная логика анализа сессии —————————————————————————————————————————————
 
 def analyze_session(db: Session, session_id: int, threshold: float = 0.95):
@@ -101,21 +172,22 @@ def analyze_session(db: Session, session_id: int, threshold: float = 0.95):
         return
     logger.info(f"Session {session_id}: геозона '{zone.name}', центр=({zone.center_lat:.6f},{zone.center_lon:.6f}), радиус={zone.radius_m}м")
 
-    # Фильтрация задач по зоне
-    all_tasks = (
+    # Фильтрация задач по зоне: кандидаты из пространственного индекса,
+    # статус и актуальные поля — из БД только по этим id
+    task_index.refresh(db)
+    in_zone_ids = task_index.query(zone.center_lat, zone.center_lon, zone.radius_m)
+    tasks = (
         db.query(models.Task)
-        .filter(models.Task.status != 'done')
+        .filter(models.Task.task_id.in_(in_zone_ids), models.Task.status != 'done')
+        .order_by(models.Task.task_id)
         .all()
-    )
-    tasks = [
-        t for t in all_tasks
-        if distance(t.lat, t.lng, zone.center_lat, zone.center_lon) <= zone.radius_m
-    ]
-    logger.info(f"  Задач в геозоне: {len(tasks)}/{len(all_tasks)}")
+    ) if in_zone_ids else []
+    logger.info(f"  Задач в геозоне: {len(tasks)} (индекс задач: {len(task_index)})")
 
     # Загружаем координаты сессии (UTC!)
     coords = db.query(models.BeaconCoordinate)\
                .filter(
+                   models.BeaconCoordinate.device_id == sess.device_id,
                    models.BeaconCoordinate.recorded_at >= sess.entry_time,
                    models.BeaconCoordinate.recorded_at <= sess.exit_time
                )\
@@ -123,56 +195,14 @@ def analyze_session(db: Session, session_id: int, threshold: float = 0.95):
                .all()
     logger.info(f"  Координат за сессию: {len(coords)}")
 
-    # Детекция стоянок вне задач
-    OUTSIDE_TASK_RADIUS = 200
-    CLUSTER_RADIUS = 5
-    MIN_POINTS = 10
-
-    idle_coords = [
-        c for c in coords
-        if not tasks or all(
-            distance(c.latitude, c.longitude, t.lat, t.lng) > OUTSIDE_TASK_RADIUS
-            for t in tasks
-        )
-    ]
-
-    stops = []
-    current = {'coords': [], 'start': None}
-
-    for coord in idle_coords:
-        t = coord.recorded_at
-        if not current['coords']:
-            current['coords'], current['start'] = [coord], t
+    rules = []
+    if tasks:
+        rules = db.query(models.GeofenceRule).order_by(models.GeofenceRule.radius_m).all()
+        if not rules:
+            logger.error("Нет правил geofence_rule")
         else:
-            first = current['coords'][0]
-            if distance(coord.latitude, coord.longitude, first.latitude, first.longitude) <= CLUSTER_RADIUS:
-                current['coords'].append(coord)
-            else:
-                if len(current['coords']) >= MIN_POINTS:
-                    end = current['coords'][-1].recorded_at
-                    duration = (end - current['start']).total_seconds() / 60
-                    lat_c = sum(c.latitude for c in current['coords']) / len(current['coords'])
-                    lon_c = sum(c.longitude for c in current['coords']) / len(current['coords'])
-                    stops.append({
-                        'start': current['start'],
-                        'end': end,
-                        'duration': duration,
-                        'center': (lat_c, lon_c)
-                    })
-                current = {'coords': [coord], 'start': t}
-
-    # Последняя серия
-    if current['coords'] and len(current['coords']) >= MIN_POINTS:
-        end = current['coords'][-1].recorded_at
-        duration = (end - current['start']).total_seconds() / 60
-        lat_c = sum(c.latitude for c in current['coords']) / len(current['coords'])
-        lon_c = sum(c.longitude for c in current['coords']) / len(current['coords'])
-        stops.append({
-            'start': current['start'],
-            'end': end,
-            'duration': duration,
-            'center': (lat_c, lon_c)
-        })
+            logger.info(f"  Правил загружено: {len(rules)}")
+    stops, visits = evaluate_session(coords, tasks, rules, sess.exit_time, threshold)
 
     # Отправка стоянок
     if stops:
@@ -194,103 +224,46 @@ def analyze_session(db: Session, session_id: int, threshold: float = 0.95):
                 f"• Координаты: ({lat_c:.6f}, {lon_c:.6f})\n"
                 f"• Адрес: `{address}`"
             )
-            send_to_telegram(message)
+            notify(message)
     else:
         logger.info("Стоянки в геозоне не обнаружены.")
 
-    # Если есть задачи — анализ визитов
-    if tasks:
-        rules = db.query(models.GeofenceRule).order_by(models.GeofenceRule.radius_m).all()
-        if not rules:
-            logger.error("Нет правил geofence_rule")
-            return
-        max_conf = max(r.confidence for r in rules)
-        logger.info(f"  Правил загружено: {len(rules)}")
-
-        # Инициализация state...
-        state = {
-            t.task_id: {
-                r.rule_id: {'current_run': 0, 'run_start': None, 'best_run': 0, 'best_start': None}
-                for r in rules
-            }
-            for t in tasks
-        }
-
-        # Проходим по всем координатам и обновляем state...
-        for coord in coords:
-            t = coord.recorded_at
-            for task in tasks:
-                d_task = distance(coord.latitude, coord.longitude, task.lat, task.lng)
-                for rule in rules:
-                    st = state[task.task_id][rule.rule_id]
-                    if d_task <= rule.radius_m:
-                        if st['current_run'] == 0:
-                            st['run_start'] = t
-                        st['current_run'] += 1
-                    else:
-                        if st['current_run'] > st['best_run']:
-                            st['best_run'] = st['current_run']
-                            st['best_start'] = st['run_start']
-                        st['current_run'] = 0
-                        st['run_start'] = None
-                    if d_task <= rule.radius_m:
-                        break
-
-        # Финализация последних серий
-        for task in tasks:
-            for rule in rules:
-                st = state[task.task_id][rule.rule_id]
-                if st['current_run'] > st['best_run']:
-                    st['best_run'] = st['current_run']
-                    st['best_start'] = st['run_start']
-
-        # Оценка и отправка результатов
-        for task in tasks:
-            best_score, best_rule, best_start, best_run = 0, None, None, 0
-            for rule in rules:
-                st = state[task.task_id][rule.rule_id]
-                if not st['best_start']:
-                    continue
-                dwell_ratio = min(st['best_run'] / rule.dwell_minutes, 1.0)
-                base_score = dwell_ratio * rule.confidence
-                time_factor = 1.2 if task.planned_start <= sess.exit_time else 0.8
-                score = base_score * time_factor
-                if score > best_score:
-                    best_score, best_rule, best_start, best_run = score, rule, st['best_start'], st['best_run']
-
-            if not best_rule:
-                continue
+    if tasks and not rules:
+        return
 
-            final_percent = min(best_score / max_conf * 100, 100.0)
-            detected_start = best_start
-            detected_end   = best_start + timedelta(minutes=best_run - 1)
-            task.detected_start = detected_start
-            task.detected_end   = detected_end
-            task.detect_confidence = best_rule.confidence
-
-            duration_min = int((detected_end - detected_start).total_seconds() / 60)
-            msg = (
-                f"*Обнаружено посещение задачи:*\n"
-                f"• Адрес: `{task.address_raw}`\n"
-                f"• Начало: `{format_dt_to_irkutsk(detected_start)}`\n"
-                f"• Конец: `{format_dt_to_irkutsk(detected_end)}`\n"
-                f"• Длительность: `{duration_min} мин`\n"
-                f"• Вероятность: `{final_percent:.1f}%`"
-            )
-            send_to_telegram(msg)
-
-            # Сохраняем историю визита
-            hist = models.TaskVisitHistory(
-                session_id=sess.session_id,
-                task_id=task.task_id,
-                rule_id=best_rule.rule_id,
-                attempt_start=detected_start,
-                attempt_end=detected_end,
-                duration_sec=best_run * 60,
-                result='confirmed' if final_percent >= threshold*100 else 'false',
-                notes=f"final_percent={final_percent:.1f}%"
-            )
-            db.add(hist)
+    # Отправка и сохранение результатов
+    by_id = {t.task_id: t for t in tasks}
+    for visit in visits:
+        task = by_id[visit['task_id']]
+        detected_start = visit['attempt_start']
+        detected_end   = visit['attempt_end']
+        task.detected_start = detected_start
+        task.detected_end   = detected_end
+        task.detect_confidence = visit['confidence']
+
+        duration_min = int((detected_end - detected_start).total_seconds() / 60)
+        msg = (
+            f"*Обнаружено посещение задачи:*\n"
+            f"• Адрес: `{task.address_raw}`\n"
+            f"• Начало: `{format_dt_to_irkutsk(detected_start)}`\n"
+            f"• Конец: `{format_dt_to_irkutsk(detected_end)}`\n"
+            f"• Длительность: `{duration_min} мин`\n"
+            f"• Вероятность: `{visit['final_percent']:.1f}%`"
+        )
+        notify(msg)
+
+        # Сохраняем историю визита
+        hist = models.TaskVisitHistory(
+            session_id=sess.session_id,
+            task_id=task.task_id,
+            rule_id=visit['rule_id'],
+            attempt_start=detected_start,
+            attempt_end=detected_end,
+            duration_sec=visit['duration_sec'],
+            result=visit['result'],
+            notes=f"final_percent={visit['final_percent']:.1f}%"
+        )
+        db.add(hist)
 
     # Закрываем сессию
     sess.status = 'processed'
@@ -1,6 +1,5 @@
 # app/zone_processor.py
 
-import math
 import logging
 from datetime import timezone
 from zoneinfo import ZoneInfo
@@ -10,31 +9,22 @@ from app.models import BeaconCoordinate, GeoZone
 import app.crud as crud
 from app.schemas import GeozoneSessionCreate
 from app.visit_analysis import analyze_session
-from app.detect_stops import detect_stops
-from app.telegram_bot import send_to_telegram
+from app.detect_stops import new_stop_detector, report_closed_stops
+from app.telegram_outbox import notify
+from app.spatial_index import ZoneIndex
 
 logger = logging.getLogger(__name__)
 IRKUTSK = ZoneInfo('Asia/Irkutsk')
 
 
-def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    R = 6371000.0
-    φ1, φ2 = math.radians(lat1), math.radians(lat2)
-    dφ = math.radians(lat2 - lat1)
-    dλ = math.radians(lon2 - lon1)
-    a = math.sin(dφ/2)**2 + math.cos(φ1)*math.cos(φ2)*math.sin(dλ/2)**2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-
 class ZoneStateMachine:
-    def __init__(self, db: Session, initial_point: BeaconCoordinate = None):
+    def __init__(self, db: Session, initial_point: BeaconCoordinate = None, device_id: int | None = None):
         self.db = db
+        self.device_id = device_id
         # загружаем все зоны
         zones = db.query(GeoZone).all()
-        self.zone_defs = [
-            (z.zone_id, z.name, z.center_lat, z.center_lon, z.radius_m, z.type)
-            for z in zones
-        ]
+        self.zone_index = ZoneIndex.from_zones(zones)
+        self.zone_defs = self.zone_index.zone_defs
 
         # состояние
         self.state = 'travel'
@@ -45,8 +35,8 @@ class ZoneStateMachine:
         self.zone_name = None
         self.zone_entry_time = None
 
-        # буфер точек при движении
-        self.buffer: list[BeaconCoordinate] = []
+        # потоковый детектор стоянок на участке движения
+        self.stops = new_stop_detector()
 
         # если есть стартовая точка — восстанавливаем состояние
         if initial_point:
@@ -54,13 +44,10 @@ class ZoneStateMachine:
             if found:
                 self._enter_zone(found, initial_point, init=True)
             else:
-                self.buffer = [initial_point]
+                self.stops.push(initial_point)
 
     def _find_zone(self, pt: BeaconCoordinate):
-        for zid, name, cz_lat, cz_lon, cz_r, ztype in self.zone_defs:
-            if haversine(pt.latitude, pt.longitude, cz_lat, cz_lon) <= cz_r:
-                return zid, name, cz_lat, cz_lon, cz_r, ztype
-        return None
+        return self.zone_index.find_point(pt)
 
     def _enter_zone(self, found, pt: BeaconCoordinate, init=False):
         zid, zname, *_ , ztype = found
@@ -71,6 +58,7 @@ class ZoneStateMachine:
             self.db,
             GeozoneSessionCreate(
                 zone_id=zid,
+                device_id=self.device_id,
                 entry_time=t,
                 exit_time=None,
                 entry_lat=pt.latitude,
@@ -87,10 +75,10 @@ class ZoneStateMachine:
         self.zone_session_id = sess.session_id
         self.zone_type = ztype
         self.state = 'zone'
-        self.buffer.clear()
+        self.stops = new_stop_detector()
 
         # уведомление
-        send_to_telegram(
+        notify(
             f"🚗 Въезд в зону «{zname}» в {t.astimezone(IRKUTSK).strftime('%Y-%m-%d %H:%M:%S')}"
         )
 
@@ -114,7 +102,7 @@ class ZoneStateMachine:
             duration = int((t - self.zone_entry_time).total_seconds() / 60)
 
         # уведомление с названием зоны и временем
-        send_to_telegram(
+        notify(
             f"🚗 Автомобиль выехал из зоны «{self.zone_name}» в "
             f"{t.astimezone(IRKUTSK).strftime('%Y-%m-%d %H:%M:%S')}, "
             f"длительность: {duration} мин."
@@ -122,7 +110,8 @@ class ZoneStateMachine:
 
         # сбрасываем состояние в «движение»
         self.state = 'travel'
-        self.buffer = [pt]
+        self.stops = new_stop_detector()
+        self.stops.push(pt)
         self.zone_session_id = None
         self.zone_type = None
         self.zone_name = None
@@ -138,14 +127,14 @@ class ZoneStateMachine:
 
             # въезд в зону
             if self.state == 'travel' and current:
-                # сначала обрабатываем накопленные точки пути
-                detect_stops(self.buffer + [pt])
+                # сначала закрываем последний кластер пути
+                report_closed_stops(self.stops.push(pt) + self.stops.flush())
                 self._enter_zone(current, pt)
                 return
 
-            # продолжаем движение — буферизуем
+            # продолжаем движение — закрытые стоянки отправляем сразу
             if self.state == 'travel':
-                self.buffer.append(pt)
+                report_closed_stops(self.stops.push(pt))
                 return
 
             # внутри зоны без выхода — ничего не делаем
@@ -158,10 +147,11 @@ class ZoneStateMachine:
         # при завершении батча нужно тоже закрыть открытую зону или обработать оставшийся путь
         if self.state == 'zone' and self.zone_type == 'territory' and self.zone_session_id:
             last = self.db.query(BeaconCoordinate) \
+                          .filter(BeaconCoordinate.device_id == self.device_id) \
                           .order_by(BeaconCoordinate.recorded_at.desc()) \
                           .first()
             if last:
                 self._exit_zone(last)
 
-        elif self.state == 'travel' and self.buffer:
-            detect_stops(self.buffer)
+        elif self.state == 'travel':
+            report_closed_stops(self.stops.flush())
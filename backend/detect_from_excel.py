@@ -1,21 +1,13 @@
 # detect_from_excel.py
 
 from datetime import datetime, timedelta
-from math import radians, sin, cos, sqrt, atan2
 import pandas as pd
 
 from sqlalchemy.orm import Session
 from app.db import SessionLocal
 from app import crud, schemas, config, models
+from app.geodesy import haversine, distance_matrix
 
-# 1) Haversine — расстояние в метрах
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371000
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat / 2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
 
 # 2) Центроид
 def centroid(points):
@@ -33,12 +25,9 @@ def detect_parking_from_list(coords: list[dict], db_sess: Session):
     while i <= n - min_pts:
         window = coords[i:i + min_pts]
         # макс. попарное расстояние
-        max_d = 0
-        for a in window:
-            for b in window:
-                d = haversine(a['latitude'], a['longitude'], b['latitude'], b['longitude'])
-                if d > max_d:
-                    max_d = d
+        lats = [p['latitude'] for p in window]
+        lons = [p['longitude'] for p in window]
+        max_d = distance_matrix(lats, lons, lats, lons).max()
 
         if max_d <= config.PARKING_RADIUS_M:
             start = window[0]['recorded_at']
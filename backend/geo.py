@@ -1,10 +1,11 @@
 # geo.py
 import os
-import time
 import requests
 import pandas as pd
 from dotenv import load_dotenv
 
+from app.geocoder import geocode_many
+
 # 1) Подгружаем .env (только в локальной dev-среде)
 load_dotenv()
 
@@ -26,28 +27,11 @@ ADDRESSES = [
 
 # ====== 1. ГЕОКОДЕР ЯНДЕКСА ======
 def geocode_yandex(addresses):
-    url = "https://geocode-maps.yandex.ru/1.x/"
-    coords = []
-    for addr in addresses:
-        params = {
-            "apikey": YANDEX_API_KEY,
-            "format": "json",
-            "geocode": addr
-        }
-        try:
-            r = requests.get(url, params=params, timeout=(5,15))
-            r.raise_for_status()
-            m = r.json()["response"]["GeoObjectCollection"]["featureMember"]
-            if m:
-                lon, lat = map(float, m[0]["GeoObject"]["Point"]["pos"].split())
-                coords.append((lat, lon))
-            else:
-                print(f"⚠️ Не найден адрес: {addr}")
-                coords.append((None, None))
-        except Exception as e:
-            print(f"❌ Ошибка геокодирования «{addr}»: {e}")
-            coords.append((None, None))
-        time.sleep(0.2)
+    # параллельно, с кэшем и ограничением частоты (app.geocoder)
+    coords = geocode_many(addresses)
+    for addr, (lat, lon) in zip(addresses, coords):
+        if lat is None:
+            print(f"⚠️ Не найден адрес: {addr}")
     return coords
 
 # ====== 2. СИНХРОННЫЙ MATRIX v2 TOMTOM ======
@@ -2,10 +2,10 @@
 # test_zone_detection.py
 
 import logging
-from math import radians, sin, cos, asin, sqrt
 
 from app.db import SessionLocal
 from app.crud import get_latest_beacon_coordinate, get_all_geozones
+from app.geodesy import haversine
 
 # ——— Конфигурация логирования —————————————————————————
 logging.basicConfig(
@@ -15,20 +15,6 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """
-    Расстояние между двумя точками на земном шаре по формуле Хаверсин.
-    Возвращает метры.
-    """
-    R = 6371000  # радиус Земли в метрах
-    φ1, λ1, φ2, λ2 = map(radians, (lat1, lon1, lat2, lon2))
-    dφ = φ2 - φ1
-    dλ = λ2 - λ1
-    a = sin(dφ / 2)**2 + cos(φ1) * cos(φ2) * sin(dλ / 2)**2
-    c = 2 * asin(sqrt(a))
-    return R * c
-
-
 def detect_current_zone():
     db = SessionLocal()
     try:
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+
+# app.db создаёт engine при импорте (без подключения) — нужны только имена
+for name in ("DB_HOST", "DB_USER", "DB_PASSWORD", "DB_NAME"):
+    os.environ.setdefault(name, "test")
@@ -0,0 +1,108 @@
+# tests/test_beacon_writer.py
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app import beacon_writer
+from app.beacon_writer import BeaconWriteBuffer
+from app.schemas import BeaconCoordinateCreate
+
+T0 = datetime(2026, 10, 1, 1, 0)
+
+
+class FakeSession:
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Подменяет запись в БД: bad — точки (по минуте), на которых INSERT падает."""
+    state = SimpleNamespace(bad=set(), down=False, inserts=0, next_id=1)
+
+    def bulk_create(session, coords):
+        state.inserts += 1
+        if state.down or any(c.recorded_at.minute in state.bad for c in coords):
+            raise RuntimeError("insert failed")
+        saved = []
+        for c in coords:
+            saved.append(SimpleNamespace(id=state.next_id, device_id=c.device_id, recorded_at=c.recorded_at))
+            state.next_id += 1
+        return saved
+
+    monkeypatch.setattr(beacon_writer, "SessionLocal", FakeSession)
+    monkeypatch.setattr(beacon_writer, "bulk_create_beacon_coordinates", bulk_create)
+    return state
+
+
+def point(minute):
+    return BeaconCoordinateCreate(latitude=52.0, longitude=104.0,
+                                  recorded_at=T0 + timedelta(minutes=minute), device_id=7)
+
+
+def minutes(rows):
+    return [r.recorded_at.minute for r in rows]
+
+
+def make_buffer(**kw):
+    flushed = []
+    buf = BeaconWriteBuffer(on_flushed=flushed.extend, **kw)
+    buf.start = lambda: None   # без фонового потока
+    return buf, flushed
+
+
+def test_flush_writes_batch(db):
+    buf, flushed = make_buffer()
+    for m in range(3):
+        buf.add(point(m))
+    assert minutes(buf.flush()) == [0, 1, 2]
+    assert minutes(flushed) == [0, 1, 2] and len(buf) == 0
+
+
+def test_failed_batch_is_requeued(db):
+    buf, flushed = make_buffer(retries=3)
+    buf.add(point(0))
+    db.down = True
+    with pytest.raises(RuntimeError):
+        buf.flush()
+    buf.add(point(1))
+    db.down = False
+    assert minutes(buf.flush()) == [0, 1]
+    assert buf.dropped == 0
+
+
+def test_bad_row_is_dead_lettered_after_retries(db):
+    buf, flushed = make_buffer(retries=3)
+    for m in range(4):
+        buf.add(point(m))
+    db.bad = {2}
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            buf.flush()
+    assert len(buf) == 4
+    # третья неудача подряд — построчно, плохая точка отброшена
+    assert minutes(buf.flush()) == [0, 1, 3]
+    assert minutes(flushed) == [0, 1, 3]
+    assert buf.dropped == 1 and len(buf) == 0
+    # буфер не заблокирован
+    buf.add(point(5))
+    assert minutes(buf.flush()) == [5]
+
+
+def test_pending_is_capped(db):
+    buf, _ = make_buffer(max_pending=5)
+    for m in range(8):
+        buf.add(point(m))
+    assert len(buf) == 5 and buf.dropped == 3
+    db.down = True
+    with pytest.raises(RuntimeError):
+        buf.flush()
+    buf.add(point(9))
+    # возврат неудачной пачки тоже не выходит за предел
+    assert len(buf) == 5
+    db.down = False
+    assert minutes(buf.flush()) == [4, 5, 6, 7, 9]
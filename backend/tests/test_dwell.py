@@ -0,0 +1,63 @@
+# tests/test_dwell.py
+import numpy as np
+import pytest
+
+from app.dwell import longest_dwell_runs
+
+
+def reference_runs(dist, radii):
+    """Прежний цикл visit_analysis: координаты × задачи × правила с break."""
+    n_coords, n_tasks = dist.shape
+    best_run = np.zeros((len(radii), n_tasks), dtype=np.int64)
+    best_start = np.full((len(radii), n_tasks), -1, dtype=np.int64)
+    current = np.zeros((len(radii), n_tasks), dtype=np.int64)
+    run_start = np.full((len(radii), n_tasks), -1, dtype=np.int64)
+
+    def finish(k, j):
+        if current[k, j] > best_run[k, j]:
+            best_run[k, j] = current[k, j]
+            best_start[k, j] = run_start[k, j]
+
+    for i in range(n_coords):
+        for j in range(n_tasks):
+            for k, radius in enumerate(radii):
+                if dist[i, j] <= radius:
+                    if current[k, j] == 0:
+                        run_start[k, j] = i
+                    current[k, j] += 1
+                    break
+                finish(k, j)
+                current[k, j] = 0
+    for k in range(len(radii)):
+        for j in range(n_tasks):
+            finish(k, j)
+    return best_run, best_start
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_matches_reference_loop(seed):
+    rng = np.random.default_rng(seed)
+    n_coords = int(rng.integers(0, 60))
+    n_tasks = int(rng.integers(0, 5))
+    # дискретные расстояния — чтобы чаще попадать ровно на границу радиуса
+    dist = rng.choice([0, 10, 20, 30, 50, 80, 120, 300], size=(n_coords, n_tasks)).astype(float)
+    radii = sorted(rng.choice([10, 20, 30, 50, 100], size=int(rng.integers(1, 4))).tolist())
+
+    run, start = longest_dwell_runs(dist, radii)
+    ref_run, ref_start = reference_runs(dist, radii)
+    np.testing.assert_array_equal(run, ref_run)
+    np.testing.assert_array_equal(start, ref_start)
+
+
+def test_earliest_of_equal_runs():
+    dist = np.array([[0], [500], [0], [500]], dtype=float)
+    run, start = longest_dwell_runs(dist, [50])
+    assert run[0, 0] == 1 and start[0, 0] == 0
+
+
+def test_larger_rule_skips_without_reset():
+    # точки 0 и 2 — в радиусе 100, точка 1 — в радиусе 10: серия 100 не рвётся
+    dist = np.array([[50], [5], [50]], dtype=float)
+    run, start = longest_dwell_runs(dist, [10, 100])
+    assert run[1, 0] == 2 and start[1, 0] == 0
+    assert run[0, 0] == 1 and start[0, 0] == 1
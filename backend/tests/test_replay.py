@@ -0,0 +1,113 @@
+# tests/test_replay.py
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.replay import BulkWriteSink, CollectSink, ReplayEngine
+
+T0 = datetime(2026, 10, 1, 1, 0)
+DEVICE = 7
+
+
+def at(minute):
+    return T0 + timedelta(minutes=minute)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(engine)()
+    session.add_all([
+        models.GeoZone(zone_id=1, name="A", center_lat=52.0, center_lon=104.0, radius_m=300, type="territory"),
+        models.GeoZone(zone_id=2, name="B", center_lat=52.0, center_lon=104.01, radius_m=300, type="territory"),
+        models.GeofenceRule(rule_id=1, radius_m=30, dwell_minutes=5, confidence=90),
+        # задача уже выполнена — в истории её визит всё равно должен найтись
+        models.Task(
+            task_id=5, address_raw="x", lat=52.0, lng=104.0, service_minutes=10,
+            planned_start=datetime(2026, 10, 1), due_datetime=datetime(2026, 10, 2),
+            status="done", type="incident", priority="A",
+        ),
+    ])
+    # стоянка в пути, въезд в A, перескок в B, выезд
+    track = [(52.05, 104.0, i) for i in range(20)]
+    track += [(52.03 - 0.005 * (i - 20), 104.0, i) for i in range(20, 25)]
+    track += [(52.0, 104.0, i) for i in range(25, 40)]
+    track += [(52.0, 104.01, i) for i in range(40, 50)]
+    track += [(52.02, 104.02, i) for i in range(50, 55)]
+    session.add_all(
+        models.BeaconCoordinate(device_id=DEVICE, latitude=lat, longitude=lon, recorded_at=at(i))
+        for lat, lon, i in track
+    )
+    session.commit()
+    yield session
+    session.close()
+
+
+def stored(db):
+    return [
+        (s.zone_id, s.entry_time, s.exit_time, s.status)
+        for s in db.query(models.GeozoneSession).order_by(models.GeozoneSession.entry_time)
+    ]
+
+
+def replay(db, start, end):
+    ReplayEngine(db, BulkWriteSink(db)).run(start, end, [DEVICE])
+
+
+def test_collect_finds_visit_of_done_task(db):
+    sink = CollectSink()
+    ReplayEngine(db, sink).run(at(0), at(60), [DEVICE])
+    assert [(r["zone_id"], r["entry_time"], r["exit_time"]) for r in sink.sessions] == [
+        (1, at(25), at(40)), (2, at(40), at(50)),
+    ]
+    assert [v["task_id"] for v in sink.sessions[0]["visits"]] == [5]
+
+
+def test_write_is_idempotent(db):
+    replay(db, at(0), at(60))
+    first = stored(db)
+    assert first == [(1, at(25), at(40), "closed"), (2, at(40), at(50), "closed")]
+    assert db.query(models.TaskVisitHistory).count() == 1
+    replay(db, at(0), at(60))
+    assert stored(db) == first
+    assert db.query(models.TaskVisitHistory).count() == 1
+
+
+@pytest.mark.parametrize("start, end", [(30, 35), (0, 30), (45, 60), (30, 45)])
+def test_partial_range_keeps_crossing_sessions_whole(db, start, end):
+    replay(db, at(0), at(60))
+    full = stored(db)
+    replay(db, at(start), at(end))
+    assert stored(db) == full
+    assert db.query(models.TaskVisitHistory).count() == 1
+
+
+def test_open_session_is_kept(db):
+    replay(db, at(0), at(60))
+    db.add(models.GeozoneSession(
+        zone_id=2, device_id=DEVICE, entry_time=at(45), entry_lat=52.0, entry_lon=104.01, status="open",
+    ))
+    db.commit()
+    replay(db, at(0), at(60))
+    sessions = stored(db)
+    # пересчёт — только до въезда открытой сессии, она сама на месте
+    assert (2, at(45), None, "open") in sessions
+    assert sum(s[0] == 1 for s in sessions) == 1
+    assert all(s[2] is None or s[2] <= at(45) for s in sessions)
+
+
+def test_failed_run_keeps_old_sessions(db, monkeypatch):
+    replay(db, at(0), at(60))
+    before = stored(db)
+
+    def boom(self, rec):
+        raise RuntimeError("запись не удалась")
+
+    monkeypatch.setattr(BulkWriteSink, "session", boom)
+    with pytest.raises(RuntimeError):
+        replay(db, at(0), at(60))
+    assert stored(db) == before
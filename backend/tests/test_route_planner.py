@@ -0,0 +1,194 @@
+# tests/test_route_planner.py
+import sys
+from datetime import datetime, timedelta
+from itertools import permutations
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.route_planner import RoutePlanner, Stop, plan_nodes, plan_tasks
+
+T0 = datetime(2026, 10, 1, 8, 0)
+
+
+def line_matrix(xs):
+    """Точки на прямой: время в пути = |xa - xb|."""
+    xs = np.asarray(xs, dtype=np.float64)
+    return np.abs(xs[:, None] - xs[None, :])
+
+
+def brute_best(planner, n):
+    return min(planner.cost(list(p)) for p in permutations(range(1, n + 1)))
+
+
+def test_matrix_size_checked():
+    with pytest.raises(ValueError):
+        RoutePlanner(np.zeros((3, 3)), [Stop(1, 0)])
+    with pytest.raises(ValueError):
+        RoutePlanner(np.zeros((2, 2)), [Stop(1, 0)], finish=True)
+
+
+def test_empty():
+    assert RoutePlanner(np.zeros((1, 1)), []).solve() == []
+
+
+def test_line_visited_in_order():
+    planner = RoutePlanner(line_matrix([0, 30, 10, 20]), [Stop(k, 0) for k in (1, 2, 3)])
+    assert [v.key for v in planner.solve()] == [2, 3, 1]
+
+
+def test_matches_brute_force_on_small_instances():
+    rng = np.random.default_rng(3)
+    for _ in range(20):
+        n = 6
+        pts = rng.uniform(0, 1000, size=(n + 1, 2))
+        travel = np.linalg.norm(pts[:, None] - pts[None, :], axis=2)
+        stops = [Stop(k, 60) for k in range(1, n + 1)]
+        planner = RoutePlanner(travel, stops)
+        route = planner.improve(planner.construct())
+        assert sorted(route) == list(range(1, n + 1))
+        # эвристика — не хуже оптимума больше чем на 10 %
+        assert planner.cost(route) <= brute_best(planner, n) * 1.1 + 1e-9
+
+
+def test_deadline_reorders_route():
+    # точки по разные стороны от старта; у дальней 2 дедлайн — сначала едем к ней
+    stops = [Stop(1, 0), Stop(2, 0, latest=100)]
+    visits = RoutePlanner(line_matrix([0, -40, 100]), stops).solve()
+    assert [v.key for v in visits] == [2, 1]
+    assert visits[0].late_sec == 0
+
+
+def test_schedule_waits_for_earliest():
+    planner = RoutePlanner(line_matrix([0, 10]), [Stop(1, 30, earliest=100)])
+    (v,) = planner.schedule([1])
+    assert (v.arrival, v.start, v.departure, v.travel_sec, v.late_sec) == (10, 100, 130, 10, 0)
+
+
+def test_late_weighted():
+    stops = [Stop(1, 0, latest=5, weight=3.0)]
+    planner = RoutePlanner(line_matrix([0, 10]), stops)
+    assert planner.schedule([1])[0].late_sec == 5
+    assert planner.cost([1]) == 10 + 10.0 * 5 * 3.0
+
+
+def test_finish_leg_counted():
+    # финиш за точкой 2 — она последняя, переезд до финиша входит в стоимость
+    travel = line_matrix([0, 10, 20, 25])
+    planner = RoutePlanner(travel, [Stop(1, 0), Stop(2, 0)], finish=True)
+    assert planner.cost([1, 2]) == 10 + 10 + 5
+    assert planner.finish_leg([1, 2]) == 5
+    assert [v.key for v in planner.solve()] == [1, 2]
+
+
+def task(task_id, lat, lng, **kw):
+    fields = dict(
+        task_id=task_id, address_raw=f"addr {task_id}", lat=lat, lng=lng,
+        service_minutes=10, movable=True, planned_start=None,
+        due_datetime=None, priority="C",
+    )
+    fields.update(kw)
+    return SimpleNamespace(**fields)
+
+
+def test_plan_tasks():
+    tasks = [task(1, 52.02, 104.0), task(2, 52.01, 104.0)]
+    stops = plan_tasks(tasks, (52.0, 104.0), T0)
+    assert [s["task_id"] for s in stops] == [2, 1]
+    first, second = stops
+    assert first["arrival"] > T0
+    assert first["departure"] - first["start"] == timedelta(minutes=10)
+    gap = second["arrival"] - first["departure"] - timedelta(seconds=second["travel_sec"])
+    assert abs(gap) < timedelta(seconds=1)
+    assert all(s["late_sec"] == 0 for s in stops)
+    assert plan_tasks([], (52.0, 104.0), T0) == []
+
+
+def test_plan_tasks_fixed_start():
+    tasks = [task(1, 52.01, 104.0, movable=False, planned_start=T0 + timedelta(hours=2))]
+    (s,) = plan_tasks(tasks, (52.0, 104.0), T0)
+    assert s["start"] == T0 + timedelta(hours=2)
+
+
+def node(node_id, lat, lng=104.0, **kw):
+    fields = dict(
+        node_id=node_id, address=f"node {node_id}", lat=lat, lng=lng,
+        service_sec=300, planned_at=T0, movable=True, completed=False,
+        is_start=False, is_end=False,
+    )
+    fields.update(kw)
+    return SimpleNamespace(**fields)
+
+
+@pytest.fixture
+def fake_matrix(monkeypatch):
+    """Подменяет app.travel_matrix: load_matrix отдаёт заданные ячейки, остальное — None."""
+    cells = {}
+
+    def load_matrix(db, nodes, bucket=None):
+        return [[cells.get((a.node_id, b.node_id)) for b in nodes] for a in nodes]
+
+    monkeypatch.setitem(sys.modules, "app.travel_matrix", SimpleNamespace(load_matrix=load_matrix))
+    return cells
+
+
+def test_plan_nodes_uses_matrix_and_estimate(fake_matrix):
+    nodes = [node(1, 52.0, is_start=True), node(2, 52.01), node(3, 52.02)]
+    fake_matrix[(1, 3)] = 60
+    fake_matrix[(3, 2)] = 60
+    stops = plan_nodes(None, nodes, T0)
+    assert [s["node_id"] for s in stops] == [3, 2]
+    assert stops[0]["travel_sec"] == 60
+    assert stops[1]["arrival"] == T0 + timedelta(seconds=60 + 300 + 60)
+
+
+def test_plan_nodes_start_finish_completed(fake_matrix):
+    nodes = [
+        node(1, 52.03, is_end=True),
+        node(2, 52.01),
+        node(3, 52.0, is_start=True),
+        node(4, 52.02, completed=True),
+        node(5, 52.02),
+    ]
+    stops = plan_nodes(None, nodes, T0)
+    assert [s["node_id"] for s in stops] == [2, 5, 1]
+    finish = stops[-1]
+    assert finish["arrival"] == finish["departure"]
+    gap = finish["arrival"] - stops[-2]["departure"] - timedelta(seconds=finish["travel_sec"])
+    assert abs(gap) < timedelta(seconds=1)
+
+
+def test_plan_nodes_fixed_time(fake_matrix):
+    nodes = [node(1, 52.0, is_start=True), node(2, 52.01, movable=False, planned_at=T0 + timedelta(hours=1))]
+    (s,) = plan_nodes(None, nodes, T0)
+    assert s["start"] == T0 + timedelta(hours=1)
+    assert s["late_sec"] == 0
+    (s,) = plan_nodes(None, nodes, T0 + timedelta(hours=2))
+    assert s["late_sec"] > 0
+
+
+def test_stored_travel_matrix_matches_nodes(fake_matrix):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app import models
+    from app.route_planner import estimate_travel_matrix, stored_travel_matrix
+
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    db = sessionmaker(engine)()
+    db.add_all([
+        models.Node(node_id=10, address="a", lat=52.0, lng=104.0, service_sec=0),
+        models.Node(node_id=20, address="b", lat=52.01, lng=104.0, service_sec=0),
+    ])
+    db.commit()
+    fake_matrix[(10, 20)] = 999
+    fake_matrix[(20, 10)] = 888
+    # точка 0 ≈ узел 10 (≈10 м), точка 1 ≈ узел 20, точка 2 — вдали от узлов
+    lats, lons = [52.0001, 52.01, 52.05], [104.0, 104.0, 104.0]
+    travel = stored_travel_matrix(db, lats, lons)
+    estimate = estimate_travel_matrix(lats, lons)
+    assert travel[0, 1] == 999 and travel[1, 0] == 888
+    assert travel[0, 2] == estimate[0, 2] and travel[2, 1] == estimate[2, 1]
+    assert travel[0, 0] == 0
@@ -0,0 +1,76 @@
+# tests/test_spatial_index.py
+import random
+
+from app.geodesy import haversine
+from app.spatial_index import ZoneIndex, zone_runs
+
+
+def brute_find(zone_defs, lat, lon):
+    """Прежний линейный поиск: первая по порядку зона, содержащая точку."""
+    for zone in zone_defs:
+        if haversine(lat, lon, zone[2], zone[3]) <= zone[4]:
+            return zone
+    return None
+
+
+def random_zones(rng, n, oversize=0):
+    zones = []
+    for i in range(n):
+        radius = rng.uniform(30, 600)
+        zones.append((i, f"z{i}", 52.28 + rng.uniform(-0.05, 0.05),
+                      104.28 + rng.uniform(-0.08, 0.08), radius, "territory"))
+    for i in range(oversize):
+        # зоны намного больше ячейки — попадают в _oversize
+        zones.append((n + i, f"big{i}", 52.28, 104.28, 50_000, "city"))
+    return zones
+
+
+def test_find_matches_linear_scan():
+    rng = random.Random(1)
+    zones = random_zones(rng, 200)
+    index = ZoneIndex(zones)
+    for _ in range(5000):
+        lat = 52.28 + rng.uniform(-0.06, 0.06)
+        lon = 104.28 + rng.uniform(-0.1, 0.1)
+        assert index.find(lat, lon) == brute_find(zones, lat, lon)
+
+
+def test_first_zone_in_order_wins_with_oversize_zones():
+    rng = random.Random(2)
+    # крупная зона первой: она должна перекрывать все мелкие
+    zones = [(999, "big", 52.28, 104.28, 50_000, "city")] + random_zones(rng, 50)
+    index = ZoneIndex(zones, cell_m=200)
+    assert index._oversize == [0]
+    for _ in range(1000):
+        lat = 52.28 + rng.uniform(-0.05, 0.05)
+        lon = 104.28 + rng.uniform(-0.08, 0.08)
+        assert index.find(lat, lon) == brute_find(zones, lat, lon)
+
+
+def test_empty_index():
+    index = ZoneIndex([])
+    assert len(index) == 0
+    assert index.find(52.0, 104.0) is None
+
+
+def test_classify_matches_find():
+    rng = random.Random(3)
+    zones = random_zones(rng, 120, oversize=1)
+    index = ZoneIndex(zones)
+    lats = [52.28 + rng.uniform(-0.06, 0.06) for _ in range(3000)]
+    lons = [104.28 + rng.uniform(-0.1, 0.1) for _ in range(3000)]
+    positions = index.classify(lats, lons)
+    for lat, lon, pos in zip(lats, lons, positions):
+        found = index.find(lat, lon)
+        assert (found is None and pos == -1) or zones[pos] == found
+
+
+def test_classify_empty():
+    assert ZoneIndex(random_zones(random.Random(4), 3)).classify([], []).size == 0
+    assert list(ZoneIndex([]).classify([52.0], [104.0])) == [-1]
+
+
+def test_zone_runs():
+    assert zone_runs([]) == []
+    assert zone_runs([-1]) == [(0, 0, -1)]
+    assert zone_runs([-1, -1, 2, 2, 2, 0, -1]) == [(0, 1, -1), (2, 4, 2), (5, 5, 0), (6, 6, -1)]
@@ -0,0 +1,81 @@
+# tests/test_stop_detector.py
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.stop_detector import (
+    ANCHOR_LAST, STOP_CLOSED, STOP_DROPPED, STOP_STARTED, StopDetector, collect_stops,
+)
+
+T0 = datetime(2026, 10, 1, 9, 0)
+# ~11 м на 1e-4° широты
+STEP = 1e-4
+
+
+def pt(minute, lat=52.0, lon=104.0):
+    return SimpleNamespace(latitude=lat, longitude=lon, recorded_at=T0 + timedelta(minutes=minute))
+
+
+def track():
+    """Движение, стоянка 10 минут, движение."""
+    pts = [pt(i, lat=52.0 + i * 10 * STEP) for i in range(5)]
+    pts += [pt(5 + i, lat=52.01) for i in range(10)]
+    pts += [pt(15 + i, lat=52.01 + (i + 1) * 10 * STEP) for i in range(5)]
+    return pts
+
+
+def kinds(events):
+    return [kind for kind, _ in events]
+
+
+def test_stop_started_and_closed():
+    det = StopDetector(radius_m=20, min_points=5)
+    events = []
+    for p in track():
+        events += det.push(p)
+    events += det.flush()
+    assert kinds(events) == [STOP_STARTED, STOP_CLOSED]
+    stop = events[-1][1]
+    assert stop['start'] == T0 + timedelta(minutes=5)
+    assert stop['end'] == T0 + timedelta(minutes=14)
+    assert stop['points'] == 10 and stop['duration'] == 9
+    assert abs(stop['center'][0] - 52.01) < 1e-9
+
+
+def test_short_cluster_is_not_a_stop():
+    assert collect_stops(track(), radius_m=20, min_points=11) == []
+
+
+def test_spike_drops_stop():
+    pts = [pt(i) for i in range(6)] + [pt(6, lat=52.5)]
+    events = StopDetector(radius_m=20, min_points=5, spike_threshold=1000).feed(pts)
+    assert STOP_DROPPED in kinds(events) and STOP_CLOSED not in kinds(events)
+
+
+def test_anchor_last_follows_slow_drift():
+    # каждая точка в 11 м от предыдущей, но далеко от первой
+    pts = [pt(i, lat=52.0 + i * STEP) for i in range(10)]
+    assert collect_stops(pts, radius_m=20, min_points=5) == []
+    assert len(collect_stops(pts, radius_m=20, min_points=5, anchor=ANCHOR_LAST)) == 1
+
+
+def test_max_gap_splits_cluster():
+    pts = [pt(i) for i in range(5)] + [pt(60 + i) for i in range(5)]
+    assert len(collect_stops(pts, radius_m=20, min_points=5)) == 1
+    assert len(collect_stops(pts, radius_m=20, min_points=5, max_gap=timedelta(minutes=5))) == 2
+
+
+def test_state_roundtrip_matches_uninterrupted_stream():
+    pts = track()
+    whole = StopDetector(radius_m=20, min_points=5).feed(pts)
+
+    first = StopDetector(radius_m=20, min_points=5)
+    events = []
+    for p in pts[:9]:
+        events += first.push(p)
+    # снимок проходит через JSON, как в rt_state.json
+    state = json.loads(json.dumps(first.dump_state()))
+    second = StopDetector(radius_m=20, min_points=5)
+    second.load_state(state)
+    events += second.feed(pts[9:])
+    assert events == whole
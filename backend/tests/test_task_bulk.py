@@ -0,0 +1,163 @@
+# tests/test_task_bulk.py
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models, schemas
+
+T0 = datetime(2026, 10, 1, 9, 0)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(engine)()
+    session.add_all([
+        models.Executor(exec_id=1, surname="Иванов"),
+        models.Executor(exec_id=2, surname="Петров"),
+        models.Subscriber(contract_number="C-1", city="Иркутск", house="1",
+                          latitude=52.0, longitude=104.0, yandex_address="Иркутск, 1"),
+        # чужая задача — её id не должен попасть в ответ
+        models.Task(task_id=1, address_raw="old", lat=52.0, lng=104.0, service_minutes=10,
+                    planned_start=T0, due_datetime=T0 + timedelta(days=1), type="service", priority="B"),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def inserts(db, monkeypatch):
+    """
+    Эмулирует MySQL: lastrowid многострочного INSERT — id первой строки
+    (в sqlite — последней). Возвращает размеры INSERT-ов в tasks.
+    """
+    sizes = []
+    execute = db.execute
+
+    class FirstRowId:
+        def __init__(self, result, count):
+            self.lastrowid = result.lastrowid - count + 1
+
+    def mysql_execute(statement, params=None, **kw):
+        result = execute(statement, params, **kw)
+        if statement.is_insert and statement.table.name == models.Task.__tablename__:
+            count = len(statement._multi_values[0])
+            sizes.append(count)
+            return FirstRowId(result, count)
+        return result
+
+    monkeypatch.setattr(db, "execute", mysql_execute)
+    return sizes
+
+
+def new_task(n, **kw):
+    fields = dict(
+        address_raw=f"addr {n}", lat=52.0 + n / 1000, lng=104.0, service_minutes=10,
+        planned_start=(T0 + timedelta(minutes=n)).isoformat(),
+        due_datetime=(T0 + timedelta(days=1)).isoformat(),
+        movable=True, priority="B", type="service", executor_ids=[],
+    )
+    fields.update(kw)
+    return schemas.TaskCreate(**fields)
+
+
+def task_count(db):
+    return db.query(models.Task).count()
+
+
+def test_create_returns_tasks_in_batch_order(db, inserts):
+    tasks = crud.bulk_create_tasks(db, [
+        new_task(1, executor_ids=[2, 1, 2], contract_number="C-1"),
+        new_task(2, planned_start="2026-10-01T18:00:00+08:00"),
+    ], user_id=7)
+    assert [t.address_raw for t in tasks] == ["addr 1", "addr 2"]
+    assert 1 not in [t.task_id for t in tasks]
+    assert sorted(e.exec_id for e in tasks[0].executors) == [1, 2]
+    # время с таймзоной — в UTC без таймзоны
+    assert tasks[1].planned_start == datetime(2026, 10, 1, 10, 0)
+    assert all(t.last_modified_by == 7 for t in tasks)
+
+
+def test_create_in_batches(db, inserts):
+    n = crud.BULK_INSERT_BATCH * 2 + 3
+    tasks = crud.bulk_create_tasks(db, [new_task(i) for i in range(n)], user_id=None)
+    assert inserts == [crud.BULK_INSERT_BATCH, crud.BULK_INSERT_BATCH, 3]
+    assert [t.address_raw for t in tasks] == [f"addr {i}" for i in range(n)]
+    assert len({t.task_id for t in tasks}) == n
+    assert task_count(db) == n + 1
+
+
+def test_create_rejects_foreign_id_range(db):
+    # без эмуляции MySQL lastrowid указывает не на первую строку — диапазон чужой
+    with pytest.raises(RuntimeError):
+        crud.bulk_create_tasks(db, [new_task(1), new_task(2)], user_id=None)
+    assert task_count(db) == 1
+
+
+def test_create_reports_every_error(db, inserts):
+    with pytest.raises(crud.BulkTaskError) as exc:
+        crud.bulk_create_tasks(db, [
+            new_task(0),
+            new_task(1, executor_ids=[1, 9, 8]),
+            new_task(2, contract_number="C-404", priority="Z"),
+            new_task(3, planned_start="вчера", service_minutes=0),
+            new_task(4, lat=None),
+        ], user_id=None)
+    errors = {(e["index"], e["field"]) for e in exc.value.errors}
+    assert errors == {
+        (1, "executor_ids"),
+        (2, "contract_number"), (2, "priority"),
+        (3, "planned_start"), (3, "service_minutes"),
+        (4, "lat"),
+    }
+    assert "[8, 9]" in next(e["error"] for e in exc.value.errors if e["field"] == "executor_ids")
+    # ничего не записано
+    assert inserts == [] and task_count(db) == 1
+
+
+def test_update_only_given_fields(db, inserts):
+    first, second = crud.bulk_create_tasks(db, [new_task(1, executor_ids=[1]), new_task(2)], user_id=None)
+    tasks = crud.bulk_update_tasks(db, [
+        schemas.TaskBulkUpdate(task_id=second.task_id, status="done", executor_ids=[2]),
+        schemas.TaskBulkUpdate(task_id=first.task_id, notes="позвонить"),
+    ], user_id=3)
+    assert [t.task_id for t in tasks] == [second.task_id, first.task_id]
+    assert (tasks[0].status, tasks[0].address_raw) == ("done", "addr 2")
+    assert [e.exec_id for e in tasks[0].executors] == [2]
+    # исполнители не переданы — связи не трогаются
+    assert (tasks[1].notes, [e.exec_id for e in tasks[1].executors]) == ("позвонить", [1])
+    assert all(t.last_modified_by == 3 for t in tasks)
+
+
+def test_update_reports_every_error(db):
+    with pytest.raises(crud.BulkTaskError) as exc:
+        crud.bulk_update_tasks(db, [
+            schemas.TaskBulkUpdate(task_id=1, notes="ok"),
+            schemas.TaskBulkUpdate(task_id=404),
+            schemas.TaskBulkUpdate(task_id=1, executor_ids=[5]),
+            schemas.TaskBulkUpdate(task_id=1, address_raw=None),
+        ], user_id=None)
+    assert [(e["index"], e["field"]) for e in exc.value.errors] == [
+        (1, "task_id"),
+        (2, "task_id"),
+        (3, "task_id"), (3, "address_raw"),
+        (2, "executor_ids"),
+    ]
+    db.expire_all()
+    assert db.get(models.Task, 1).notes is None
+
+
+def test_bulk_size_limit():
+    pytest.importorskip("fastapi")
+    from fastapi import HTTPException
+
+    from app.main import TASKS_BULK_MAX, _check_bulk_size
+
+    _check_bulk_size([None] * TASKS_BULK_MAX)
+    with pytest.raises(HTTPException) as exc:
+        _check_bulk_size([None] * (TASKS_BULK_MAX + 1))
+    assert exc.value.status_code == 413
@@ -0,0 +1,126 @@
+# tests/test_task_changes.py
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models, schemas
+
+T0 = datetime(2026, 10, 1, 9, 0)
+LAG = crud.CHANGES_SAFETY_LAG
+
+
+class Clock(datetime):
+    """datetime для app.crud с управляемым utcnow"""
+    current = T0
+
+    @classmethod
+    def utcnow(cls):
+        return cls.current
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    Clock.current = T0
+    monkeypatch.setattr(crud, "datetime", Clock)
+
+    def move_to(at):
+        Clock.current = at
+    return move_to
+
+
+@pytest.fixture
+def db(clock):
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(engine)()
+    session.add(models.Executor(exec_id=1, surname="Иванов"))
+    for task_id in range(1, 6):
+        session.add(models.Task(
+            task_id=task_id, address_raw=f"addr {task_id}", lat=52.0, lng=104.0,
+            service_minutes=10, planned_start=T0, due_datetime=T0 + timedelta(days=1),
+            type="service", priority="B", created_at=T0 - timedelta(days=1),
+            updated_at=T0 - timedelta(minutes=task_id),
+        ))
+    session.commit()
+    yield session
+    session.close()
+
+
+def ids(tasks):
+    return [t.task_id for t in tasks]
+
+
+def set_updated(db, task_id, at):
+    db.get(models.Task, task_id).updated_at = at
+    db.commit()
+
+
+def test_first_sync_returns_everything(db):
+    tasks, deleted, since = crud.get_task_changes(db)
+    assert ids(tasks) == [1, 2, 3, 4, 5] and deleted == []
+    assert crud.decode_sync_token(since) == T0 - LAG
+
+
+def test_safety_lag_boundary(db, clock):
+    _, _, since = crud.get_task_changes(db)
+    watermark = T0 - LAG
+    # ровно на отметке — попадает в следующий ответ, раньше неё — уже отдана
+    set_updated(db, 1, watermark)
+    set_updated(db, 2, watermark - timedelta(microseconds=1))
+    clock(T0 + timedelta(minutes=1))
+    tasks, _, _ = crud.get_task_changes(db, since)
+    assert ids(tasks) == [1]
+
+
+def test_change_inside_lag_is_returned_again(db, clock):
+    # изменение за LAG до запроса: коммит мог ещё не быть виден, поэтому
+    # и следующий ответ его содержит
+    set_updated(db, 3, T0 - LAG / 2)
+    tasks, _, since = crud.get_task_changes(db)
+    assert 3 in ids(tasks)
+    clock(T0 + timedelta(seconds=1))
+    tasks, _, _ = crud.get_task_changes(db, since)
+    assert ids(tasks) == [3]
+
+
+def test_cursor_advances(db, clock):
+    _, _, since = crud.get_task_changes(db)
+    clock(T0 + timedelta(minutes=1))
+    crud.update_task(db, 2, schemas.TaskUpdate(executor_ids=[1]), user_id=None)
+    clock(T0 + timedelta(minutes=2))
+    tasks, _, since = crud.get_task_changes(db, since)
+    assert ids(tasks) == [2]
+    assert crud.decode_sync_token(since) == T0 + timedelta(minutes=2) - LAG
+    clock(T0 + timedelta(minutes=3))
+    tasks, deleted, next_since = crud.get_task_changes(db, since)
+    assert tasks == [] and deleted == []
+    assert crud.decode_sync_token(next_since) > crud.decode_sync_token(since)
+
+
+def test_token_does_not_go_back(db):
+    since = crud.encode_sync_token(T0)
+    _, _, next_since = crud.get_task_changes(db, since)
+    assert next_since == since
+
+
+def test_tombstones(db, clock):
+    crud.delete_task(db, 4)
+    clock(T0 + timedelta(minutes=1))
+    _, _, since = crud.get_task_changes(db)
+    clock(T0 + timedelta(minutes=2))
+    crud.delete_task(db, 5)
+    clock(T0 + timedelta(minutes=3))
+    tasks, deleted, _ = crud.get_task_changes(db, since)
+    # удалённая до отметки задача повторно не приходит
+    assert deleted == [5]
+    assert 5 not in ids(tasks)
+    tasks, deleted, _ = crud.get_task_changes(db, crud.encode_sync_token(T0 - LAG))
+    assert deleted == [4, 5]
+
+
+@pytest.mark.parametrize("since", ["", "???", crud._encode_token("вчера"), crud._encode_token([1])])
+def test_bad_token(db, since):
+    with pytest.raises(ValueError):
+        crud.get_task_changes(db, since)
@@ -0,0 +1,95 @@
+# tests/test_task_cursor.py
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models
+
+T0 = datetime(2026, 10, 1, 9, 0)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(engine)()
+    # несколько задач на одно planned_start — порядок внутри решает task_id
+    for task_id in range(1, 26):
+        session.add(models.Task(
+            task_id=task_id, address_raw=f"addr {task_id}", lat=52.0, lng=104.0,
+            service_minutes=10, planned_start=T0 + timedelta(hours=task_id % 7),
+            due_datetime=T0 + timedelta(days=1), status="done" if task_id % 5 == 0 else "scheduled",
+            type="service", priority="B",
+        ))
+    session.commit()
+    yield session
+    session.close()
+
+
+def keys(tasks):
+    return [(t.planned_start, t.task_id) for t in tasks]
+
+
+def all_pages(db, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        tasks, cursor = crud.get_tasks(db, cursor=cursor, limit=limit, **filters)
+        pages.append(tasks)
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    task = models.Task(task_id=42, planned_start=T0)
+    assert crud.decode_task_cursor(crud.encode_task_cursor(task)) == (T0, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "???", "bm90IGpzb24", crud._encode_token([1]), crud._encode_token("x")])
+def test_bad_cursor(cursor):
+    with pytest.raises(ValueError):
+        crud.decode_task_cursor(cursor)
+
+
+def test_without_limit_returns_everything(db):
+    tasks, cursor = crud.get_tasks(db)
+    assert cursor is None
+    assert keys(tasks) == sorted(keys(tasks))
+    assert len(tasks) == 25
+
+
+@pytest.mark.parametrize("limit", [1, 4, 7, 25, 100])
+def test_pages_cover_ordered_list(db, limit):
+    everything, _ = crud.get_tasks(db)
+    pages = all_pages(db, limit)
+    assert all(len(p) <= limit for p in pages)
+    assert keys(t for p in pages for t in p) == keys(everything)
+
+
+def test_last_full_page_has_no_cursor(db):
+    tasks, cursor = crud.get_tasks(db, limit=25)
+    assert len(tasks) == 25 and cursor is None
+
+
+def test_pages_with_filters(db):
+    filters = dict(statuses=["scheduled"], date_from=T0 + timedelta(hours=1), date_to=T0 + timedelta(hours=5))
+    everything, _ = crud.get_tasks(db, **filters)
+    assert everything and all(t.status == "scheduled" for t in everything)
+    assert all(T0 + timedelta(hours=1) <= t.planned_start < T0 + timedelta(hours=5) for t in everything)
+    pages = all_pages(db, 3, **filters)
+    assert keys(t for p in pages for t in p) == keys(everything)
+
+
+def test_cursor_survives_insert_before_it(db):
+    first, cursor = crud.get_tasks(db, limit=5)
+    # новая задача раньше курсора не сдвигает следующую страницу
+    db.add(models.Task(
+        task_id=100, address_raw="new", lat=52.0, lng=104.0, service_minutes=10,
+        planned_start=T0 - timedelta(hours=1), due_datetime=T0, status="scheduled",
+        type="service", priority="B",
+    ))
+    db.commit()
+    second, _ = crud.get_tasks(db, cursor=cursor, limit=5)
+    everything, _ = crud.get_tasks(db)
+    assert keys(second) == keys(everything[6:11])
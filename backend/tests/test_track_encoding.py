@@ -0,0 +1,99 @@
+# tests/test_track_encoding.py
+import struct
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from app.track_encoding import (
+    COLUMNAR_MAGIC, COLUMNAR_VERSION, POLYLINE_PRECISION,
+    encode_columnar_tracks, encode_polyline, encode_polyline_tracks, group_tracks,
+)
+
+T0 = datetime(2026, 10, 1, 1, 0)
+
+
+def decode_signed(encoded):
+    """Обратное к _encode_signed: символы Encoded Polyline → целые."""
+    values, value, shift = [], 0, 0
+    for ch in encoded:
+        b = ord(ch) - 63
+        value |= (b & 0x1F) << shift
+        shift += 5
+        if b < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    return values
+
+
+def decode_columnar(data):
+    magic, version, _, _, count = struct.unpack_from("<4sBBHI", data)
+    assert (magic, version) == (COLUMNAR_MAGIC, COLUMNAR_VERSION)
+    offset = struct.calcsize("<4sBBHI")
+    tracks = []
+    for _ in range(count):
+        device_id, t0, n = struct.unpack_from("<qqI", data, offset)
+        offset += struct.calcsize("<qqI")
+        lat = np.frombuffer(data, "<f4", n, offset)
+        lon = np.frombuffer(data, "<f4", n, offset + 4 * n)
+        dt = np.frombuffer(data, "<i4", n, offset + 8 * n)
+        offset += 12 * n
+        tracks.append((device_id, t0, lat, lon, dt))
+    assert offset == len(data)
+    return tracks
+
+
+def rows():
+    track = [(7, 52.0 + i * 1e-3, 104.0 - i * 2e-3, T0 + timedelta(seconds=10 * i + i * i)) for i in range(6)]
+    legacy = [(None, 51.5, 103.5, T0 + timedelta(minutes=i)) for i in range(3)]
+    return track + legacy
+
+
+def test_google_reference_polyline():
+    lats = np.array([38.5, 40.7, 43.252])
+    lons = np.array([-120.2, -120.95, -126.453])
+    assert encode_polyline(lats, lons) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_polyline_round_trip():
+    rng = np.random.default_rng(1)
+    lats = 52.0 + rng.normal(0, 0.05, 200).cumsum() * 0.01
+    lons = 104.0 + rng.normal(0, 0.05, 200).cumsum() * 0.01
+    deltas = np.array(decode_signed(encode_polyline(lats, lons))).reshape(-1, 2)
+    decoded = deltas.cumsum(axis=0) / 10 ** POLYLINE_PRECISION
+    assert np.abs(decoded[:, 0] - lats).max() <= 0.5e-5 + 1e-12
+    assert np.abs(decoded[:, 1] - lons).max() <= 0.5e-5 + 1e-12
+
+
+def test_group_tracks():
+    tracks = group_tracks(rows())
+    assert [(device_id, len(ts)) for device_id, _, _, ts in tracks] == [(7, 6), (None, 3)]
+    assert tracks[0][3][0] == int(T0.replace(tzinfo=timezone.utc).timestamp())
+
+
+def test_polyline_tracks_times():
+    doc = encode_polyline_tracks(rows())
+    assert doc["format"] == "polyline" and doc["precision"] == POLYLINE_PRECISION
+    first, legacy = doc["tracks"]
+    assert (first["device_id"], first["count"], legacy["device_id"], legacy["count"]) == (7, 6, None, 3)
+    assert first["t0"] == int(T0.replace(tzinfo=timezone.utc).timestamp())
+    # первый интервал — 0, далее разности соседних точек
+    assert decode_signed(first["times"]) == [0] + [10 + 2 * i + 1 for i in range(5)]
+    assert decode_signed(legacy["times"]) == [0, 60, 60]
+    assert len(decode_signed(first["points"])) == 2 * first["count"]
+
+
+def test_columnar_round_trip():
+    data = encode_columnar_tracks(rows())
+    (dev, t0, lat, lon, dt), (legacy_dev, _, legacy_lat, _, legacy_dt) = decode_columnar(data)
+    expected = [r for r in rows() if r[0] == 7]
+    assert dev == 7 and legacy_dev == -1
+    assert t0 == int(T0.replace(tzinfo=timezone.utc).timestamp())
+    assert np.allclose(lat, [r[1] for r in expected], atol=1e-5)
+    assert np.allclose(lon, [r[2] for r in expected], atol=1e-5)
+    assert dt.tolist() == [int((r[3] - T0).total_seconds()) for r in expected]
+    assert legacy_lat.tolist() == [51.5] * 3 and legacy_dt.tolist() == [0, 60, 120]
+
+
+def test_empty():
+    assert encode_polyline_tracks([])["tracks"] == []
+    assert decode_columnar(encode_columnar_tracks([])) == []
@@ -0,0 +1,96 @@
+# tests/test_travel_matrix.py
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.travel_matrix import missing_pairs, plan_blocks
+
+N = 12
+BUCKET = 3
+
+
+def cells(blocks):
+    return Counter((o, d) for origins, dests in blocks for o in origins for d in dests)
+
+
+@pytest.mark.parametrize("max_cells", [1, 7, 100])
+def test_blocks_respect_limit_and_cover_pairs_once(max_cells):
+    missing = {i: set(range(30)) for i in range(25)}
+    missing[25] = {1, 2, 3}        # отдельная группа назначений
+    missing[26] = set()            # пустые строки не запрашиваются
+    blocks = plan_blocks(missing, max_cells)
+    assert all(len(o) * len(d) <= max_cells for o, d in blocks)
+    assert all(o and d for o, d in blocks)
+    want = Counter((i, j) for i, dests in missing.items() for j in dests)
+    assert cells(blocks) == want
+
+
+def test_blocks_for_new_node():
+    # новый узел N: его строка целиком + столбец N у старых узлов
+    missing = {i: {N} for i in range(N)}
+    missing[N] = set(range(N + 1))
+    blocks = plan_blocks(missing, max_cells=100)
+    assert sum(cells(blocks).values()) == 2 * N + 1
+    assert len(blocks) == 2
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(engine)()
+    session.add_all(
+        models.Node(node_id=i, address=f"n{i}", lat=52.0, lng=104.0 + i / 100, service_sec=0)
+        for i in range(N + 1)
+    )
+    now = datetime.utcnow()
+    session.add_all(
+        models.TravelTime(from_id=i, to_id=j, time_bucket=BUCKET, travel_sec=60, fetched_at=now)
+        for i in range(N) for j in range(N)
+    )
+    session.commit()
+    yield session
+    session.close()
+
+
+def nodes(db, count):
+    return db.query(models.Node).order_by(models.Node.node_id).limit(count).all()
+
+
+def size(missing):
+    return sum(len(d) for d in missing.values())
+
+
+def test_full_matrix_has_nothing_missing(db):
+    assert missing_pairs(db, nodes(db, N), BUCKET) == {}
+
+
+def test_added_node_costs_2n_plus_1_cells(db):
+    missing = missing_pairs(db, nodes(db, N + 1), BUCKET)
+    assert size(missing) == 2 * N + 1
+    assert missing[N] == set(range(N + 1))
+    assert all(missing[i] == {N} for i in range(N))
+
+
+def test_other_bucket_is_missing(db):
+    assert size(missing_pairs(db, nodes(db, N), BUCKET + 1)) == N * N
+
+
+def test_changed_node_refetches_row_and_column(db):
+    missing = missing_pairs(db, nodes(db, N), BUCKET, changed=[2])
+    assert size(missing) == 2 * N - 1
+    assert missing[2] == set(range(N))
+    assert all(missing[i] == {2} for i in range(N) if i != 2)
+
+
+def test_stale_cells_are_missing(db):
+    old = datetime.utcnow() - timedelta(days=10)
+    db.query(models.TravelTime).filter(models.TravelTime.from_id == 0).update({"fetched_at": old})
+    db.commit()
+    assert missing_pairs(db, nodes(db, N), BUCKET, max_age=timedelta(days=30)) == {}
+    missing = missing_pairs(db, nodes(db, N), BUCKET, max_age=timedelta(days=1))
+    assert missing == {0: set(range(N))}
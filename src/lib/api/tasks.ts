@@ -37,15 +37,24 @@ const BASE = process.env.NEXT_PUBLIC_API_URL!.replace(/\/+$/, "");
 
 /**
  * Получает список всех задач (Task[]).
+ * GET /tasks отдаёт задачи страницами: курсор следующей страницы приходит
+ * в заголовке X-Next-Cursor, страницы запрашиваются, пока он есть.
  */
 export async function getTasks(): Promise<Task[]> {
-  const res = await fetch(`${BASE}/tasks`, {
-    credentials: "include",
-  });
-  if (!res.ok) {
-    throw new Error(`Не удалось загрузить задачи: ${res.status} ${res.statusText}`);
-  }
-  return res.json();
+  const tasks: Task[] = [];
+  let cursor: string | null = null;
+  do {
+    const query: string = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+    const res: Response = await fetch(`${BASE}/tasks${query}`, {
+      credentials: "include",
+    });
+    if (!res.ok) {
+      throw new Error(`Не удалось загрузить задачи: ${res.status} ${res.statusText}`);
+    }
+    tasks.push(...((await res.json()) as Task[]));
+    cursor = res.headers.get("X-Next-Cursor");
+  } while (cursor);
+  return tasks;
 }
 
 /**